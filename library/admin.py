@@ -1,5 +1,6 @@
-from django.contrib import admin
-from .models import Book, StudentProfile, Transaction, SearchLog
+from django.contrib import admin, messages
+from . import loans
+from .models import Book, NoCopiesAvailable, OverdueNotice, Reservation, StudentProfile, Transaction, SearchLog
 
 # ==========================================
 # 1. تخصيص واجهة إدارة الكتب
@@ -32,25 +33,52 @@ class BookAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # النسخ المضافة للمخزون تذهب أولاً لقائمة انتظار الكتاب (كما عند الإرجاع)، لا لأول من يطلبها
+        added = obj.available_copies - form.initial.get('available_copies', obj.available_copies) if change else 0
+        if added > 0:
+            allocated = loans.allocate_waitlist({obj.pk: added})
+            if allocated:
+                self.message_user(request, f"تم تخصيص {len(allocated)} نسخة للطلاب في قائمة الانتظار.")
+
 # ==========================================
 # 2. تخصيص واجهة ملفات الطلاب
 # ==========================================
 @admin.register(StudentProfile)
 class StudentProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'student_id', 'major')
+    list_select_related = ('user',)
     search_fields = ('student_id', 'user__username', 'user__email', 'major')
     list_filter = ('major',)
 
 # ==========================================
 # 3. تخصيص واجهة عمليات الإعارة (Transactions)
 # ==========================================
+class OverdueFilter(admin.SimpleListFilter):
+    """تصفية الإعارات المتأخرة باستعلام نطاق على الفهرس (status, due_date)"""
+    title = 'التأخير'
+    parameter_name = 'overdue'
+
+    def lookups(self, request, model_admin):
+        return (('yes', 'متأخرة'),)
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.overdue()
+        return queryset
+
+
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     # الأعمدة الظاهرة (لاحظ استخدام status بدلاً من is_returned)
-    list_display = ('book', 'student', 'status', 'request_date', 'borrow_date', 'return_date', 'is_overdue')
+    list_display = ('book', 'student', 'status', 'request_date', 'borrow_date', 'return_date', 'overdue', 'fine_amount')
+
+    # جلب الكتاب والطالب ومستخدمه مع كل سطر في نفس الاستعلام (بدلاً من استعلام لكل سطر)
+    list_select_related = ('book', 'student__user')
     
     # الفلاتر الجانبية (تم تصحيح الخطأ هنا)
-    list_filter = ('status', 'request_date', 'borrow_date')
+    list_filter = ('status', OverdueFilter, 'request_date', 'borrow_date')
     
     # البحث
     search_fields = ('book__title', 'student__user__username', 'student__student_id')
@@ -61,19 +89,42 @@ class TransactionAdmin(admin.ModelAdmin):
     # الإجراءات المخصصة (Bulk Actions)
     actions = ['approve_requests', 'mark_returned', 'reject_requests']
 
+    def get_queryset(self, request):
+        # عمود التأخير يحسب في SQL (قابل للفرز) بدلاً من is_overdue لكل سطر
+        return super().get_queryset(request).with_overdue()
+
+    @admin.display(boolean=True, description='متأخر', ordering='overdue')
+    def overdue(self, obj):
+        return obj.overdue
+
+    def save_model(self, request, obj, form, change):
+        # تعديل الحالة مباشرة من القائمة قد يصادف نفاد النسخ
+        try:
+            super().save_model(request, obj, form, change)
+        except NoCopiesAvailable:
+            self.message_user(request, f"لا توجد نسخ متاحة من \"{obj.book}\"، لم تتم الموافقة.", messages.ERROR)
+
     @admin.action(description='✅ الموافقة على طلبات الاستعارة المحددة')
     def approve_requests(self, request, queryset):
         """
         إجراء جماعي لتحويل الطلبات من 'قيد الانتظار' إلى 'نشط'.
-        يقوم تلقائياً بخصم النسخ وتحديد تاريخ الإعارة عبر دالة save() في الموديل.
+        يوزع النسخ المتاحة لكل كتاب حسب أقدمية الطلب ويحدد التواريخ ويخصم المخزون بعمليات جماعية.
         """
-        updated_count = 0
-        for trans in queryset:
-            if trans.status == 'pending':
-                trans.status = 'active'
-                trans.save()
-                updated_count += 1
-        self.message_user(request, f"تمت الموافقة على {updated_count} طلب بنجاح.")
+        try:
+            approved, unavailable = loans.approve_requests(queryset)
+        except NoCopiesAvailable:
+            # عملية أخرى خصمت النسخ أثناء الموافقة؛ المعاملة تراجعت كاملة فلا يوافق على أي طلب
+            self.message_user(
+                request, "تغيّر المخزون أثناء الموافقة ولم تتم الموافقة على أي طلب، الرجاء المحاولة مرة أخرى.", messages.ERROR,
+            )
+            return
+        self.message_user(request, f"تمت الموافقة على {len(approved)} طلب بنجاح.")
+        if unavailable:
+            listed = ", ".join(f"#{trans_id}" for trans_id in unavailable[:20])
+            more = f" و{len(unavailable) - 20} غيرها" if len(unavailable) > 20 else ""
+            self.message_user(
+                request, f"تعذرت الموافقة على {len(unavailable)} طلب لعدم توفر نسخ: {listed}{more}", messages.WARNING,
+            )
 
     @admin.action(description='↩️ تسجيل إرجاع الكتب المحددة')
     def mark_returned(self, request, queryset):
@@ -81,20 +132,16 @@ class TransactionAdmin(admin.ModelAdmin):
         إجراء جماعي لتسجيل إرجاع الكتب.
         يعيد النسخ للمخزون تلقائياً.
         """
-        updated_count = 0
-        for trans in queryset:
-            if trans.status == 'active':
-                trans.status = 'returned'
-                trans.save()
-                updated_count += 1
-        self.message_user(request, f"تم تسجيل إرجاع {updated_count} كتاب.")
+        returned = loans.mark_returned(queryset)
+        self.message_user(request, f"تم تسجيل إرجاع {len(returned)} كتاب.")
 
     @admin.action(description='❌ رفض الطلبات المحددة')
     def reject_requests(self, request, queryset):
         """
         رفض طلبات الاستعارة.
+        النسخ المحجوزة لطلبات قائمة الانتظار تعود تلقائياً للطالب التالي.
         """
-        rows_updated = queryset.update(status='rejected')
+        rows_updated = loans.reject_requests(queryset)
         self.message_user(request, f"تم رفض {rows_updated} طلب.")
 
 # ==========================================
@@ -109,4 +156,31 @@ class SearchLogAdmin(admin.ModelAdmin):
     
     # عرض العمليات التي لم تجد نتائج بلون مختلف (اختياري، يظهر في التفاصيل)
     def get_queryset(self, request):
-        return super().get_queryset(request).order_by('-timestamp')
\ No newline at end of file
+        return super().get_queryset(request).order_by('-timestamp')
+
+
+# ==========================================
+# 5. تخصيص واجهة قوائم الانتظار (Reservations)
+# ==========================================
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ('book', 'student', 'priority', 'status', 'created_at', 'allocated_at')
+    list_filter = ('status',)
+    search_fields = ('book__title', 'student__user__username', 'student__student_id')
+    list_select_related = ('book', 'student__user')
+    readonly_fields = ('created_at', 'allocated_at', 'transaction')
+
+    # رفع أولوية طالب (مثل ذوي الاحتياجات أو طلبة التخرج) من القائمة مباشرة
+    list_editable = ('priority',)
+
+
+# ==========================================
+# 6. تخصيص واجهة إشعارات التأخير (Overdue Notices)
+# ==========================================
+@admin.register(OverdueNotice)
+class OverdueNoticeAdmin(admin.ModelAdmin):
+    list_display = ('transaction', 'notice_date', 'days_overdue', 'fine_amount')
+    list_filter = ('notice_date',)
+    search_fields = ('transaction__book__title', 'transaction__student__user__username')
+    list_select_related = ('transaction__book', 'transaction__student__user')
+    readonly_fields = ('transaction', 'notice_date', 'days_overdue', 'fine_amount', 'created_at')
@@ -1,8 +1,25 @@
-import pandas as pd
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from .models import Book
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.db.models import Value
+from django.db.models.functions import Replace
+from .encoder_batcher import BatchingEncoder
+from .catalog import Catalog
+from .encoders import DEFAULT_MODEL_NAME, load_encoder
+from .interests import fingerprint_vector
+from .models import Book, Transaction
+from .lexical_index import RRF_K, LexicalIndex, reciprocal_rank_fusion
+from .neighbors import fill_neighbors, rebuild_neighbors, refresh_neighbors
+from .query_cache import QueryCache, normalize_query
+from .shared_index import SharedIndex
+from .vector_index import QuantizedIndex, build_index
+from .vector_store import EmbeddingStore, normalize_rows
+
+# استعلام يشبه رقم ISBN (أرقام مع شرطات أو مسافات اختيارية)
+ISBN_QUERY = re.compile(r'^[\d\-\s]{3,}[\dXx]?$')
+
 
 class SmartLibraryAI:
     """
@@ -11,98 +28,314 @@ class SmartLibraryAI:
     النموذج: sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2
     """
 
-    def __init__(self):
-        print("Loading Optimized AI Model (MiniLM)...")
-        try:
-            # تحميل النموذج الخفيف باستخدام المسار الكامل الصحيح على Hugging Face
-            # هذا يمنع أي خطأ في التعرف على النموذج
-            self.model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
-        except Exception as e:
-            print(f"Error loading model: {e}")
-            self.model = None
+    def __init__(self, encoder=None):
+        # مخزن متجهات الكتب (يُحمّل مرة واحدة ويعاد تحميله عند تغيّر الكتب فقط)
+        self.store = EmbeddingStore(quantization=getattr(settings, 'AI_VECTOR_QUANTIZATION', None))
+        # لقطة عمودية من بيانات الكتب (معرفات، عناوين، محتوى) تستبدل عند تغيّر الفهرس
+        self.catalog = Catalog()
+        # الفهرس النصي BM25 (للبحث المطابق بالعنوان والمؤلف وISBN)
+        self.lexical = LexicalIndex()
+        # (matrix, index): فهرس البحث المبني فوق مصفوفة المتجهات الحالية (يعاد بناؤه عند تغيّرها فقط)
+        self._index = None
+        self._index_lock = threading.Lock()
+        # الفهرس المنشور كملفات مربوطة بالذاكرة ومشتركة بين العمال (publish_index)، إن فُعّل
+        shared_dir = getattr(settings, 'AI_SHARED_INDEX_DIR', None)
+        self.shared_index = SharedIndex(shared_dir, getattr(settings, 'AI_VECTOR_RERANK', 4)) if shared_dir else None
+
+        # ذاكرة مؤقتة لمتجهات الاستعلامات المتكررة، وأخرى للنتائج النهائية المرتبطة بإصدار الفهرس
+        cache_options = {
+            'max_size': getattr(settings, 'AI_QUERY_CACHE_SIZE', 2048),
+            'ttl': getattr(settings, 'AI_QUERY_CACHE_TTL', 3600),
+            'cache_alias': getattr(settings, 'AI_QUERY_CACHE_ALIAS', None),
+        }
+        self.query_cache = QueryCache(prefix='sls:query-embedding', **cache_options)
+        self.result_cache = QueryCache(prefix='sls:search-results', **cache_options)
+
+        # يمكن تمرير مشفر جاهز (مثل HashingEncoder في الاختبارات) بدلاً من تحميل النموذج
+        if encoder is not None:
+            self.model = encoder
+        else:
+            print("Loading Optimized AI Model (MiniLM)...")
+            try:
+                # تحميل النموذج الخفيف باستخدام المسار الكامل الصحيح على Hugging Face
+                # هذا يمنع أي خطأ في التعرف على النموذج
+                backend = getattr(settings, 'AI_ENCODER_BACKEND', 'sentence-transformers')
+                self.model = load_encoder(
+                    backend, DEFAULT_MODEL_NAME,
+                    max_seq_length=getattr(settings, 'AI_ENCODER_MAX_SEQ_LENGTH', None),
+                    threads=getattr(settings, 'AI_ENCODER_THREADS', None),
+                )
+            except Exception as e:
+                print(f"Error loading model: {e}")
+                self.model = None
+
+        # مشفر الاستعلامات: تجميع الاستعلامات المتزامنة في دفعات (Micro-batching) عند تفعيله
+        self.query_encoder = self.model
+        if self.model is not None and getattr(settings, 'AI_QUERY_BATCHING', False):
+            self.query_encoder = BatchingEncoder(
+                self.model,
+                max_batch_size=getattr(settings, 'AI_QUERY_BATCH_SIZE', 32),
+                max_wait=getattr(settings, 'AI_QUERY_BATCH_WAIT_MS', 5) / 1000,
+            )
 
     def _prepare_data(self):
-        """تجهيز بيانات الكتب للنظام"""
-        books = Book.objects.all()
-        if not books.exists():
-            return None, None
-        
-        data = []
-        for b in books:
-            # دمج النصوص لبناء السياق
-            content = f"{b.title} {b.description} {b.tags}"
-            data.append({
-                'id': b.id,
-                'title': b.title,
-                'content': content
-            })
-        
-        df = pd.DataFrame(data)
-        return df, df['content'].tolist()
-
-    def get_recommendations(self, book_title):
-        """نظام التوصية الذكي"""
+        """لقطة الفهرس الحالية (معرفات وعناوين ومحتوى الكتب)، مشتركة بين الطلبات للقراءة فقط"""
+        return self.catalog.load()
+
+    def sync_embeddings(self, force=False):
+        """
+        مزامنة مخزن المتجهات مع جدول الكتب.
+        يعاد تشفير الكتب الجديدة أو المعدّلة فقط (حسب بصمة المحتوى)، أو كل الكتب مع force=True.
+        """
         if self.model is None:
-            return []
+            return 0
+        return self.store.sync(self._prepare_data().rows(), self.model, force=force)
 
-        df, sentences = self._prepare_data()
-        if df is None or df.empty:
-            return []
+    def _exact_embeddings(self):
+        """
+        المتجهات الكاملة (float32) لحساب الجيران. مع الفهرس المشترك تقرأ من ملفاته المربوطة بالذاكرة،
+        ومع الضغط تقرأ مؤقتاً؛ في الحالتين لا تبقى نسخة float32 في ذاكرة العامل.
+        """
+        if self.shared_index is not None:
+            embeddings = self.shared_index.embeddings(self.store)
+            if embeddings is not None:
+                return embeddings
+        return self.store.read() if self.store.quantization else self.store.load()
+
+    def _load_embeddings(self, serving=False):
+        """
+        تحميل مصفوفة المتجهات المخزنة كما هي.
+        المخزن الفارغ يعطي فهرساً فارغاً (ويعتمد البحث على BM25 وحده) ولا يشفر الكتب داخل الطلب؛
+        البناء من مهمة build_embeddings.
+        serving=True: نسخة البحث المحفوظة في الذاكرة (مضغوطة عند تفعيل AI_VECTOR_QUANTIZATION).
+        """
+        load = self.store.load_quantized if serving and self.store.quantization else self._exact_embeddings
+        return load()
+
+    def _build_index(self, ids, matrix, previous=None):
+        if self.store.quantization:
+            # المرشحون من المتجهات المضغوطة، وإعادة الترتيب بالمتجهات الدقيقة من قاعدة البيانات
+            return QuantizedIndex(ids, matrix, self.store.exact_vectors, getattr(settings, 'AI_VECTOR_RERANK', 4))
+        backend = getattr(settings, 'AI_VECTOR_INDEX_BACKEND', 'exact')
+        options = getattr(settings, 'AI_VECTOR_INDEX_OPTIONS', {})
+        # الفهرس التقريبي يحتفظ بمراكزه المدربة ويعيد توزيع الكتب المعدلة فقط
+        return build_index(ids, matrix, backend, previous=previous, **options)
+
+    def _load_index(self):
+        """
+        فهرس المتجهات: الإصدار المنشور المشترك إن وجد (مع تغييرات قاعدة البيانات بعد نشره)،
+        وإلا فهرس خاص بالعامل (دقيق أو تقريبي حسب AI_VECTOR_INDEX_BACKEND، أو مضغوط حسب AI_VECTOR_QUANTIZATION).
+        """
+        if self.shared_index is not None:
+            index = self.shared_index.load(self.store)
+            if index is not None:
+                return index
 
+        ids, matrix = self._load_embeddings(serving=True)
+        # نحتفظ بمرجع المصفوفة التي بني منها الفهرس لمعرفة متى يجب إعادة بنائه
+        source, index = self._index or (None, None)
+        if source is not matrix:
+            # أثناء إعادة البناء في خيط آخر تكمل بقية الطلبات بالفهرس السابق بدل انتظار القفل
+            if not self._index_lock.acquire(blocking=index is None):
+                return index
+            try:
+                source, index = self._index or (None, None)
+                if source is not matrix:
+                    index = self._build_index(ids, matrix, previous=index)
+                    index.version = self.store.loaded_version
+                    self._index = (matrix, index)
+                    # النتائج المخزنة تخص الإصدار السابق من الفهرس
+                    self.result_cache.clear()
+            finally:
+                self._index_lock.release()
+        return index
+
+    def rebuild_neighbors(self):
+        """إعادة بناء جدول الكتب المتشابهة بالكامل من مخزن المتجهات"""
+        ids, matrix = self._load_embeddings()
+        rebuild_neighbors(ids, matrix, getattr(settings, 'AI_NEIGHBOR_COUNT', 10))
+
+    def refresh_neighbors(self, changed_ids, stale_ids=()):
+        """تحديث قوائم الجيران المتأثرة فقط بعد تعديل بعض الكتب أو حذفها"""
+        ids, matrix = self._exact_embeddings()
+        return refresh_neighbors(ids, matrix, changed_ids, stale_ids, getattr(settings, 'AI_NEIGHBOR_COUNT', 10))
+
+    def get_recommendations(self, book_id, limit=4):
+        """
+        نظام التوصية الذكي: أقرب الكتب من الجدول المحسوب مسبقاً (BookNeighbor)
+        باستعلام واحد مفهرس ودون أي استدعاء للنموذج.
+        """
+        similar = Book.objects.filter(neighbor_of__book_id=book_id).order_by('neighbor_of__rank')[:limit]
+        books = list(similar)
+        if books or self.model is None:
+            return books
+
+        # الكتاب لم تحسب قائمته بعد (مثلاً قبل أول build_embeddings): نحسبها مرة واحدة
         try:
-            # 1. تحويل النصوص لمتجهات
-            embeddings = self.model.encode(sentences)
-            
-            # 2. البحث عن الكتاب الحالي
-            if book_title not in df['title'].values:
-                return []
-            
-            idx = df[df['title'] == book_title].index[0]
-            target_embedding = embeddings[idx].reshape(1, -1)
-            
-            # 3. حساب التشابه
-            sim_scores = cosine_similarity(target_embedding, embeddings)[0]
-            
-            # 4. الترتيب واختيار الأفضل
-            indexed_scores = list(enumerate(sim_scores))
-            sorted_scores = sorted(indexed_scores, key=lambda x: x[1], reverse=True)
-            
-            # أفضل 4 كتب (باستثناء الكتاب نفسه)
-            top_indices = [i[0] for i in sorted_scores[1:5]]
-            
-            return df['title'].iloc[top_indices].tolist()
-            
+            ids, matrix = self._load_embeddings()
+            if fill_neighbors(ids, matrix, [book_id], getattr(settings, 'AI_NEIGHBOR_COUNT', 10)):
+                books = list(similar.all())
         except Exception as e:
             print(f"AI Error: {e}")
-            return []
+        return books
 
-    def semantic_search(self, query):
-        """البحث الدلالي (Semantic Search)"""
-        if self.model is None:
+    def recommend_for_student(self, student, limit=8):
+        """
+        توصيات شخصية من بصمة اهتمامات الطالب المخزنة: بحث واحد في فهرس المتجهات
+        دون أي تشفير، مع استبعاد الكتب التي طلبها أو استعارها من قبل.
+        """
+        vector = fingerprint_vector(student)
+        if vector is None or self.model is None:
             return []
+        try:
+            seen = set(Transaction.objects.filter(student=student).values_list('book_id', flat=True))
+            ids, _ = self._load_index().search(vector, k=limit + len(seen))
+            ranked = [book_id for book_id in map(int, ids) if book_id not in seen][:limit]
+            books = Book.objects.in_bulk(ranked)
+            return [books[book_id] for book_id in ranked if book_id in books]
+        except Exception as e:
+            print(f"AI Error: {e}")
+            return []
+
+    def encode_query(self, query):
+        """
+        متجه الاستعلام المطبّع، من الذاكرة المؤقتة إن وجد (لتجنب تمرير النموذج مجدداً).
+        النص الموحد مفتاح الذاكرة فقط، والنموذج يشفر نص الاستعلام الأصلي.
+        """
+        key = normalize_query(query)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = normalize_rows(self.query_encoder.encode([query]))[0]
+            self.query_cache.set(key, vector)
+        return vector
+
+    def cache_stats(self):
+        """عدادات الإصابة والإخفاق للذاكرتين المؤقتتين"""
+        return {'queries': self.query_cache.stats(), 'results': self.result_cache.stats()}
 
-        df, sentences = self._prepare_data()
-        if df is None or df.empty:
+    def _match_isbn(self, query, limit):
+        """مطابقة ISBN كاملة أو بادئة منه مباشرة من قاعدة البيانات (دون نموذج)"""
+        if not ISBN_QUERY.match(query.strip()):
             return []
+        code = re.sub(r'[\s\-]', '', query).upper()
+        # الأرقام المخزنة قد تحتوي شرطات (978-1612680194): المقارنة بالرقم دون شرطات من الطرفين
+        books = Book.objects.alias(isbn_code=Replace('isbn', Value('-'), Value('')))
+        matches = books.filter(isbn_code=code).values_list('id', 'title')[:1]
+        if not matches:
+            matches = books.filter(isbn_code__startswith=code).order_by('isbn').values_list('id', 'title')[:limit]
+        return [{'id': book_id, 'title': title, 'score': 1.0} for book_id, title in matches]
+
+    def semantic_search(self, query):
+        """
+        البحث الهجين (Hybrid Search): دمج نتائج BM25 النصية مع نتائج البحث الدلالي
+        بطريقة (Reciprocal Rank Fusion). أرقام ISBN تعالج مباشرة دون استدعاء النموذج.
+        """
+        top_k = getattr(settings, 'AI_SEARCH_TOP_K', 50)
 
         try:
-            # 1. تحويل نصوص الكتب
-            book_embeddings = self.model.encode(sentences)
-            
-            # 2. تحويل نص البحث
-            query_embedding = self.model.encode([query])
-            
-            # 3. حساب التشابه
-            scores = cosine_similarity(query_embedding, book_embeddings)[0]
-            
-            # 4. تصفية النتائج
-            df['score'] = scores
-            
-            # عرض النتائج التي لها صلة مقبولة (أكبر من 0.1)
-            results = df[df['score'] > 0.1].sort_values(by='score', ascending=False)
-            
-            return results[['id', 'title', 'score']].to_dict('records')
+            # 0. المطابقة المباشرة لأرقام ISBN
+            isbn_matches = self._match_isbn(query, top_k)
+            if isbn_matches:
+                return isbn_matches
+
+            # 1. تحديث الفهرس النصي وتحميل فهرس المتجهات
+            self.lexical.refresh()
+            index = self._load_index() if self.model is not None else None
+
+            # النتائج النهائية مخزنة حسب (إصدار الفهارس، نص البحث الموحد)
+            cache_key = (index.version if index is not None else None, self.lexical.version, normalize_query(query))
+            results = self.result_cache.get(cache_key)
+            if results is not None:
+                return list(results)
+
+            # 2. البحث النصي (BM25)
+            lexical_ids, _ = self.lexical.search(query, k=top_k)
+
+            # 3. البحث الدلالي: النتائج التي لها صلة مقبولة (أكبر من 0.1) مباشرة من الفهرس
+            dense_ids = []
+            if index is not None and len(index):
+                # تحويل نص البحث (التشفير الوحيد في الطلب، ويتم تخطيه للاستعلامات المتكررة)
+                query_embedding = self.encode_query(query)
+                dense_ids, _ = index.search(query_embedding, k=top_k, min_score=0.1)
+
+            # 4. الدمج، والدرجة مطبّعة بحيث يحصل الكتاب الأول في القائمتين على 1
+            rankings = [dense_ids, lexical_ids]
+            fused = reciprocal_rank_fusion(rankings)[:top_k]
+            best_possible = len(rankings) / (RRF_K + 1)
+
+            # العناوين من لقطة الفهرس بنفس الإصدار الذي حدّثه الفهرس النصي للتو (دون استعلام إضافي)
+            catalog = self.catalog.load(self.lexical.version)
+            results = []
+            for book_id, score in fused:
+                title = catalog.title(book_id)
+                if title is not None:
+                    results.append({'id': book_id, 'title': title, 'score': score / best_possible})
+            self.result_cache.set(cache_key, results)
+            return list(results)
 
         except Exception as e:
             print(f"Search Error: {e}")
-            return []
\ No newline at end of file
+            return []
+
+
+# ==========================================
+# نسخة مشتركة واحدة لكل عملية (Process-wide Singleton)
+# ==========================================
+# تحميل النموذج مكلف (ثوانٍ ومئات الميغابايتات)، لذلك نحمله مرة واحدة فقط
+# لكل عملية ونشاركه بين جميع الطلبات والخيوط (Threads).
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_ai_engine():
+    """إرجاع المحرك المشترك مع تحميله عند أول استخدام (Lazy + Thread-safe)"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            # فحص مزدوج (Double-checked locking) لمنع التحميل المتكرر
+            if _engine is None:
+                _engine = SmartLibraryAI()
+    return _engine
+
+
+def set_ai_engine(engine):
+    """
+    استبدال المحرك المشترك (مثلاً بمحرك يستخدم HashingEncoder في الاختبارات).
+    تمرير None يعيد المحرك لحالته الأولية ليُحمّل من جديد عند أول استخدام.
+    يرجع المحرك السابق لتمكين استعادته لاحقاً.
+    """
+    global _engine
+    with _engine_lock:
+        previous, _engine = _engine, engine
+    return previous
+
+
+def warm_up():
+    """تحميل المحرك مسبقاً قبل أول طلب"""
+    return get_ai_engine()
+
+
+def start_warm_up():
+    """
+    تسخين المحرك عند بدء خادم الويب (Warm-up)؛ يستدعى صراحة من نقطة دخول الخادم (wsgi.py / asgi.py)
+    وليس من LibraryConfig.ready، حتى لا تحمّل أوامر manage.py والاختبارات وعمال المهام النموذج.
+    مع AI_ENGINE_PRELOAD يتم التحميل متزامناً: مع gunicorn --preload في العملية الأم قبل التفرع (fork)
+    فتتشارك العمليات الفرعية صفحات الذاكرة (Copy-on-Write). وإلا يحمّل في خيط خلفي.
+    """
+    if not getattr(settings, 'AI_ENGINE_WARMUP', False):
+        return
+    if getattr(settings, 'AI_ENGINE_PRELOAD', False):
+        warm_up()
+    else:
+        threading.Thread(target=warm_up, name='ai-engine-warmup', daemon=True).start()
+
+
+def _reset_after_fork():
+    # إن حدث التفرع أثناء التسخين في الخلفية (gunicorn --preload دون AI_ENGINE_PRELOAD) قد يرث الابن
+    # القفل محجوزاً من خيط لم يعد موجوداً. المحرك لا يسند إلا بعد اكتمال بنائه، فيكفي قفل جديد.
+    global _engine_lock
+    _engine_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class LibraryConfig(AppConfig):
     name = 'library'
+
+    def ready(self):
+        """ربط الإشارات؛ تسخين محرك الذكاء الاصطناعي يتم من نقطة دخول الخادم (start_warm_up)"""
+        from . import signals  # noqa: F401
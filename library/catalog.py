@@ -0,0 +1,131 @@
+import sys
+import threading
+from array import array
+
+import numpy as np
+from django.db.models import Count, Max
+
+from .models import Book
+from .vector_store import book_content
+
+
+def catalog_version():
+    """
+    إصدار الفهرس: يتغير مع إضافة أي كتاب أو حذفه أو تعديل بياناته الببليوغرافية.
+    يرجع (الإصدار، آخر وقت تعديل) ويعتمد على الفهرس المنشأ على updated_at.
+    """
+    stats = Book.objects.aggregate(count=Count('pk'), last=Max('updated_at'))
+    last = stats['last']
+    return f"{stats['count']}:{last.isoformat() if last else ''}", last
+
+
+# ==========================================
+# لقطة الفهرس في الذاكرة (Columnar Catalog Snapshot)
+# ==========================================
+def _frozen(values, dtype):
+    """مصفوفة NumPy للقراءة فقط فوق مخزن array دون نسخه"""
+    result = np.frombuffer(values, dtype=dtype)
+    result.flags.writeable = False
+    return result
+
+
+class CatalogSnapshot:
+    """
+    نسخة للقراءة فقط من بيانات الكتب التي يحتاجها البحث، بتخزين عمودي مضغوط:
+    - ids: معرفات الكتب مرتبة (int64) للبحث الثنائي.
+    - title_codes: رقم العنوان لكل كتاب (int32) داخل titles (قائمة العناوين الفريدة، مدمجة بـ sys.intern).
+    - offsets + content: نصوص المحتوى (book_content) متتالية في مخزن UTF-8 واحد،
+      ومحتوى الكتاب i هو content[offsets[i]:offsets[i + 1]].
+    لا تعدل بعد إنشائها؛ الطلبات تتشاركها دون أقفال وتستبدل بلقطة جديدة عند تغيّر الفهرس.
+    """
+
+    def __init__(self, version, ids, titles, title_codes, offsets, content):
+        self.version = version
+        self.ids = ids
+        self.titles = titles
+        self.title_codes = title_codes
+        self.offsets = offsets
+        self.content = content
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            None, np.empty(0, dtype=np.int64), (), np.empty(0, dtype=np.int32),
+            np.zeros(1, dtype=np.int64), b'',
+        )
+
+    @classmethod
+    def load(cls, version=None, chunk_size=2000):
+        """قراءة الكتب على دفعات (values_list) دون إنشاء كائنات Book ولا قاموس لكل كتاب"""
+        ids, title_codes, offsets = array('q'), array('i'), array('q', [0])
+        codes, titles = {}, []
+        content = bytearray()
+        rows = Book.objects.order_by('pk').values_list('pk', 'title', 'description', 'tags')
+        for book_id, title, description, tags in rows.iterator(chunk_size=chunk_size):
+            code = codes.get(title)
+            if code is None:
+                code = codes[title] = len(titles)
+                titles.append(sys.intern(title))
+            ids.append(book_id)
+            title_codes.append(code)
+            content += book_content(title, description, tags).encode('utf-8')
+            offsets.append(len(content))
+
+        return cls(
+            version, _frozen(ids, np.int64), tuple(titles),
+            _frozen(title_codes, np.int32), _frozen(offsets, np.int64), bytes(content),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, book_id):
+        position = int(np.searchsorted(self.ids, book_id))
+        if position < len(self.ids) and self.ids[position] == book_id:
+            return position
+        return None
+
+    def title(self, book_id):
+        position = self.position(book_id)
+        return None if position is None else self.titles[self.title_codes[position]]
+
+    def content_at(self, position):
+        return self.content[self.offsets[position]:self.offsets[position + 1]].decode('utf-8')
+
+    def rows(self):
+        """أزواج (book_id, content) بترتيب المعرف، كما يحتاجها مخزن المتجهات"""
+        for position, book_id in enumerate(self.ids.tolist()):
+            yield book_id, self.content_at(position)
+
+    @property
+    def nbytes(self):
+        """الذاكرة التقريبية للقطة: المصفوفات ومخزن المحتوى والعناوين الفريدة"""
+        arrays = self.ids.nbytes + self.title_codes.nbytes + self.offsets.nbytes
+        return arrays + sys.getsizeof(self.content) + sum(sys.getsizeof(title) for title in self.titles)
+
+    @property
+    def bytes_per_book(self):
+        return self.nbytes / len(self) if len(self) else 0.0
+
+
+class Catalog:
+    """
+    يحتفظ باللقطة الحالية ويبدلها بلقطة جديدة كاملة عند تغيّر catalog_version.
+    الاستبدال إسناد مرجع واحد (Atomic Swap)، فالطلب الجاري يكمل على اللقطة التي بدأ بها.
+    """
+
+    def __init__(self, chunk_size=2000):
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._snapshot = CatalogSnapshot.empty()
+
+    def load(self, version=None):
+        """اللقطة المطابقة للإصدار الحالي (يمكن تمرير الإصدار إن كان محسوباً لتوفير استعلام)"""
+        version = version or catalog_version()[0]
+        snapshot = self._snapshot
+        if snapshot.version == version:
+            return snapshot
+        with self._lock:
+            if self._snapshot.version != version:
+                self._snapshot = CatalogSnapshot.load(version, self.chunk_size)
+            return self._snapshot
@@ -0,0 +1,227 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from scipy import sparse
+
+from .lexical_index import reciprocal_rank_fusion
+from .models import Book, Transaction
+
+
+# ==========================================
+# 1. مصفوفة الاستعارة المشتركة (Co-Borrow Matrix)
+# ==========================================
+# "من استعار هذا الكتاب استعار أيضاً": C[i, j] = عدد الطلاب الذين استعاروا الكتابين i و j معاً،
+# و C[i, i] = عدد من استعار الكتاب i. المصفوفة متناثرة (CSR) ومفهرسة بمعرف الكتاب مباشرة،
+# وتحفظ في ملف .npz واحد مع علامة آخر استعارة دخلت فيها (للتحديث التزايدي).
+
+class CoBorrowModel:
+
+    def __init__(self, matrix, watermark):
+        self.matrix = matrix.tocsr()
+        # C[i, i] لكل الكتب: يحسب مرة واحدة عند تحميل النموذج بدلاً من كل صفحة كتاب
+        self.diagonal = self.matrix.diagonal().astype(np.float64)
+        self.watermark = watermark
+
+    @classmethod
+    def empty(cls, size=0):
+        return cls(sparse.csr_matrix((size, size), dtype=np.int32), None)
+
+    def similar(self, book_id, k=10, min_count=1):
+        """
+        أكثر k كتاب استعير مع book_id، مرتبة بتشابه جيب التمام (Cosine) بين عمودي الطلاب:
+        C[i, j] / sqrt(C[i, i] * C[j, j]) حتى لا تطغى الكتب الشائعة على كل القوائم.
+        """
+        if book_id >= self.matrix.shape[0]:
+            return []
+        start, end = self.matrix.indptr[book_id], self.matrix.indptr[book_id + 1]
+        neighbors = self.matrix.indices[start:end]
+        counts = self.matrix.data[start:end].astype(np.float64)
+        keep = (neighbors != book_id) & (counts >= min_count)
+        neighbors, counts = neighbors[keep], counts[keep]
+        if not len(neighbors):
+            return []
+
+        scores = counts / np.sqrt(self.diagonal[book_id] * self.diagonal[neighbors])
+        top = np.argsort(-scores, kind='stable')[:k]
+        return [int(neighbors[i]) for i in top]
+
+    def save(self, path):
+        """كتابة الملف ذرياً: ملف مؤقت ثم os.replace، فلا يقرأ أي خادم ملفاً ناقصاً"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        stamp = -1 if self.watermark is None else int(self.watermark.timestamp() * 1_000_000)
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as handle:
+            np.savez_compressed(
+                handle, data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+                shape=np.array(self.matrix.shape, dtype=np.int64), watermark=np.int64(stamp),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            matrix = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+            stamp = int(data['watermark'])
+        watermark = None if stamp < 0 else datetime.fromtimestamp(stamp / 1_000_000, tz=dt_timezone.utc)
+        return cls(matrix, watermark)
+
+
+def _model_path():
+    return getattr(settings, 'COBORROW_MODEL_PATH', os.path.join(settings.BASE_DIR, 'data', 'coborrow.npz'))
+
+
+# ==========================================
+# 2. البناء الكامل والتحديث التزايدي (Batch Build & Incremental Refresh)
+# ==========================================
+def _borrows():
+    # الاستعارات الفعلية فقط (المعتمدة)؛ الطلبات المرفوضة أو المعلقة ليس لها تاريخ استعارة
+    return Transaction.objects.filter(borrow_date__isnull=False)
+
+
+def _interactions(rows, size):
+    """
+    مصفوفة (طالب × كتاب) ثنائية لدفعة من الطلاب، ثم مساهمتها في C = Xᵀ X.
+    تكرار استعارة نفس الكتاب لا يضاعف الوزن.
+    """
+    if not rows:
+        return sparse.csr_matrix((size, size), dtype=np.int32)
+    students, books = np.array(rows, dtype=np.int64).T
+    _, local = np.unique(students, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(books), dtype=np.int32), (local, books)), shape=(int(local.max()) + 1, size),
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return (matrix.T @ matrix).tocsr()
+
+
+def _stream_by_student(queryset, batch_size):
+    """(student_id, book_id) مجمعة في دفعات من batch_size طالب، دون تحميل الجدول كاملاً"""
+    rows, students, current = [], 0, None
+    pairs = queryset.order_by('student_id', 'book_id').values_list('student_id', 'book_id')
+    for student_id, book_id in pairs.iterator(chunk_size=5000):
+        if student_id != current:
+            current = student_id
+            students += 1
+            if students > batch_size:
+                yield rows
+                rows, students = [], 1
+        rows.append((student_id, book_id))
+    if rows:
+        yield rows
+
+
+def _cutoff():
+    # نفس مهلة جداول الإحصاءات: لا نتجاوز استعارات لم تثبت بعد
+    return timezone.now() - timedelta(seconds=getattr(settings, 'ANALYTICS_ROLLUP_LAG', 60))
+
+
+def _catalog_size():
+    return (Book.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+def build_coborrow(batch_size=None, path=None):
+    """
+    بناء المصفوفة كاملة من سجل العمليات بذاكرة محدودة: الطلاب يعالجون في دفعات
+    (COBORROW_BATCH_SIZE) وتضاف مساهمة كل دفعة إلى المجموع، فأكبر ما في الذاكرة هو المصفوفة الناتجة.
+    """
+    batch_size = batch_size or getattr(settings, 'COBORROW_BATCH_SIZE', 2000)
+    cutoff = _cutoff()
+    size = _catalog_size()
+    total = sparse.csr_matrix((size, size), dtype=np.int32)
+    for rows in _stream_by_student(_borrows().filter(borrow_date__lte=cutoff), batch_size):
+        total = total + _interactions(rows, size)
+
+    model = CoBorrowModel(total, cutoff)
+    model.save(path or _model_path())
+    return model
+
+
+def refresh_coborrow(batch_size=None, path=None):
+    """
+    إضافة الاستعارات الجديدة منذ آخر علامة: لكل طالب له استعارة جديدة نطرح مساهمته القديمة
+    ونضيف مساهمته الحالية (X_newᵀ X_new - X_oldᵀ X_old)، فلا يعاد المرور على بقية الطلاب.
+    إن لم يوجد ملف بعد يبنى كاملاً. يرجع عدد الطلاب المحدثين.
+    """
+    path = path or _model_path()
+    if not os.path.exists(path):
+        build_coborrow(batch_size, path)
+        return None
+
+    batch_size = batch_size or getattr(settings, 'COBORROW_BATCH_SIZE', 2000)
+    model = CoBorrowModel.load(path)
+    cutoff = _cutoff()
+    if model.watermark and model.watermark >= cutoff:
+        return 0
+
+    fresh = _borrows().filter(borrow_date__lte=cutoff)
+    if model.watermark:
+        fresh = fresh.filter(borrow_date__gt=model.watermark)
+    students = sorted(set(fresh.values_list('student_id', flat=True)))
+
+    size = max(_catalog_size(), model.matrix.shape[0])
+    total = model.matrix
+    total.resize((size, size))
+    for start in range(0, len(students), batch_size):
+        chunk = students[start:start + batch_size]
+        current = _borrows().filter(student_id__in=chunk, borrow_date__lte=cutoff)
+        rows = list(current.values_list('student_id', 'book_id'))
+        previous = [] if model.watermark is None else list(
+            current.filter(borrow_date__lte=model.watermark).values_list('student_id', 'book_id')
+        )
+        total = total + _interactions(rows, size) - _interactions(previous, size)
+
+    total.eliminate_zeros()
+    CoBorrowModel(total, cutoff).save(path)
+    return len(students)
+
+
+# ==========================================
+# 3. القراءة في الخوادم ودمج التوصيات (Serving & Blending)
+# ==========================================
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def get_coborrow_model():
+    """آخر نسخة من الملف في الذاكرة؛ يعاد تحميلها فقط عند تغيّر الملف (بعد تشغيل المهمة)"""
+    path = _model_path()
+    try:
+        version = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != version:
+        with _loaded_lock:
+            cached = _loaded.get(path)
+            if cached is None or cached[0] != version:
+                cached = (version, CoBorrowModel.load(path))
+                _loaded[path] = cached
+    return cached[1]
+
+
+def blend_recommendations(book_id, similar_books, limit=4):
+    """
+    دمج الكتب المشابهة في المحتوى (similar_books) مع "من استعار هذا استعار أيضاً"
+    بطريقة (Reciprocal Rank Fusion) كما في البحث الهجين. الكتب المحملة مسبقاً لا يعاد جلبها.
+    """
+    try:
+        model = get_coborrow_model()
+        co_borrowed = model.similar(book_id, limit * 2, getattr(settings, 'COBORROW_MIN_COUNT', 2)) if model else []
+    except Exception as e:
+        print(f"Co-Borrow Error: {e}")
+        co_borrowed = []
+    if not co_borrowed:
+        return similar_books[:limit]
+
+    books = {book.id: book for book in similar_books}
+    ranked = [candidate for candidate, _ in reciprocal_rank_fusion([list(books), co_borrowed])][:limit]
+    missing = [candidate for candidate in ranked if candidate not in books]
+    if missing:
+        books.update(Book.objects.in_bulk(missing))
+    return [books[candidate] for candidate in ranked if candidate in books]
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class BatchingEncoder:
+    """
+    مجدول تشفير داخل العملية (Micro-batching):
+    يجمع نصوص الاستعلامات المتزامنة لمدة قصيرة (max_wait بالثواني) أو حتى max_batch_size نص،
+    ثم يمررها للنموذج في استدعاء encode واحد، ويعيد لكل طالب متجهه الخاص عبر Future.
+    يحافظ على نفس واجهة encode الخاصة بالنموذج، لذلك يمكن استخدامه بدلاً منه مباشرة.
+    """
+
+    def __init__(self, encoder, max_batch_size=32, max_wait=0.005):
+        self.encoder = encoder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.encoded = 0
+        self._pending = []
+        self._condition = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._worker = None
+        # العملية التي بدأ فيها خيط التجميع؛ الخيوط لا تنتقل للعمليات الفرعية عند التفرع (fork)
+        self._pid = None
+
+    def _start_worker(self):
+        """
+        يبدأ خيط التجميع عند أول استعلام لا عند الإنشاء: مع gunicorn --preload يبنى المحرك في العملية الأم،
+        وخيط يبدأ هناك لا يوجد في العمال فتنتظر كل الاستعلامات للأبد. وإن تغيّر رقم العملية (كائن ورثه
+        عامل بعد التفرع) نبدأ خيطاً جديداً بطابور وقفل جديدين بدل ما ورثه من العملية الأم.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                self._pending = []
+                self._condition = threading.Condition()
+            self._worker = threading.Thread(target=self._run, name='encoder-batcher', daemon=True)
+            self._worker.start()
+            self._pid = os.getpid()
+
+    def submit(self, sentence):
+        """إضافة نص للطابور وإرجاع Future يحمل متجهه"""
+        future = Future()
+        self._start_worker()
+        with self._condition:
+            self._pending.append((sentence, future))
+            self._condition.notify()
+        return future
+
+    def encode(self, sentences, **kwargs):
+        futures = [self.submit(sentence) for sentence in sentences]
+        vectors = [future.result() for future in futures]
+        return np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+
+            # ننتظر حتى تمتلئ الدفعة أو تنتهي مهلة الانتظار منذ وصول أول طلب
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # نتجاهل الطلبات التي ألغيت أثناء الانتظار
+            batch = [(sentence, future) for sentence, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            sentences = [sentence for sentence, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                vectors = self.encoder.encode(sentences)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.encoded += len(sentences)
+            for future, vector in zip(futures, vectors):
+                future.set_result(vector)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'encoded': self.encoded,
+            'average_batch_size': self.encoded / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,111 @@
+import hashlib
+import re
+
+import numpy as np
+
+# ==========================================
+# مشفرات النصوص (Text Encoders)
+# ==========================================
+# النموذج المرجعي المستخدم في الإنتاج
+DEFAULT_MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+
+# أبعاد متجهات نموذج MiniLM
+DEFAULT_DIMENSION = 384
+
+
+def set_torch_threads(intra_op=None, inter_op=None):
+    """
+    عدد خيوط torch داخل العملية الواحدة (Intra-op) وبين العمليات المتوازية (Inter-op).
+    مع عدة عمال gunicorn على نفس الخادم يجب أن يكون مجموع الخيوط بعدد الأنوية تقريباً.
+    """
+    import torch
+    if intra_op:
+        torch.set_num_threads(intra_op)
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            # لا يمكن تغييره بعد أول عملية متوازية في العملية الحالية
+            pass
+
+
+def load_sentence_transformer(model_name=DEFAULT_MODEL_NAME, quantize=False, max_seq_length=None):
+    """
+    تحميل نموذج SentenceTransformer (الاستيراد هنا لتأجيل تحميل torch).
+    quantize: تكميم ديناميكي (Dynamic Quantization) لطبقات Linear إلى int8 على المعالج،
+    حيث تحفظ الأوزان بصيغة int8 وتكمم المدخلات أثناء التنفيذ (نفس النموذج دون إعادة تدريب).
+    max_seq_length: قص النصوص الطويلة (مثل الوصف) إلى هذا العدد من الرموز (Tokens).
+    """
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, device='cpu' if quantize else None)
+    if max_seq_length:
+        model.max_seq_length = max_seq_length
+    if quantize:
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+class HashingEncoder:
+    """
+    مشفر محلي خفيف يعتمد على تقنية (Feature Hashing).
+    لا يحتاج إلى تحميل أي نموذج، ويعطي نفس المتجه للنص نفسه في كل العمليات،
+    لذلك يستخدم في الاختبارات وبيئات التطوير بدلاً من نموذج MiniLM.
+    """
+
+    def __init__(self, dimension=DEFAULT_DIMENSION, max_seq_length=None):
+        self.dimension = dimension
+        self.max_seq_length = max_seq_length
+
+    def _token_slot(self, token):
+        digest = hashlib.md5(token.encode('utf-8')).digest()
+        index = int.from_bytes(digest[:4], 'little') % self.dimension
+        sign = 1.0 if digest[4] & 1 else -1.0
+        return index, sign
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        vectors = np.zeros((len(sentences), self.dimension), dtype=np.float32)
+        for row, sentence in enumerate(sentences):
+            for token in re.findall(r'\w+', str(sentence).lower())[:self.max_seq_length]:
+                index, sign = self._token_slot(token)
+                vectors[row, index] += sign
+        return vectors
+
+
+ENCODER_BACKENDS = ('sentence-transformers', 'sentence-transformers-int8', 'hashing')
+
+
+def load_encoder(backend, model_name=DEFAULT_MODEL_NAME, max_seq_length=None, threads=None):
+    """
+    إنشاء المشفر حسب الإعداد AI_ENCODER_BACKEND:
+    - 'sentence-transformers': النموذج الكامل (الافتراضي، والمرجع في المقارنات).
+    - 'sentence-transformers-int8': نفس النموذج بعد التكميم الديناميكي (أسرع على المعالج).
+    - 'hashing': المشفر المحلي الخفيف للاختبارات.
+    threads: عدد خيوط torch (None = القيمة الافتراضية لـ torch).
+    """
+    if backend == 'hashing':
+        return HashingEncoder(max_seq_length=max_seq_length)
+    if backend in ('sentence-transformers', 'sentence-transformers-int8'):
+        set_torch_threads(threads)
+        return load_sentence_transformer(
+            model_name, quantize=backend.endswith('-int8'), max_seq_length=max_seq_length,
+        )
+    raise ValueError(f"Unknown encoder backend: {backend}")
+
+
+# ==========================================
+# التشفير في عمليات منفصلة (Process Pool)
+# ==========================================
+# كل عملية عاملة تحمّل نسختها من المشفر مرة واحدة عند بدئها.
+# الدوال هنا لا تعتمد على Django حتى يمكن استيرادها في عمليات spawn.
+_pool_encoder = None
+
+
+def init_pool_encoder(backend, model_name=DEFAULT_MODEL_NAME, threads=1, max_seq_length=None):
+    global _pool_encoder
+    # خيط واحد لكل عملية حتى لا تتنافس العمليات على أنوية المعالج
+    _pool_encoder = load_encoder(backend, model_name, max_seq_length=max_seq_length, threads=threads)
+
+
+def pool_encode(sentences):
+    return np.asarray(_pool_encoder.encode(sentences), dtype=np.float32)
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class InferenceQueueFull(Exception):
+    """طابور الاستدلال ممتلئ: يجب رفض الطلب (503) بدلاً من تكديسه"""
+
+
+class InferenceExecutor:
+    """
+    منفذ محدود (Bounded Executor) لعمليات التشفير والبحث في الفهارس.
+    يسمح بـ max_workers عملية متزامنة و max_queue طلب منتظر فقط، وما زاد يرفض فوراً
+    (Backpressure) حتى لا تتراكم الطلبات البطيئة في ذاكرة الخادم.
+    """
+
+    def __init__(self, max_workers=4, max_queue=32):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='inference')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+
+    @staticmethod
+    def _call(func, args):
+        # كل خيط في المنفذ يستخدم اتصال قاعدة بيانات خاص به؛ نغلق المنتهي منها كما يفعل Django بين الطلبات
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    def submit(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise InferenceQueueFull()
+        future = self._executor.submit(self._call, func, args)
+        # نحرر المكان عند انتهاء العمل فعلاً، حتى لو ألغي الطلب (انقطاع العميل) قبل ذلك
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def run(self, func, *args):
+        """تنفيذ func في المنفذ وانتظار النتيجة دون حجز حلقة الأحداث (Event Loop)"""
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_inference_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = InferenceExecutor(
+                    max_workers=getattr(settings, 'AI_INFERENCE_WORKERS', 4),
+                    max_queue=getattr(settings, 'AI_INFERENCE_QUEUE_SIZE', 32),
+                )
+    return _executor
+
@@ -0,0 +1,64 @@
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+
+from .models import BookEmbedding, StudentProfile
+
+
+# ==========================================
+# بصمة اهتمامات الطالب (Interest Fingerprint)
+# ==========================================
+def fingerprint_vector(student):
+    """متجه اهتمامات الطالب المطبّع (float32) أو None إن لم يستعر أو يقيّم أي كتاب بعد"""
+    if not student.interest_fingerprint or student.interest_weight <= 0:
+        return None
+    vector = np.frombuffer(bytes(student.interest_fingerprint), dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+def add_interests(events):
+    """
+    تحديث البصمات تزايدياً بمتوسط موزون متحرك (Weighted Running Mean):
+        new = (old * W + Σ w_i * v_i) / (W + Σ w_i)
+    events: قائمة (student_id, book_id, weight)؛ الوزن السالب يزيل أثر تقييم سابق.
+    متجهات الكتب تقرأ من المخزن (BookEmbedding) باستعلام واحد ولا يعاد تشفير أي شيء.
+    """
+    by_student = defaultdict(list)
+    for student_id, book_id, weight in events:
+        if weight:
+            by_student[student_id].append((book_id, weight))
+    if not by_student:
+        return 0
+
+    book_ids = {book_id for items in by_student.values() for book_id, _ in items}
+    vectors = {
+        book_id: np.frombuffer(bytes(vector), dtype=np.float32)
+        for book_id, vector in BookEmbedding.objects.filter(book_id__in=book_ids).values_list('book_id', 'vector')
+    }
+
+    updated = 0
+    with transaction.atomic():
+        profiles = StudentProfile.objects.select_for_update().filter(pk__in=list(by_student)) \
+            .only('pk', 'interest_fingerprint', 'interest_weight')
+        for profile in profiles:
+            # الكتب التي لم تشفر بعد لا تدخل في المتوسط
+            items = [(vectors[book_id], weight) for book_id, weight in by_student[profile.pk] if book_id in vectors]
+            if not items:
+                continue
+            total = profile.interest_weight
+            accumulated = np.zeros_like(items[0][0])
+            if profile.interest_fingerprint and total > 0:
+                accumulated += np.frombuffer(bytes(profile.interest_fingerprint), dtype=np.float32) * total
+            for vector, weight in items:
+                accumulated += vector * weight
+                total += weight
+
+            if total <= 1e-6:
+                fingerprint, total = None, 0.0
+            else:
+                fingerprint = (accumulated / total).astype(np.float32).tobytes()
+            StudentProfile.objects.filter(pk=profile.pk).update(interest_fingerprint=fingerprint, interest_weight=total)
+            updated += 1
+    return updated
@@ -0,0 +1,278 @@
+import math
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+from django.db.models import Count, Sum
+
+from .catalog import catalog_version
+from .models import Book
+from .vector_index import top_k
+
+# ==========================================
+# 1. توحيد النص العربي (Arabic Normalization)
+# ==========================================
+# التشكيل وعلامات القرآن والتطويل (ـ)
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+
+# توحيد أشكال الألف والياء والتاء المربوطة والهمزات
+ARABIC_FOLDING = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي',
+    'ة': 'ه',
+    'ؤ': 'و',
+})
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# أداة التعريف وما يسبقها من حروف العطف والجر (المكتبة، والمكتبة، بالمكتبة، للمكتبة)،
+# بشرط أن يبقى جذع من 3 أحرف على الأقل حتى لا تقص كلمات مثل "الله" و"بالون" (له، ون)
+ARABIC_ARTICLE = re.compile(r'^(?:[وفبك]?ال|لل)(?=\w{3,})')
+
+
+def normalize_arabic(text):
+    """إزالة التشكيل وتوحيد الحروف المتشابهة ثم تحويل الأحرف اللاتينية لحالة صغيرة"""
+    return ARABIC_DIACRITICS.sub('', str(text)).translate(ARABIC_FOLDING).casefold()
+
+
+# رقم ISBN بشرطات (978-1612680194) يبقى كلمة واحدة دون شرطات بدل تقسيمه إلى أجزاء
+ISBN_TOKEN = re.compile(r'\b\d[\d\-]{8,}[\dx]\b')
+
+
+def tokenize(text):
+    text = ISBN_TOKEN.sub(lambda match: match.group().replace('-', ''), normalize_arabic(text))
+    return [ARABIC_ARTICLE.sub('', token) for token in TOKEN_PATTERN.findall(text)]
+
+
+# الحقول المفهرسة ووزن كل منها (العنوان أهم من الوصف)
+FIELD_WEIGHTS = (('title', 3.0), ('author', 2.0), ('isbn', 2.0), ('tags', 2.0), ('description', 1.0))
+FIELDS = tuple(field for field, _ in FIELD_WEIGHTS)
+
+
+def document_terms(values):
+    """تكرار المصطلحات الموزون لكتاب واحد (values بنفس ترتيب FIELDS)"""
+    terms = Counter()
+    for (_, weight), value in zip(FIELD_WEIGHTS, values):
+        for token in tokenize(value or ''):
+            terms[token] += weight
+    return terms
+
+
+# ==========================================
+# 2. قوائم الورود المضغوطة (Compact Postings)
+# ==========================================
+class Postings:
+    """
+    قوائم الورود بصيغة CSR: لكل مصطلح شريحة متصلة من مصفوفتي docs (int32) وtfs (float32)
+    تبدأ عند indptr[term] وتنتهي عند indptr[term + 1].
+    """
+
+    def __init__(self, term_ids, docs, tfs, term_count):
+        order = np.lexsort((docs, term_ids))
+        self.docs = np.ascontiguousarray(docs[order], dtype=np.int32)
+        self.tfs = np.ascontiguousarray(tfs[order], dtype=np.float32)
+        self.indptr = np.zeros(term_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=term_count), out=self.indptr[1:])
+
+    def get(self, term_id):
+        if term_id >= len(self.indptr) - 1:
+            return self.docs[:0], self.tfs[:0]
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        return self.docs[start:end], self.tfs[start:end]
+
+    def expanded(self):
+        """إرجاع الورود كمصفوفات (term_ids, docs, tfs) لإعادة الدمج"""
+        term_ids = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        return term_ids, self.docs, self.tfs
+
+    @property
+    def nbytes(self):
+        return self.docs.nbytes + self.tfs.nbytes + self.indptr.nbytes
+
+
+# ==========================================
+# 3. فهرس BM25 التزايدي (Incremental BM25 Index)
+# ==========================================
+class LexicalIndex:
+    """
+    فهرس معكوس (Inverted Index) بترتيب BM25 فوق العنوان والمؤلف وISBN والوسوم والوصف.
+    - الجزء الأساسي: قوائم ورود مضغوطة (Postings).
+    - الجزء التزايدي (delta): الكتب المضافة أو المعدّلة منذ آخر دمج، والكتب القديمة تُعلَّم كمحذوفة.
+    عند تضخم الجزء التزايدي يدمج مع الأساسي في عملية متجهة (Vectorized) واحدة.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, merge_ratio=0.1, chunk_size=2000):
+        self.k1 = k1
+        self.b = b
+        self.merge_ratio = merge_ratio
+        self.chunk_size = chunk_size
+        self.version = None
+        self._watermark = None
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.vocabulary = {}
+        self.ids = np.empty(0, dtype=np.int64)
+        self.lengths = np.empty(0, dtype=np.float32)
+        self.alive = np.empty(0, dtype=bool)
+        self.positions = {}
+        self.base = Postings(*(np.empty(0, dtype=np.int64),) * 3, term_count=0)
+        self.delta = {}
+        self.delta_documents = 0
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    # ---------- البناء والتحديث ----------
+    def refresh(self):
+        """مزامنة الفهرس مع جدول الكتب؛ يقرأ فقط الكتب المعدّلة منذ آخر مزامنة"""
+        version, last_update = catalog_version()
+        if version == self.version:
+            return
+        with self._lock:
+            if version == self.version:
+                return
+            if self.version is None:
+                self._build()
+            else:
+                self._apply_changes()
+            self.version, self._watermark = version, last_update
+
+    def _build(self):
+        self._reset()
+        rows = Book.objects.order_by('pk').values_list('pk', *FIELDS)
+        self._add_documents(rows.iterator(chunk_size=self.chunk_size))
+        self._merge()
+
+    def _apply_changes(self):
+        changed = Book.objects.values_list('pk', *FIELDS)
+        if self._watermark is not None:
+            # >= وليس > لالتقاط التعديلات التي تشارك آخر طابع زمني (الإضافة المكررة آمنة)
+            changed = changed.filter(updated_at__gte=self._watermark)
+        self._add_documents(changed.iterator(chunk_size=self.chunk_size))
+
+        # الحذف لا يترك أثراً في updated_at، والكتاب المعتمد في معاملة طويلة قد يحمل وقتاً أقدم من العلامة.
+        # العدد وحده لا يكفي (حذف كتاب وإضافة آخر يتركه كما هو)، فنقارن العدد ومجموع المعرفات باستعلام واحد
+        # ولا نقرأ مجموعة المعرفات كاملة إلا عند الاختلاف
+        stats = Book.objects.aggregate(count=Count('pk'), total=Sum('pk'))
+        if (stats['count'], stats['total'] or 0) != (len(self), int(self.ids[self.alive].sum())):
+            self._reconcile()
+
+        if self.delta_documents > max(1000, self.merge_ratio * len(self)):
+            self._merge()
+
+    def _reconcile(self):
+        """مطابقة معرفات الفهرس مع جدول الكتب: تعليم المحذوف وإضافة ما فات العلامة الزمنية"""
+        live = set(Book.objects.values_list('pk', flat=True).iterator(chunk_size=10000))
+        for book_id, position in list(self.positions.items()):
+            if book_id not in live:
+                self.alive[position] = False
+                del self.positions[book_id]
+
+        missing = sorted(live.difference(self.positions))
+        for start in range(0, len(missing), 500):
+            rows = Book.objects.filter(pk__in=missing[start:start + 500]).order_by('pk').values_list('pk', *FIELDS)
+            self._add_documents(rows)
+
+    def _add_documents(self, rows):
+        new_ids, new_lengths = [], []
+        for book_id, *values in rows:
+            old = self.positions.get(book_id)
+            if old is not None:
+                self.alive[old] = False
+
+            position = len(self.ids) + len(new_ids)
+            terms = document_terms(values)
+            for term, tf in terms.items():
+                term_id = self.vocabulary.setdefault(term, len(self.vocabulary))
+                docs, tfs = self.delta.setdefault(term_id, ([], []))
+                docs.append(position)
+                tfs.append(tf)
+
+            self.positions[book_id] = position
+            new_ids.append(book_id)
+            new_lengths.append(sum(terms.values()))
+
+        if new_ids:
+            self.ids = np.concatenate([self.ids, np.asarray(new_ids, dtype=np.int64)])
+            self.lengths = np.concatenate([self.lengths, np.asarray(new_lengths, dtype=np.float32)])
+            self.alive = np.concatenate([self.alive, np.ones(len(new_ids), dtype=bool)])
+            self.delta_documents += len(new_ids)
+
+    def _merge(self):
+        """دمج الجزء التزايدي مع الأساسي وحذف الكتب المعلّمة وإعادة ترقيم المواقع"""
+        base_terms, base_docs, base_tfs = self.base.expanded()
+        delta_terms, delta_docs, delta_tfs = [], [], []
+        for term_id, (term_docs, term_tfs) in self.delta.items():
+            delta_terms.extend([term_id] * len(term_docs))
+            delta_docs.extend(term_docs)
+            delta_tfs.extend(term_tfs)
+
+        term_ids = np.concatenate([base_terms, np.asarray(delta_terms, dtype=np.int64)])
+        docs = np.concatenate([base_docs.astype(np.int64), np.asarray(delta_docs, dtype=np.int64)])
+        tfs = np.concatenate([base_tfs, np.asarray(delta_tfs, dtype=np.float32)])
+
+        keep = self.alive[docs]
+        remap = np.cumsum(self.alive) - 1
+        self.base = Postings(term_ids[keep], remap[docs[keep]], tfs[keep], term_count=len(self.vocabulary))
+
+        self.ids = self.ids[self.alive]
+        self.lengths = self.lengths[self.alive]
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.positions = {int(book_id): position for position, book_id in enumerate(self.ids)}
+        self.delta = {}
+        self.delta_documents = 0
+
+    # ---------- البحث ----------
+    def _postings(self, term_id):
+        docs, tfs = self.base.get(term_id)
+        extra = self.delta.get(term_id)
+        if extra:
+            docs = np.concatenate([docs, np.asarray(extra[0], dtype=np.int32)])
+            tfs = np.concatenate([tfs, np.asarray(extra[1], dtype=np.float32)])
+        keep = self.alive[docs]
+        return docs[keep], tfs[keep]
+
+    def search(self, query, k, min_score=0.0):
+        """أفضل k كتاب حسب BM25؛ يرجع (ids, scores)"""
+        with self._lock:
+            count = len(self)
+            if not count:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+            average_length = float(self.lengths[self.alive].mean()) or 1.0
+            scores = np.zeros(len(self.ids), dtype=np.float32)
+            for term in set(tokenize(query)):
+                term_id = self.vocabulary.get(term)
+                if term_id is None:
+                    continue
+                docs, tfs = self._postings(term_id)
+                if not len(docs):
+                    continue
+                idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[docs] / average_length)
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+            selected = top_k(scores, k, min_score)
+            return self.ids[selected], scores[selected]
+
+    @property
+    def nbytes(self):
+        return self.base.nbytes + self.ids.nbytes + self.lengths.nbytes + self.alive.nbytes
+
+
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    دمج عدة قوائم مرتبة (Reciprocal Rank Fusion): درجة كل كتاب = مجموع 1 / (k + ترتيبه).
+    يرجع قائمة (book_id, score) مرتبة تنازلياً.
+    """
+    fused = Counter()
+    for ranking in rankings:
+        for rank, book_id in enumerate(ranking, start=1):
+            fused[int(book_id)] += 1.0 / (k + rank)
+    return fused.most_common()
@@ -0,0 +1,170 @@
+from collections import Counter, defaultdict
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from .models import BORROW_INTEREST_WEIGHT, LOAN_PERIOD, Book, NoCopiesAvailable, Reservation, Transaction
+from .signals import apply_interests
+
+# حجم كل دفعة معرفات في جملة IN (حد متغيرات SQLite)
+CHUNK_SIZE = 500
+
+
+# ==========================================
+# العمليات الجماعية على الإعارات (Bulk Loan Operations)
+# ==========================================
+# نفس منطق Transaction.save لكن على مجموعة طلبات: عدد ثابت من جمل UPDATE بدلاً من
+# عدة استعلامات لكل طلب. لا تطلق إشارات post_save (مثل queryset.update).
+
+def _chunks(ids):
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def _stamped(ids, field, stamp):
+    """الطلبات التي كتبنا فيها الطابع الزمني stamp فعلاً (ما سبقتنا إليه عملية أخرى يستبعد)"""
+    rows = []
+    for chunk in _chunks(ids):
+        rows.extend(
+            Transaction.objects.filter(pk__in=chunk, **{field: stamp}).order_by().values_list('pk', 'book_id', 'student_id')
+        )
+    return rows
+
+
+def _adjust_inventory(counts, update):
+    """تعديل المخزون بجملة UPDATE واحدة لكل قيمة مختلفة من عدد النسخ (غالباً قيم قليلة)"""
+    by_count = sorted(counts.items(), key=lambda item: item[1])
+    for count, items in groupby(by_count, key=lambda item: item[1]):
+        book_ids = [book_id for book_id, _ in items]
+        for chunk in _chunks(book_ids):
+            update(chunk, count)
+
+
+def approve_requests(queryset):
+    """
+    الموافقة على الطلبات المعلقة في queryset:
+    تجمع حسب الكتاب، وتوزع النسخ المتاحة بالأقدمية (تاريخ الطلب) في مرور واحد،
+    ثم تكتب التواريخ والمخزون بجمل UPDATE جماعية.
+    يرجع (approved_ids, unavailable_ids): الطلبات المقبولة، والطلبات التي لم تكفها النسخ.
+    """
+    with transaction.atomic():
+        pending = list(
+            queryset.filter(status='pending', borrow_date__isnull=True)
+            .order_by('request_date', 'pk')
+            .values_list('pk', 'book_id', 'reserved_copy')
+        )
+        if not pending:
+            return [], []
+
+        # الطلبات القادمة من قائمة الانتظار خصمت نسخها مسبقاً فلا تحتاج توزيعاً
+        reserved = [trans_id for trans_id, _, has_copy in pending if has_copy]
+        requested = defaultdict(list)
+        for trans_id, book_id, has_copy in pending:
+            if not has_copy:
+                requested[book_id].append(trans_id)
+
+        available = {}
+        for chunk in _chunks(list(requested)):
+            available.update(
+                Book.objects.select_for_update().filter(pk__in=chunk).order_by().values_list('pk', 'available_copies')
+            )
+
+        granted, unavailable = [], []
+        for book_id, trans_ids in requested.items():
+            copies = available.get(book_id, 0)
+            granted.extend(trans_ids[:copies])
+            unavailable.extend(trans_ids[copies:])
+
+        now = timezone.now()
+        for chunk in _chunks(reserved):
+            Transaction.objects.filter(pk__in=chunk, status='pending', borrow_date__isnull=True, reserved_copy=True) \
+                .update(status='active', borrow_date=now, due_date=now + LOAN_PERIOD, reserved_copy=False)
+        for chunk in _chunks(granted):
+            Transaction.objects.filter(pk__in=chunk, status='pending', borrow_date__isnull=True, reserved_copy=False) \
+                .update(status='active', borrow_date=now, due_date=now + LOAN_PERIOD)
+
+        approved = _stamped(granted, 'borrow_date', now)
+        counts = Counter(book_id for _, book_id, _ in approved)
+        approved += _stamped(reserved, 'borrow_date', now)
+
+        def take(book_ids, count):
+            # نفس شرط Transaction.save: لا يخصم إلا ما هو متاح فعلاً
+            taken = Book.objects.filter(pk__in=book_ids, available_copies__gte=count) \
+                .update(available_copies=F('available_copies') - count)
+            if taken != len(book_ids):
+                raise NoCopiesAvailable("Inventory changed while approving requests.")
+
+        _adjust_inventory(counts, take)
+
+        # نفس أثر Transaction.save على بصمات اهتمامات الطلاب
+        apply_interests([(student_id, book_id, BORROW_INTEREST_WEIGHT) for _, book_id, student_id in approved])
+
+    # الطلبات التي وافقت عليها عملية أخرى أثناء عملنا لا تظهر في أي من القائمتين
+    return [trans_id for trans_id, _, _ in approved], unavailable
+
+
+def mark_returned(queryset):
+    """
+    تسجيل إرجاع الإعارات الجارية في queryset وإعادة نسخها للمخزون (دون تجاوز العدد الكلي).
+    يرجع معرفات الطلبات التي سجل إرجاعها.
+    """
+    with transaction.atomic():
+        active = list(queryset.filter(status='active', return_date__isnull=True).values_list('pk', flat=True))
+        if not active:
+            return []
+
+        now = timezone.now()
+        for chunk in _chunks(active):
+            Transaction.objects.filter(pk__in=chunk, status='active', return_date__isnull=True) \
+                .update(status='returned', return_date=now)
+
+        returned = _stamped(active, 'return_date', now)
+        _release_copies(Counter(book_id for _, book_id, _ in returned))
+
+    return [trans_id for trans_id, _, _ in returned]
+
+
+def reject_requests(queryset):
+    """
+    رفض الطلبات المحددة بجملة UPDATE واحدة.
+    الطلبات المعلقة التي تحمل نسخة محجوزة (من قائمة الانتظار) تمر عبر Transaction.save
+    حتى تعود نسختها للتالي في القائمة. يرجع عدد الطلبات المرفوضة.
+    """
+    with transaction.atomic():
+        # الجملة الجماعية أولاً: الطلبات المحجوزة تبقى معلقة فلا تعد مرتين، والطلبات الجديدة التي تنشئها
+        # قائمة الانتظار في الحلقة التالية لا تطالها الجملة حتى لو طابقت queryset
+        rejected = queryset.exclude(status='pending', reserved_copy=True).update(status='rejected')
+        for trans in queryset.filter(status='pending', reserved_copy=True):
+            trans.status = 'rejected'
+            trans.save()
+            rejected += 1
+    return rejected
+
+
+def _release_copies(counts):
+    """إعادة النسخ للمخزون (دون تجاوز العدد الكلي) ثم تخصيصها لقوائم انتظار كتبها"""
+    _adjust_inventory(counts, lambda book_ids, count: Book.objects.filter(pk__in=book_ids).update(
+        available_copies=Least(F('available_copies') + count, F('total_copies')),
+    ))
+    allocate_waitlist(counts)
+
+
+def allocate_waitlist(counts):
+    """
+    تخصيص نسخ أضيفت للمخزون ({book_id: عدد النسخ}) لقوائم انتظار كتبها قبل أي طلب استعارة جديد.
+    يستدعى بعد كل زيادة في available_copies (الإرجاع، أو تعديل المخزون من لوحة الإدارة).
+    يرجع طلبات الاستعارة المنشأة للمنتظرين.
+    """
+    allocated = []
+    waiting = Reservation.objects.filter(book_id__in=list(counts), status='waiting') \
+        .order_by().values_list('book_id', flat=True).distinct()
+    for book_id in list(waiting):
+        for _ in range(counts[book_id]):
+            loan = Reservation.allocate_next(book_id)
+            if loan is None:
+                break
+            allocated.append(loan)
+    return allocated
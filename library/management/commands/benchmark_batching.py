@@ -0,0 +1,60 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from library.encoder_batcher import BatchingEncoder
+from library.encoders import load_encoder
+
+
+def run_clients(encoder, clients, requests_per_client):
+    """تشغيل عدة عملاء متزامنين يرسل كل منهم استعلامات فردية (دفعة بحجم 1)"""
+    barrier = threading.Barrier(clients + 1)
+
+    def client(number):
+        barrier.wait()
+        for i in range(requests_per_client):
+            encoder.encode([f"استعلام تجريبي {number} {i} machine learning"])
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return clients * requests_per_client / elapsed
+
+
+class Command(BaseCommand):
+    help = "قياس إنتاجية تشفير الاستعلامات مع وبدون التجميع (Micro-batching) لعدد مختلف من العملاء المتزامنين"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default=getattr(settings, 'AI_ENCODER_BACKEND', 'sentence-transformers'))
+        parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+        parser.add_argument('--requests', type=int, default=20, help="عدد الاستعلامات لكل عميل")
+        parser.add_argument('--max-batch-size', type=int, default=getattr(settings, 'AI_QUERY_BATCH_SIZE', 32))
+        parser.add_argument('--max-wait-ms', type=float, default=getattr(settings, 'AI_QUERY_BATCH_WAIT_MS', 5))
+
+    def handle(self, *args, **options):
+        encoder = load_encoder(options['backend'])
+        encoder.encode(["warm up"])
+        batcher = BatchingEncoder(encoder, options['max_batch_size'], options['max_wait_ms'] / 1000)
+
+        self.stdout.write(
+            f"Backend: {options['backend']}  max_batch_size={options['max_batch_size']}  "
+            f"max_wait={options['max_wait_ms']}ms"
+        )
+        for clients in options['clients']:
+            direct = run_clients(encoder, clients, options['requests'])
+            before = batcher.stats()
+            batched = run_clients(batcher, clients, options['requests'])
+            after = batcher.stats()
+            batches = after['batches'] - before['batches']
+            average = (after['encoded'] - before['encoded']) / batches if batches else 0.0
+            self.stdout.write(
+                f"clients={clients:<3} direct={direct:8.1f} q/s  batched={batched:8.1f} q/s  "
+                f"speedup={batched / direct:.2f}x  avg_batch={average:.1f}"
+            )
@@ -0,0 +1,81 @@
+import itertools
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from library.catalog import CatalogSnapshot
+from library.encoders import ENCODER_BACKENDS, load_encoder
+from library.vector_store import normalize_rows
+
+# نصوص احتياطية عند خلو الفهرس: عناوين قصيرة وأوصاف طويلة (لإظهار أثر قص النصوص)
+SAMPLE_TEXTS = (
+    "مقدمة في تعلم الآلة",
+    "Introduction to machine learning with Python",
+    "تاريخ الأندلس " + "وصف مفصل لتاريخ الأندلس وحضارتها العلمية والأدبية " * 12,
+    "Database systems " + "a long description of indexing, transactions and query planning " * 10,
+)
+
+QUERIES = ("ذكاء اصطناعي", "machine learning", "تاريخ العرب", "python web development")
+
+
+def catalog_texts(limit):
+    """نصوص الكتب الحقيقية (نفس ما يشفره مخزن المتجهات)، أو النصوص الاحتياطية"""
+    texts = [content for _, content in itertools.islice(CatalogSnapshot.load().rows(), limit)]
+    if not texts:
+        texts = list(itertools.islice(itertools.cycle(SAMPLE_TEXTS), limit))
+    return texts
+
+
+def encode(encoder, texts, batch_size):
+    return normalize_rows(encoder.encode(texts, batch_size=batch_size))
+
+
+class Command(BaseCommand):
+    help = "مقارنة مشفرات النصوص: زمن الاستعلام الواحد والإنتاجية والانحراف (Cosine Drift) عن النموذج المرجعي"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', choices=ENCODER_BACKENDS,
+                            default=['sentence-transformers', 'sentence-transformers-int8'])
+        parser.add_argument('--reference', choices=ENCODER_BACKENDS, default='sentence-transformers',
+                            help="النموذج المرجعي (دون قص أو تغيير عدد الخيوط)")
+        parser.add_argument('--max-seq-length', type=int, nargs='+', default=[0], help="0 = حد النموذج نفسه")
+        parser.add_argument('--threads', type=int, nargs='+', default=[0], help="0 = القيمة الافتراضية لـ torch")
+        parser.add_argument('--texts', type=int, default=500, help="عدد نصوص الكتب المستخدمة في القياس")
+        parser.add_argument('--queries', type=int, default=50, help="عدد الاستعلامات الفردية لقياس الزمن")
+        parser.add_argument('--batch-size', type=int, default=32)
+
+    def handle(self, *args, **options):
+        texts = catalog_texts(options['texts'])
+        batch_size = options['batch_size']
+        reference = encode(load_encoder(options['reference']), texts, batch_size)
+        self.stdout.write(f"Texts: {len(texts)}  Reference: {options['reference']}  batch_size={batch_size}")
+
+        for backend, max_seq_length, threads in itertools.product(
+            options['backends'], options['max_seq_length'], options['threads'],
+        ):
+            started = time.perf_counter()
+            encoder = load_encoder(backend, max_seq_length=max_seq_length or None, threads=threads or None)
+            load_s = time.perf_counter() - started
+            encoder.encode(["warm up"])
+
+            # زمن الاستعلام الواحد (كما في طلب البحث)
+            latencies = []
+            for i in range(options['queries']):
+                started = time.perf_counter()
+                encoder.encode([QUERIES[i % len(QUERIES)]])
+                latencies.append((time.perf_counter() - started) * 1000)
+
+            # الإنتاجية عند تشفير الكتب على دفعات
+            started = time.perf_counter()
+            vectors = encode(encoder, texts, batch_size)
+            throughput = len(texts) / (time.perf_counter() - started)
+
+            # الانحراف: تشابه جيب التمام بين متجه كل نص ومتجهه من النموذج المرجعي
+            cosine = np.einsum('ij,ij->i', vectors, reference)
+            label = f"{backend} seq={max_seq_length or '-'} threads={threads or '-'}"
+            self.stdout.write(
+                f"{label:<44} p50={np.percentile(latencies, 50):7.2f} ms  p95={np.percentile(latencies, 95):7.2f} ms  "
+                f"throughput={throughput:8.1f} texts/s  cosine mean={cosine.mean():.4f} min={cosine.min():.4f}  "
+                f"load={load_s:.1f}s"
+            )
@@ -0,0 +1,94 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from library.vector_index import ExactIndex, IVFIndex, QuantizedIndex
+from library.vector_store import EmbeddingStore, QuantizedMatrix, normalize_rows
+
+
+def synthetic_vectors(count, dimension, clusters, rng):
+    """متجهات اصطناعية متجمعة حول مراكز عشوائية (تشبه توزيع مواضيع الكتب)"""
+    centers = normalize_rows(rng.standard_normal((clusters, dimension)))
+    labels = rng.integers(0, clusters, count)
+    return normalize_rows(centers[labels] + 0.15 * rng.standard_normal((count, dimension)))
+
+
+def timed_search(index, queries, k, min_score):
+    results = []
+    started = time.perf_counter()
+    for query in queries:
+        results.append(index.search(query, k, min_score)[0])
+    elapsed = time.perf_counter() - started
+    return results, elapsed / len(queries) * 1000
+
+
+class Command(BaseCommand):
+    help = "مقارنة الدقة (Recall@k) والزمن والذاكرة بين الفهرس الدقيق والفهرس التقريبي IVF والمتجهات المضغوطة"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=50000, help="عدد الكتب في البيانات الاصطناعية")
+        parser.add_argument('--dimension', type=int, default=384)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--min-score', type=float, default=None)
+        parser.add_argument('--nlist', type=int, default=None)
+        parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+        parser.add_argument('--rerank', type=int, nargs='+', default=[1, 4], help="مضاعف المرشحين المعاد ترتيبهم بالمتجهات الدقيقة")
+        parser.add_argument('--from-store', action='store_true', help="استخدام متجهات الكتب المخزنة بدلاً من بيانات اصطناعية")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+
+        if options['from_store']:
+            ids, matrix = EmbeddingStore().load()
+            if not len(ids):
+                raise CommandError("Embedding store is empty, run build_embeddings first.")
+            # استعلامات قريبة من كتب حقيقية
+            picks = matrix[rng.integers(0, len(ids), options['queries'])]
+            queries = normalize_rows(picks + 0.05 * rng.standard_normal(picks.shape).astype(np.float32))
+        else:
+            count, dimension = options['books'], options['dimension']
+            data = synthetic_vectors(count + options['queries'], dimension, max(1, count // 200), rng)
+            ids, matrix, queries = np.arange(count), data[:count], data[count:]
+
+        k, min_score = options['k'], options['min_score']
+        self.stdout.write(f"Books: {len(ids)}  Dimension: {matrix.shape[1]}  Queries: {len(queries)}  k: {k}")
+
+        exact = ExactIndex(ids, matrix)
+        truth, exact_ms = timed_search(exact, queries, k, min_score)
+        self.stdout.write(
+            f"{'exact':<24} recall@{k}=1.000  latency={exact_ms:.3f} ms/query  memory={matrix.nbytes / 2**20:.1f} MB"
+        )
+
+        for nprobe in options['nprobe']:
+            started = time.perf_counter()
+            ivf = IVFIndex(ids, matrix, nlist=options['nlist'], nprobe=nprobe, seed=options['seed'])
+            build_s = time.perf_counter() - started
+
+            found, ivf_ms = timed_search(ivf, queries, k, min_score)
+            hits = sum(len(np.intersect1d(a, b)) for a, b in zip(truth, found))
+            total = sum(len(a) for a in truth) or 1
+            label = f"ivf nlist={ivf.nlist} nprobe={ivf.nprobe}"
+            self.stdout.write(
+                f"{label:<24} recall@{k}={hits / total:.3f}  latency={ivf_ms:.3f} ms/query  "
+                f"speedup={exact_ms / ivf_ms:.1f}x  build={build_s:.2f}s"
+            )
+
+        # المتجهات الدقيقة للمرشحين (في الخادم تقرأ من جدول BookEmbedding)
+        def exact_vectors(candidate_ids):
+            return matrix[np.searchsorted(ids, candidate_ids)]
+
+        for mode in ('float16', 'int8'):
+            quantized = QuantizedMatrix.encode(matrix, mode)
+            for rerank in options['rerank']:
+                index = QuantizedIndex(ids, quantized, exact_vectors, rerank)
+                found, quantized_ms = timed_search(index, queries, k, min_score)
+                hits = sum(len(np.intersect1d(a, b)) for a, b in zip(truth, found))
+                total = sum(len(a) for a in truth) or 1
+                label = f"{mode} rerank={rerank}"
+                self.stdout.write(
+                    f"{label:<24} recall@{k}={hits / total:.3f}  latency={quantized_ms:.3f} ms/query  "
+                    f"memory={quantized.nbytes / 2**20:.1f} MB ({quantized.nbytes / max(len(ids), 1):.0f} B/book)"
+                )
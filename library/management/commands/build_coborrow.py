@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.coborrow import build_coborrow, refresh_coborrow
+
+
+class Command(BaseCommand):
+    help = "تحديث مصفوفة الاستعارة المشتركة (من استعار هذا استعار أيضاً) من الاستعارات الجديدة، أو إعادة بنائها بالكامل"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="إعادة بناء المصفوفة من كل سجل العمليات")
+        parser.add_argument('--batch-size', type=int, default=None, help="عدد الطلاب في كل دفعة (يحدد الذاكرة المستخدمة)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['rebuild']:
+            model = build_coborrow(options['batch_size'])
+            summary = f"Rebuilt co-borrow matrix ({model.matrix.nnz} non-zero entries)"
+        else:
+            students = refresh_coborrow(options['batch_size'])
+            summary = "Built co-borrow matrix" if students is None else f"Refreshed co-borrow matrix for {students} students"
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"{summary} in {elapsed:.2f}s."))
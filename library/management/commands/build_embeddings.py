@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.ai_engine import get_ai_engine
+
+
+class Command(BaseCommand):
+    help = "بناء أو مزامنة مخزن متجهات الكتب (يعيد تشفير الكتب الجديدة أو المعدّلة فقط) وجدول الكتب المتشابهة"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-neighbors', action='store_true', help="عدم إعادة بناء جدول الكتب المتشابهة")
+        parser.add_argument('--rebuild', action='store_true', help="إعادة تشفير كل الكتب في مكانها (بعد تغيير المشفر)")
+
+    def handle(self, *args, **options):
+        engine = get_ai_engine()
+        if engine.model is None:
+            raise CommandError("AI model is not available.")
+
+        started = time.perf_counter()
+        # إعادة البناء تكتب فوق المتجهات الحالية ولا تحذفها أولاً: العمال يبحثون بالمتجهات القديمة حتى تستبدل
+        encoded = engine.sync_embeddings(force=options['rebuild'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Encoded {encoded} books in {elapsed:.2f}s."))
+
+        if not options['skip_neighbors']:
+            started = time.perf_counter()
+            engine.rebuild_neighbors()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt neighbour table in {elapsed:.2f}s."))
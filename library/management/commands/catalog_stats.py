@@ -0,0 +1,52 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from library.catalog import CatalogSnapshot, catalog_version
+from library.models import Book
+from library.vector_store import book_content
+
+
+def measured(func):
+    """(النتيجة، الزمن بالثواني، الذاكرة المتبقية، ذروة الذاكرة) أثناء تنفيذ func"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, retained, peak
+
+
+def object_rows():
+    """الطريقة السابقة: كائن Book وقاموس لكل كتاب (قبل DataFrame)"""
+    return [
+        {'id': book.id, 'title': book.title, 'content': book_content(book.title, book.description, book.tags)}
+        for book in Book.objects.all()
+    ]
+
+
+class Command(BaseCommand):
+    help = "قياس ذاكرة لقطة الفهرس العمودية (لكل كتاب) ومقارنتها بتحميل كائنات Book وقواميسها"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        version = catalog_version()[0]
+        snapshot, elapsed, retained, peak = measured(lambda: CatalogSnapshot.load(version, options['chunk_size']))
+        count = len(snapshot)
+        self.stdout.write(f"Books: {count}  Unique titles: {len(snapshot.titles)}")
+        if not count:
+            return
+
+        self.stdout.write(
+            f"{'snapshot':<10} {snapshot.nbytes / count:8.0f} B/book  retained={retained / count:8.0f} B/book  "
+            f"peak={peak / count:8.0f} B/book  load={elapsed:.2f}s"
+        )
+        rows, elapsed, retained, peak = measured(object_rows)
+        self.stdout.write(
+            f"{'objects':<10} {'':>8}         retained={retained / count:8.0f} B/book  "
+            f"peak={peak / count:8.0f} B/book  load={elapsed:.2f}s"
+        )
@@ -0,0 +1,221 @@
+import csv
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from library.ai_engine import get_ai_engine
+from library.encoders import DEFAULT_MODEL_NAME, init_pool_encoder, pool_encode
+from library.models import Book
+from library.neighbors import rebuild_neighbors
+from library.vector_store import EmbeddingStore, book_content
+
+# الحقول التي تحدّث عند وجود الكتاب مسبقاً (available_copies لا يُمس لأنه يعكس الإعارات الجارية)
+UPDATE_FIELDS = [
+    'title', 'author', 'description', 'tags', 'category', 'total_copies', 'cover_image_url', 'updated_at',
+]
+
+
+def read_rows(path):
+    """قراءة ملف CSV أو JSONL سطراً بسطر (ذاكرة ثابتة مهما كان حجم الملف)"""
+    with open(path, encoding='utf-8-sig', newline='') as handle:
+        if path.endswith(('.jsonl', '.ndjson')):
+            for line in handle:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # سطر تالف: يحسب ضمن الصفوف المتجاهلة دون إيقاف الاستيراد
+                        yield {}
+        else:
+            yield from csv.DictReader(handle)
+
+
+def build_book(row):
+    if not isinstance(row, dict):
+        return None
+    isbn = str(row.get('isbn') or '').strip()
+    title = str(row.get('title') or '').strip()
+    if not isbn or not title:
+        return None
+    try:
+        total = int(row.get('total_copies') or 1)
+    except (TypeError, ValueError):
+        return None
+    if total < 0:
+        return None
+    return Book(
+        isbn=isbn,
+        title=title,
+        author=(row.get('author') or '').strip(),
+        description=row.get('description') or '',
+        tags=row.get('tags') or '',
+        category=row.get('category') or '',
+        total_copies=total,
+        available_copies=total,
+        cover_image_url=row.get('cover_image_url') or None,
+    )
+
+
+class Checkpoint:
+    """ملف حالة صغير يسجل عدد الصفوف المنجزة لاستئناف الاستيراد بعد الانقطاع"""
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = os.path.abspath(source)
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as handle:
+                state = json.load(handle)
+        except (OSError, ValueError):
+            return 0
+        return state['rows'] if state.get('source') == self.source else 0
+
+    def save(self, rows):
+        # كتابة ذرية: ملف مؤقت ثم إعادة تسمية
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            json.dump({'source': self.source, 'rows': rows}, handle)
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Command(BaseCommand):
+    help = "استيراد الكتب بالجملة من ملفات CSV أو JSONL مع تحديث الموجود حسب ISBN وتشفير المحتوى الجديد على دفعات"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="ملفات CSV أو JSONL")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="عدد الصفوف في كل عملية bulk_create")
+        parser.add_argument('--workers', type=int, default=0, help="عدد عمليات التشفير المتوازية (0 = داخل العملية الحالية)")
+        parser.add_argument('--encode-batch-size', type=int, default=512)
+        parser.add_argument('--no-resume', action='store_true', help="تجاهل ملف الحالة والبدء من أول الملف")
+        parser.add_argument('--skip-neighbors', action='store_true', help="عدم إعادة بناء جدول الكتب المتشابهة بعد الاستيراد")
+
+    def handle(self, *args, **options):
+        pool = encoder = None
+        if options['workers'] > 0:
+            # التشفير في العمليات الفرعية فقط: العملية الأم لا تحمّل نسخة إضافية من النموذج
+            store = EmbeddingStore(quantization=getattr(settings, 'AI_VECTOR_QUANTIZATION', None))
+            pool = ProcessPoolExecutor(
+                max_workers=options['workers'],
+                # spawn بدلاً من fork لتجنب وراثة حالة torch واتصالات قاعدة البيانات
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_pool_encoder,
+                initargs=(
+                    getattr(settings, 'AI_ENCODER_BACKEND', 'sentence-transformers'), DEFAULT_MODEL_NAME, 1,
+                    getattr(settings, 'AI_ENCODER_MAX_SEQ_LENGTH', None),
+                ),
+            )
+        else:
+            engine = get_ai_engine()
+            if engine.model is None:
+                raise CommandError("AI model is not available.")
+            store, encoder = engine.store, engine.model
+
+        changed = 0
+        try:
+            for path in options['paths']:
+                changed += self.import_file(path, store, encoder, pool, options)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if changed and not options['skip_neighbors']:
+            started = time.perf_counter()
+            rebuild_neighbors(*store.read(), getattr(settings, 'AI_NEIGHBOR_COUNT', 10))
+            self.stdout.write(f"Rebuilt neighbour table in {time.perf_counter() - started:.2f}s.")
+
+    def import_file(self, path, store, encoder, pool, options):
+        if not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+
+        checkpoint = Checkpoint(f"{path}.import-state.json", path)
+        start_row = 0 if options['no_resume'] else checkpoint.load()
+        if start_row:
+            self.stdout.write(f"Resuming {path} after row {start_row}.")
+
+        rows = islice(read_rows(path), start_row, None)
+        done = start_row
+        imported = skipped = changed = 0
+        started = time.perf_counter()
+        # الدفعات التي أرسلت للتشفير ولم تكتمل بعد (نحد عددها للحفاظ على ذاكرة ثابتة)
+        in_flight = deque()
+        max_in_flight = max(2, 2 * options['workers'])
+
+        while True:
+            chunk = list(islice(rows, options['chunk_size']))
+            if not chunk:
+                break
+
+            books = {}
+            for row in chunk:
+                book = build_book(row)
+                if book is None:
+                    skipped += 1
+                else:
+                    # تكرار ISBN داخل نفس الدفعة: الصف الأخير هو المعتمد
+                    books[book.isbn] = book
+
+            Book.objects.bulk_create(
+                list(books.values()),
+                update_conflicts=True,
+                unique_fields=['isbn'],
+                update_fields=UPDATE_FIELDS,
+            )
+            ids = dict(Book.objects.filter(isbn__in=list(books)).values_list('isbn', 'id'))
+            pending = store.stale_rows(
+                (ids[isbn], book_content(book.title, book.description, book.tags))
+                for isbn, book in books.items()
+            )
+
+            in_flight.append((done + len(chunk), self.encode(pending, encoder, pool, options['encode_batch_size'])))
+            imported += len(books)
+            changed += len(pending)
+            done += len(chunk)
+
+            while len(in_flight) > (max_in_flight if pool else 0):
+                self.finish(in_flight.popleft(), store, checkpoint)
+
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{path}: {done} rows ({(done - start_row) / elapsed:.0f} rows/s), {changed} encoded")
+
+        while in_flight:
+            self.finish(in_flight.popleft(), store, checkpoint)
+        checkpoint.clear()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{path}: imported {imported} books, skipped {skipped} invalid rows, encoded {changed} "
+            f"in {elapsed:.2f}s ({(done - start_row) / elapsed if elapsed else 0:.0f} rows/s)."
+        ))
+        return changed
+
+    def encode(self, pending, encoder, pool, batch_size):
+        """تقسيم المحتوى الجديد إلى دفعات كبيرة وإرسالها لمجموعة العمليات (أو تشفيرها مباشرة)"""
+        jobs = []
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            sentences = [content for _, content, _ in batch]
+            if pool is not None:
+                jobs.append((batch, pool.submit(pool_encode, sentences)))
+            else:
+                jobs.append((batch, encoder.encode(sentences)))
+        return jobs
+
+    def finish(self, item, store, checkpoint):
+        """كتابة متجهات دفعة مكتملة، ثم تقديم نقطة الاستئناف (بالترتيب)"""
+        rows_done, jobs = item
+        for batch, result in jobs:
+            vectors = result.result() if isinstance(result, Future) else result
+            store.write(batch, vectors)
+        checkpoint.save(rows_done)
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from library.shared_index import publish_index
+from library.vector_store import EmbeddingStore
+
+
+class Command(BaseCommand):
+    help = "نشر إصدار جديد من فهرس المتجهات كملفات مشتركة (mmap) تلتقطها العمال عند طلبها التالي دون إعادة تشغيل"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default=getattr(settings, 'AI_SHARED_INDEX_DIR', None))
+        parser.add_argument('--keep', type=int, default=getattr(settings, 'AI_SHARED_INDEX_KEEP', 3),
+                            help="عدد الإصدارات المحتفظ بها (الأقدم تحذف)")
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if not directory:
+            raise CommandError("Set AI_SHARED_INDEX_DIR or pass --directory.")
+
+        store = EmbeddingStore()
+        started = time.perf_counter()
+        quantization = getattr(settings, 'AI_VECTOR_QUANTIZATION', None)
+        name = publish_index(directory, store, quantization, options['keep'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Published index {name} to {directory} in {elapsed:.2f}s."))
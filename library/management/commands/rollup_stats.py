@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.rollups import refresh_rollups, reset_rollups
+
+
+class Command(BaseCommand):
+    help = "تحديث جداول الإحصاءات المجمعة (Rollups) من العمليات وسجلات البحث الجديدة، أو إعادة بنائها بالكامل"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="حذف التجميعات الحالية وإعادة حسابها من كل السجلات")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset_rollups()
+            self.stdout.write("Cleared existing rollups.")
+
+        started = time.perf_counter()
+        processed = refresh_rollups()
+        elapsed = time.perf_counter() - started
+        summary = ", ".join(f"{count} {name}" for name, count in processed.items())
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {summary} in {elapsed:.2f}s."))
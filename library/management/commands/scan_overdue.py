@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.overdue import scan_overdue
+
+
+class Command(BaseCommand):
+    help = "فحص الإعارات المتأخرة وتحديث غراماتها وتسجيل إشعارات التأخير اليومية (يشغل دورياً، مثلاً عبر cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="عدد الإعارات في كل عملية كتابة جماعية")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = scan_overdue(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Found {result['overdue']} overdue loans, updated {result['fines_updated']} fines, "
+            f"recorded {result['notices']} notices in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookEmbedding',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='embedding', serialize=False, to='library.book', verbose_name='الكتاب')),
+                ('content_hash', models.CharField(max_length=40, verbose_name='بصمة المحتوى')),
+                ('vector', models.BinaryField(verbose_name='المتجه')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخر تحديث')),
+            ],
+            options={
+                'verbose_name': 'متجه كتاب',
+                'verbose_name_plural': 'متجهات الكتب',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0002_bookembedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='الترتيب')),
+                ('score', models.FloatField(verbose_name='درجة التشابه')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='library.book', verbose_name='الكتاب')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='library.book', verbose_name='الكتاب المشابه')),
+            ],
+            options={
+                'verbose_name': 'كتاب مشابه',
+                'verbose_name_plural': 'الكتب المتشابهة',
+                'ordering': ['book', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('book', 'rank'), name='unique_book_neighbor_rank')],
+            },
+        ),
+    ]
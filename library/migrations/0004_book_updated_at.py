@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_bookneighbor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='آخر تعديل'),
+        ),
+    ]
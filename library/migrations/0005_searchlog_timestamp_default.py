@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_book_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='searchlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='وقت البحث'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_searchlog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='الاسم')),
+                ('position', models.BigIntegerField(default=0, verbose_name='آخر معرف')),
+                ('timestamp', models.DateTimeField(blank=True, null=True, verbose_name='آخر وقت')),
+            ],
+            options={
+                'verbose_name': 'علامة تجميع',
+                'verbose_name_plural': 'علامات التجميع',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySearchGap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query_text', models.CharField(max_length=255, verbose_name='نص البحث')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='عدد المحاولات')),
+            ],
+            options={
+                'verbose_name': 'فجوة بحث يومية',
+                'verbose_name_plural': 'فجوات البحث اليومية',
+                'constraints': [models.UniqueConstraint(fields=('query_text', 'day'), name='unique_search_gap_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyBookStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('borrows', models.PositiveIntegerField(default=0, verbose_name='عدد الإعارات')),
+                ('returns', models.PositiveIntegerField(default=0, verbose_name='عدد الإرجاعات')),
+                ('loan_seconds', models.FloatField(default=0.0, verbose_name='مجموع مدة الإعارة (ثانية)')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='library.book', verbose_name='الكتاب')),
+            ],
+            options={
+                'verbose_name': 'إحصاء يومي لكتاب',
+                'verbose_name_plural': 'الإحصاءات اليومية للكتب',
+                'constraints': [models.UniqueConstraint(fields=('book', 'day'), name='unique_book_day_stats')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_analytics_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='searchlog',
+            index=models.Index(condition=models.Q(('result_count', 0)), fields=['query_text'], name='searchlog_gap_query_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'request_date'], name='txn_status_request_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'due_date'], name='txn_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['student', 'book', 'status'], name='txn_student_book_status_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='reserved_copy',
+            field=models.BooleanField(default=False, verbose_name='نسخة محجوزة'),
+        ),
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('priority', models.SmallIntegerField(default=0, verbose_name='الأولوية')),
+                ('status', models.CharField(choices=[('waiting', 'في قائمة الانتظار'), ('allocated', 'خصصت له نسخة'), ('cancelled', 'ملغى')], default='waiting', max_length=20, verbose_name='الحالة')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الحجز')),
+                ('allocated_at', models.DateTimeField(blank=True, null=True, verbose_name='تاريخ التخصيص')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='library.book', verbose_name='الكتاب')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='library.studentprofile', verbose_name='الطالب')),
+                ('transaction', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservation', to='library.transaction', verbose_name='طلب الاستعارة')),
+            ],
+            options={
+                'verbose_name': 'حجز',
+                'verbose_name_plural': 'الحجوزات',
+                'ordering': ['book', '-priority', 'created_at'],
+                'indexes': [models.Index(fields=['book', 'status', '-priority', 'created_at'], name='reservation_queue_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'waiting')), fields=('book', 'student'), name='unique_waiting_reservation')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_reservation_waitlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='fine_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=8, verbose_name='الغرامة'),
+        ),
+        migrations.CreateModel(
+            name='OverdueNotice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notice_date', models.DateField(verbose_name='تاريخ الإشعار')),
+                ('days_overdue', models.PositiveIntegerField(verbose_name='أيام التأخير')),
+                ('fine_amount', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='الغرامة')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='وقت التسجيل')),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='overdue_notices', to='library.transaction', verbose_name='الإعارة')),
+            ],
+            options={
+                'verbose_name': 'إشعار تأخير',
+                'verbose_name_plural': 'إشعارات التأخير',
+                'ordering': ['-notice_date'],
+                'constraints': [models.UniqueConstraint(fields=('transaction', 'notice_date'), name='unique_overdue_notice_day')],
+            },
+        ),
+    ]
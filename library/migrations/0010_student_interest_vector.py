@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0009_overdue_fines'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentprofile',
+            name='interest_weight',
+            field=models.FloatField(default=0.0, verbose_name='وزن البصمة'),
+        ),
+        # الحقل النصي القديم لم يستخدم قط؛ نعيد إنشاءه بدلاً من تحويل نوعه (text -> bytea غير ممكن في PostgreSQL)
+        migrations.RemoveField(
+            model_name='studentprofile',
+            name='interest_fingerprint',
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='interest_fingerprint',
+            field=models.BinaryField(blank=True, null=True, verbose_name='البصمة المعرفية'),
+        ),
+    ]
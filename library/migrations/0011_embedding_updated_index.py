@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0010_student_interest_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookembedding',
+            index=models.Index(fields=['updated_at'], name='embedding_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:23
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_embedding_updated_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(django.db.models.functions.text.Replace('isbn', models.Value('-'), models.Value('')), name='book_isbn_code_idx'),
+        ),
+    ]
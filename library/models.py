@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Replace
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
@@ -30,6 +32,8 @@ class Book(models.Model):
     cover_image_url = models.URLField(blank=True, null=True, verbose_name="رابط الغلاف")
     
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الإضافة")
+    # يستخدم لمعرفة الكتب المعدّلة منذ آخر تحديث للفهارس (لا يتغير عند حفظ المخزون فقط عبر update_fields)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="آخر تعديل")
 
     def __str__(self):
         return self.title
@@ -38,6 +42,10 @@ class Book(models.Model):
         verbose_name = "كتاب"
         verbose_name_plural = "الكتب"
         ordering = ['-created_at']
+        indexes = [
+            # البحث برقم ISBN دون شرطات (نفس التعبير المستخدم في SmartLibraryAI._match_isbn)
+            models.Index(Replace('isbn', Value('-'), Value('')), name='book_isbn_code_idx'),
+        ]
 
 
 # ==========================================
@@ -51,8 +59,10 @@ class StudentProfile(models.Model):
     student_id = models.CharField(max_length=20, unique=True, verbose_name="الرقم الجامعي")
     major = models.CharField(max_length=100, verbose_name="التخصص الأكاديمي")
     
-    # البصمة المعرفية (Interest Fingerprint): يمكن استخدامها مستقبلاً لتخزين اهتمامات الطالب كمتجه
-    interest_fingerprint = models.TextField(blank=True, verbose_name="البصمة المعرفية")
+    # البصمة المعرفية (Interest Fingerprint): متوسط موزون لمتجهات الكتب التي استعارها الطالب أو قيّمها عالياً
+    # (float32 كبايتات خام بنفس صيغة BookEmbedding)، و interest_weight مجموع الأوزان الداخلة في المتوسط
+    interest_fingerprint = models.BinaryField(null=True, blank=True, verbose_name="البصمة المعرفية")
+    interest_weight = models.FloatField(default=0.0, verbose_name="وزن البصمة")
 
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.student_id})"
@@ -65,6 +75,38 @@ class StudentProfile(models.Model):
 # ==========================================
 # 3. جدول العمليات والإعارة (Transactions)
 # ==========================================
+# مدة الإعارة الافتراضية
+LOAN_PERIOD = timedelta(days=14)
+
+# وزن الاستعارة في بصمة اهتمامات الطالب، والتقييم العالي (4 أو 5) يضيف وزناً أكبر
+BORROW_INTEREST_WEIGHT = 1.0
+
+
+def rating_interest_weight(rating):
+    """التقييم 4 يضيف وزن 1 والتقييم 5 يضيف وزن 2؛ ما دون ذلك لا يؤثر"""
+    return float(max((rating or 0) - 3, 0))
+
+
+class NoCopiesAvailable(Exception):
+    """لا توجد نسخة متاحة من الكتاب لإتمام الإعارة"""
+
+
+class TransactionQuerySet(models.QuerySet):
+    """استعلامات التأخير في SQL مباشرة بدلاً من تقييم is_overdue لكل سطر في Python"""
+
+    def overdue(self, now=None):
+        """الإعارات الجارية المتجاوزة لموعدها: نطاق واحد على الفهرس (status, due_date)"""
+        return self.filter(status='active', due_date__lt=now or timezone.now())
+
+    def with_overdue(self, now=None):
+        """إضافة عمود overdue (منطقي) لكل سطر، قابل للفرز والتصفية في قاعدة البيانات"""
+        return self.annotate(overdue=models.Case(
+            models.When(status='active', due_date__lt=now or timezone.now(), then=models.Value(True)),
+            default=models.Value(False),
+            output_field=models.BooleanField(),
+        ))
+
+
 class Transaction(models.Model):
     """
     يسجل حركة الكتب بين المكتبة والطلاب.
@@ -93,33 +135,92 @@ class Transaction(models.Model):
     # تقييم الطالب (لتحسين التوصيات مستقبلاً)
     user_rating = models.IntegerField(null=True, blank=True, verbose_name="التقييم (1-5)")
 
+    # طلب أنشئ من قائمة الانتظار وخصمت نسخته مسبقاً (محجوزة للطالب حتى الموافقة أو الرفض)
+    reserved_copy = models.BooleanField(default=False, verbose_name="نسخة محجوزة")
+
+    # الغرامة المستحقة على التأخير (يحدّثها الأمر scan_overdue)
+    fine_amount = models.DecimalField(max_digits=8, decimal_places=2, default=0, verbose_name="الغرامة")
+
+    objects = TransactionQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # التقييم كما قرئ من قاعدة البيانات، لمعرفة هل تغير عند الحفظ (لتحديث بصمة الطالب)
+        instance._loaded_rating = instance.__dict__.get('user_rating')
+        return instance
+
     def save(self, *args, **kwargs):
         """
         تجاوز دالة الحفظ لتطبيق المنطق التلقائي (Business Logic Automation).
+        المخزون يعدَّل بتحديث شرطي داخل قاعدة البيانات (F Expressions) ضمن معاملة واحدة،
+        فلا تضيع التحديثات عند الموافقات أو الإرجاعات المتزامنة ولا تعار نسخة غير موجودة.
+        """
+        inventory_changed = False
+        borrowed = False
+        with transaction.atomic():
+            # الحالة 1: الموافقة على الطلب وتسليم الكتاب (تحول من أي حالة إلى Active)
+            # نتأكد أننا لم نحدد تاريخ الإعارة مسبقاً لمنع الخصم المزدوج
+            if self.status == 'active' and not self.borrow_date:
+                now = timezone.now()
+                dates = {'borrow_date': now, 'due_date': now + LOAN_PERIOD}
+                # طلب من قائمة الانتظار: نسخته خصمت من المخزون عند تخصيصها
+                if self.reserved_copy and self._claim(
+                    {'borrow_date__isnull': True, 'reserved_copy': True}, reserved_copy=False, **dates,
+                ):
+                    inventory_changed = borrowed = True
+                elif self._claim({'borrow_date__isnull': True}, **dates):
+                    # خصم نسخة من المخزون فقط إن كانت هناك نسخة متاحة (الشرط في جملة WHERE نفسها)
+                    taken = Book.objects.filter(pk=self.book_id, available_copies__gt=0) \
+                        .update(available_copies=models.F('available_copies') - 1)
+                    if not taken:
+                        self.borrow_date = self.due_date = None
+                        raise NoCopiesAvailable(f"No copies of book {self.book_id} are available.")
+                    inventory_changed = borrowed = True
+
+            # الحالة 2: إرجاع الكتاب (تحول إلى Returned)
+            # نتأكد أننا لم نحدد تاريخ الإرجاع مسبقاً
+            if self.status == 'returned' and not self.return_date:
+                if self._claim({'return_date__isnull': True}, return_date=timezone.now()):
+                    # إعادة النسخة للمخزون (دون تجاوز العدد الكلي) ثم إعطاؤها للتالي في قائمة الانتظار
+                    Book.objects.filter(pk=self.book_id, available_copies__lt=models.F('total_copies')) \
+                        .update(available_copies=models.F('available_copies') + 1)
+                    Reservation.allocate_next(self.book_id)
+                    inventory_changed = True
+
+            # الحالة 3: رفض طلب يحمل نسخة محجوزة: تعود النسخة للتالي في قائمة الانتظار
+            if self.status == 'rejected' and self.reserved_copy:
+                if self._claim({'borrow_date__isnull': True, 'reserved_copy': True}, reserved_copy=False):
+                    Book.objects.filter(pk=self.book_id, available_copies__lt=models.F('total_copies')) \
+                        .update(available_copies=models.F('available_copies') + 1)
+                    Reservation.allocate_next(self.book_id)
+                    inventory_changed = True
+
+            # أثر العملية على بصمة اهتمامات الطالب (تقرؤه إشارة post_save وتطبقه بعد اعتماد المعاملة)
+            self._interest_weight = (BORROW_INTEREST_WEIGHT if borrowed else 0.0) \
+                + rating_interest_weight(self.user_rating) - rating_interest_weight(getattr(self, '_loaded_rating', None))
+
+            # حفظ التغييرات
+            super().save(*args, **kwargs)
+            self._loaded_rating = self.user_rating
+
+        # تحديث نسخة الكتاب المحملة في الذاكرة (إن وجدت) بالقيمة الفعلية بعد التعديل
+        if inventory_changed and Transaction.book.is_cached(self):
+            self.book.refresh_from_db(fields=['available_copies'])
+
+    def _claim(self, condition, **values):
         """
-        # الحالة 1: الموافقة على الطلب وتسليم الكتاب (تحول من أي حالة إلى Active)
-        # نتأكد أننا لم نحدد تاريخ الإعارة مسبقاً لمنع الخصم المزدوج
-        if self.status == 'active' and not self.borrow_date:
-            self.borrow_date = timezone.now()
-            # مدة الإعارة الافتراضية 14 يوماً
-            self.due_date = timezone.now() + timedelta(days=14)
-            
-            # خصم نسخة من المخزون
-            if self.book.available_copies > 0:
-                self.book.available_copies -= 1
-                self.book.save()
-            
-        # الحالة 2: إرجاع الكتاب (تحول إلى Returned)
-        # نتأكد أننا لم نحدد تاريخ الإرجاع مسبقاً
-        if self.status == 'returned' and not self.return_date:
-            self.return_date = timezone.now()
-            
-            # إعادة النسخة للمخزون
-            self.book.available_copies += 1
-            self.book.save()
-            
-        # حفظ التغييرات
-        super().save(*args, **kwargs)
+        حجز تغيير الحالة قبل تعديل المخزون: نكتب القيم فقط إن كان الصف ما زال يحقق condition في قاعدة البيانات.
+        إذا سبقتنا عملية أخرى لنفس الطلب نأخذ قيمها ونرجع False حتى لا يعدَّل المخزون مرتين.
+        """
+        if not self._state.adding:
+            claimed = Transaction.objects.filter(pk=self.pk, **condition).update(**values)
+            if not claimed:
+                self.refresh_from_db(fields=list(values))
+                return False
+        for field, value in values.items():
+            setattr(self, field, value)
+        return True
 
     @property
     def is_overdue(self):
@@ -135,6 +236,13 @@ class Transaction(models.Model):
         verbose_name = "عملية إعارة"
         verbose_name_plural = "عمليات الإعارة"
         ordering = ['-request_date']
+        indexes = [
+            # قوائم لوحة الإحصاءات: الطلبات المعلقة حسب تاريخ الطلب، والإعارات الجارية حسب الاستحقاق
+            models.Index(fields=['status', 'request_date'], name='txn_status_request_idx'),
+            models.Index(fields=['status', 'due_date'], name='txn_status_due_idx'),
+            # التحقق من وجود طلب قائم لنفس الطالب والكتاب (طلب الاستعارة وصفحة الكتاب)
+            models.Index(fields=['student', 'book', 'status'], name='txn_student_book_status_idx'),
+        ]
 
 
 # ==========================================
@@ -147,7 +255,8 @@ class SearchLog(models.Model):
     """
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="المستخدم")
     query_text = models.CharField(max_length=255, verbose_name="نص البحث")
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name="وقت البحث")
+    # وقت البحث الفعلي يحدده المخزن المؤقت (السجلات تكتب على دفعات لاحقاً)
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name="وقت البحث")
     result_count = models.IntegerField(default=0, verbose_name="عدد النتائج")
 
     def __str__(self):
@@ -156,4 +265,240 @@ class SearchLog(models.Model):
     class Meta:
         verbose_name = "سجل بحث"
         verbose_name_plural = "سجلات البحث"
-        ordering = ['-timestamp']
\ No newline at end of file
+        ordering = ['-timestamp']
+        indexes = [
+            # فهرس جزئي (Partial Index) لعمليات البحث الفاشلة فقط، وهي ما يحتاجه تحليل الفجوة
+            models.Index(fields=['query_text'], condition=models.Q(result_count=0), name='searchlog_gap_query_idx'),
+        ]
+
+# ==========================================
+# 5. مخزن متجهات الكتب (Book Embeddings)
+# ==========================================
+class BookEmbedding(models.Model):
+    """
+    يخزن المتجه الدلالي (Embedding) لكل كتاب حتى لا نعيد تشفير الفهرس كاملاً مع كل بحث.
+    البصمة (content_hash) تحسب من العنوان والوصف والوسوم، وتتغير فقط عند تغيّر هذا المحتوى.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='embedding', verbose_name="الكتاب")
+    content_hash = models.CharField(max_length=40, verbose_name="بصمة المحتوى")
+    # متجه float32 مطبّع (Normalized) مخزن كبايتات خام
+    vector = models.BinaryField(verbose_name="المتجه")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="آخر تحديث")
+
+    def __str__(self):
+        return f"Embedding: {self.book_id}"
+
+    class Meta:
+        verbose_name = "متجه كتاب"
+        verbose_name_plural = "متجهات الكتب"
+        indexes = [
+            # إصدار المخزن (Max) والتغييرات منذ آخر فهرس منشور (updated_at > ...)
+            models.Index(fields=['updated_at'], name='embedding_updated_idx'),
+        ]
+
+
+# ==========================================
+# 6. جدول الكتب المتشابهة (Precomputed Neighbours)
+# ==========================================
+class BookNeighbor(models.Model):
+    """
+    قائمة أقرب الكتب دلالياً لكل كتاب، محسوبة مسبقاً من مخزن المتجهات.
+    تسمح لصفحة تفاصيل الكتاب بعرض التوصيات باستعلام واحد دون أي استدعاء للنموذج.
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='neighbors', verbose_name="الكتاب")
+    neighbor = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='neighbor_of', verbose_name="الكتاب المشابه")
+    rank = models.PositiveSmallIntegerField(verbose_name="الترتيب")
+    score = models.FloatField(verbose_name="درجة التشابه")
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.neighbor_id} ({self.score:.2f})"
+
+    class Meta:
+        verbose_name = "كتاب مشابه"
+        verbose_name_plural = "الكتب المتشابهة"
+        ordering = ['book', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='unique_book_neighbor_rank'),
+        ]
+
+
+# ==========================================
+# 7. جداول الإحصاءات المجمعة (Analytics Rollups)
+# ==========================================
+class DailyBookStats(models.Model):
+    """
+    إحصاءات يومية لكل كتاب تحدَّث تزايدياً من العمليات الجديدة فقط،
+    حتى لا تمسح لوحة الإحصاءات جدول العمليات كاملاً مع كل زيارة.
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='daily_stats', verbose_name="الكتاب")
+    day = models.DateField(verbose_name="اليوم")
+    # عدد الطلبات المنشأة في هذا اليوم (بكل حالاتها)
+    borrows = models.PositiveIntegerField(default=0, verbose_name="عدد الإعارات")
+    # عدد الإرجاعات في هذا اليوم ومجموع مدد إعارتها بالثواني (لحساب المتوسط)
+    returns = models.PositiveIntegerField(default=0, verbose_name="عدد الإرجاعات")
+    loan_seconds = models.FloatField(default=0.0, verbose_name="مجموع مدة الإعارة (ثانية)")
+
+    def __str__(self):
+        return f"{self.book_id} @ {self.day}: {self.borrows}"
+
+    class Meta:
+        verbose_name = "إحصاء يومي لكتاب"
+        verbose_name_plural = "الإحصاءات اليومية للكتب"
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'day'], name='unique_book_day_stats'),
+        ]
+
+
+class DailySearchGap(models.Model):
+    """عدد محاولات البحث التي لم تجد نتائج، لكل نص بحث في كل يوم"""
+    query_text = models.CharField(max_length=255, verbose_name="نص البحث")
+    day = models.DateField(verbose_name="اليوم")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="عدد المحاولات")
+
+    def __str__(self):
+        return f"{self.query_text} @ {self.day}: {self.attempts}"
+
+    class Meta:
+        verbose_name = "فجوة بحث يومية"
+        verbose_name_plural = "فجوات البحث اليومية"
+        constraints = [
+            models.UniqueConstraint(fields=['query_text', 'day'], name='unique_search_gap_day'),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """
+    آخر نقطة وصل إليها تجميع كل جدول (Watermark):
+    position لآخر معرف (id) معالج، وtimestamp لآخر وقت معالج للحقول الزمنية.
+    """
+    name = models.CharField(max_length=50, primary_key=True, verbose_name="الاسم")
+    position = models.BigIntegerField(default=0, verbose_name="آخر معرف")
+    timestamp = models.DateTimeField(null=True, blank=True, verbose_name="آخر وقت")
+
+    def __str__(self):
+        return f"{self.name}: {self.position} / {self.timestamp}"
+
+    class Meta:
+        verbose_name = "علامة تجميع"
+        verbose_name_plural = "علامات التجميع"
+
+
+# ==========================================
+# 8. قائمة انتظار الحجوزات (Reservation Waitlist)
+# ==========================================
+class Reservation(models.Model):
+    """
+    قائمة انتظار لكل كتاب نفدت نسخه: الأولوية الأعلى أولاً، ثم الأقدم (FIFO).
+    عند إرجاع نسخة تخصص تلقائياً للتالي في القائمة على شكل طلب استعارة معلق بنسخة محجوزة.
+    """
+    STATUS_CHOICES = [
+        ('waiting', 'في قائمة الانتظار'),
+        ('allocated', 'خصصت له نسخة'),
+        ('cancelled', 'ملغى'),
+    ]
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reservations', verbose_name="الكتاب")
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='reservations', verbose_name="الطالب")
+    # الأولوية الأعلى تخدم أولاً (0 للجميع افتراضياً)
+    priority = models.SmallIntegerField(default=0, verbose_name="الأولوية")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting', verbose_name="الحالة")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الحجز")
+    allocated_at = models.DateTimeField(null=True, blank=True, verbose_name="تاريخ التخصيص")
+    transaction = models.OneToOneField(
+        Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='reservation', verbose_name="طلب الاستعارة",
+    )
+
+    QUEUE_ORDER = ('-priority', 'created_at', 'pk')
+
+    def __str__(self):
+        return f"{self.book_id} <- {self.student_id} ({self.get_status_display()})"
+
+    @classmethod
+    def queue(cls, book_id):
+        return cls.objects.filter(book_id=book_id, status='waiting').order_by(*cls.QUEUE_ORDER)
+
+    def position(self):
+        """ترتيب الحجز في قائمة الانتظار (1 = التالي)؛ عدّ على نطاق من الفهرس دون قراءة القائمة كاملة"""
+        ahead = models.Q(priority__gt=self.priority) \
+            | models.Q(priority=self.priority, created_at__lt=self.created_at) \
+            | models.Q(priority=self.priority, created_at=self.created_at, pk__lt=self.pk)
+        return Reservation.queue(self.book_id).filter(ahead).count() + 1
+
+    @classmethod
+    def allocate_next(cls, book_id):
+        """
+        تخصيص نسخة متاحة لأول طالب مؤهل في قائمة انتظار الكتاب.
+        التالي في القائمة يُقرأ من الفهرس (book, status, priority, created_at) بكلفة O(log n).
+        يرجع طلب الاستعارة المنشأ (معلق بنسخة محجوزة) أو None.
+        """
+        if not cls.queue(book_id).exists():
+            return None
+
+        with transaction.atomic():
+            taken = Book.objects.filter(pk=book_id, available_copies__gt=0) \
+                .update(available_copies=models.F('available_copies') - 1)
+            if not taken:
+                return None
+
+            while True:
+                reservation = cls.queue(book_id).first()
+                if reservation is None:
+                    # لم يبق أحد مؤهل: نعيد النسخة للمخزون
+                    Book.objects.filter(pk=book_id).update(available_copies=models.F('available_copies') + 1)
+                    return None
+                # حجز السطر نفسه بشرط أنه ما زال منتظراً (قد تسبقنا عملية أخرى)
+                if not cls.objects.filter(pk=reservation.pk, status='waiting').update(status='allocated', allocated_at=timezone.now()):
+                    continue
+                # الطالب الذي لديه طلب قائم لنفس الكتاب لم يعد بحاجة للحجز
+                if Transaction.objects.filter(
+                    book_id=book_id, student_id=reservation.student_id, status__in=['pending', 'active'],
+                ).exists():
+                    cls.objects.filter(pk=reservation.pk).update(status='cancelled')
+                    continue
+
+                loan = Transaction.objects.create(
+                    book_id=book_id, student_id=reservation.student_id, status='pending', reserved_copy=True,
+                )
+                cls.objects.filter(pk=reservation.pk).update(transaction=loan)
+                return loan
+
+    class Meta:
+        verbose_name = "حجز"
+        verbose_name_plural = "الحجوزات"
+        ordering = ['book', '-priority', 'created_at']
+        indexes = [
+            # الوصول للتالي في قائمة كتاب معين وعدّ من قبله
+            models.Index(fields=['book', 'status', '-priority', 'created_at'], name='reservation_queue_idx'),
+        ]
+        constraints = [
+            # حجز منتظر واحد فقط لكل طالب على نفس الكتاب
+            models.UniqueConstraint(
+                fields=['book', 'student'], condition=models.Q(status='waiting'), name='unique_waiting_reservation',
+            ),
+        ]
+
+
+# ==========================================
+# 9. إشعارات التأخير (Overdue Notices)
+# ==========================================
+class OverdueNotice(models.Model):
+    """
+    إشعار تأخير يسجله الأمر scan_overdue لكل إعارة متأخرة مرة واحدة في اليوم،
+    مع عدد أيام التأخير والغرامة المحسوبة وقت الفحص.
+    """
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='overdue_notices', verbose_name="الإعارة")
+    notice_date = models.DateField(verbose_name="تاريخ الإشعار")
+    days_overdue = models.PositiveIntegerField(verbose_name="أيام التأخير")
+    fine_amount = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="الغرامة")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="وقت التسجيل")
+
+    def __str__(self):
+        return f"{self.transaction_id} @ {self.notice_date}: {self.days_overdue} يوم"
+
+    class Meta:
+        verbose_name = "إشعار تأخير"
+        verbose_name_plural = "إشعارات التأخير"
+        ordering = ['-notice_date']
+        constraints = [
+            models.UniqueConstraint(fields=['transaction', 'notice_date'], name='unique_overdue_notice_day'),
+        ]
@@ -0,0 +1,100 @@
+import numpy as np
+from django.db import transaction
+
+from .models import BookNeighbor
+
+
+def compute_neighbors(matrix, rows, k, block=1024):
+    """
+    حساب أقرب k كتاب للصفوف المطلوبة بضرب مصفوفات مجزّأ (Blocked Matrix Multiply):
+    كل كتلة من الصفوف تُضرب في المصفوفة كاملة مرة واحدة، ثم argpartition لأفضل k.
+    يرجع أزواج (row, positions, scores) حيث positions مرتبة تنازلياً حسب التشابه.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    k = min(k, len(matrix) - 1)
+    if k < 1:
+        return
+
+    for start in range(0, len(rows), block):
+        block_rows = rows[start:start + block]
+        sims = matrix[block_rows] @ matrix.T
+        # استبعاد الكتاب نفسه من قائمته
+        sims[np.arange(len(block_rows)), block_rows] = -np.inf
+
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        for row, positions, scores in zip(block_rows, top, top_scores):
+            yield row, positions, scores
+
+
+def _positions(ids, book_ids):
+    """مواقع الكتب المطلوبة داخل مصفوفة المعرفات المرتبة (مع تجاهل غير الموجودة)"""
+    book_ids = np.asarray(sorted(book_ids), dtype=np.int64)
+    if not len(ids) or not len(book_ids):
+        return np.empty(0, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(ids, book_ids), len(ids) - 1)
+    return positions[ids[positions] == book_ids]
+
+
+def _write_rows(ids, matrix, rows, k, batch_size=5000):
+    batch = []
+    for row, positions, scores in compute_neighbors(matrix, rows, k):
+        batch.extend(
+            BookNeighbor(book_id=int(ids[row]), neighbor_id=int(ids[position]), rank=rank, score=float(score))
+            for rank, (position, score) in enumerate(zip(positions, scores))
+        )
+        if len(batch) >= batch_size:
+            BookNeighbor.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        BookNeighbor.objects.bulk_create(batch)
+
+
+@transaction.atomic
+def rebuild_neighbors(ids, matrix, k):
+    """إعادة بناء جدول الكتب المتشابهة بالكامل"""
+    BookNeighbor.objects.all().delete()
+    _write_rows(ids, matrix, np.arange(len(ids)), k)
+
+
+@transaction.atomic
+def fill_neighbors(ids, matrix, book_ids, k):
+    """إعادة حساب قوائم كتب محددة فقط (دون المرور على قوائم بقية الكتب)"""
+    BookNeighbor.objects.filter(book_id__in=list(book_ids)).delete()
+    rows = _positions(ids, book_ids)
+    _write_rows(ids, matrix, rows, k)
+    return len(rows)
+
+
+@transaction.atomic
+def refresh_neighbors(ids, matrix, changed_ids, stale_ids=(), k=10):
+    """
+    تحديث تدريجي بعد تغيّر بعض الكتب، ويعاد حساب قوائم الكتب المتأثرة فقط:
+    - الكتب التي تغيّر متجهها (changed_ids).
+    - الكتب التي كانت تضم كتاباً متغيراً أو محذوفاً في قائمتها (stale_ids للمحذوفة).
+    - الكتب التي أصبح أحد الكتب المتغيرة أقرب إليها من آخر عنصر في قائمتها.
+    """
+    changed_ids = list(changed_ids)
+    positions = _positions(ids, changed_ids)
+
+    affected = set(int(ids[p]) for p in positions) | set(stale_ids)
+    affected.update(
+        BookNeighbor.objects.filter(neighbor_id__in=changed_ids).values_list('book_id', flat=True)
+    )
+
+    if len(positions):
+        # درجة آخر جار لكل كتاب (القوائم الأقصر من k تعتبر ناقصة دائماً)
+        kth_scores = np.full(len(ids), -np.inf, dtype=np.float32)
+        last = BookNeighbor.objects.filter(rank=min(k, len(ids) - 1) - 1).values_list('book_id', 'score')
+        last_ids, last_scores = np.array(list(last), dtype=np.float64).reshape(-1, 2).T
+        last_positions = np.minimum(np.searchsorted(ids, last_ids), len(ids) - 1)
+        found = ids[last_positions] == last_ids
+        kth_scores[last_positions[found]] = last_scores[found]
+        best = (matrix @ matrix[positions].T).max(axis=1)
+        affected.update(int(book_id) for book_id in ids[best > kth_scores])
+
+    return fill_neighbors(ids, matrix, affected, k)
@@ -0,0 +1,66 @@
+import math
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OverdueNotice, Transaction
+
+
+# ==========================================
+# فحص التأخير وحساب الغرامات (Overdue Scan)
+# ==========================================
+def compute_fine(days_overdue):
+    """الغرامة = أيام التأخير × الغرامة اليومية، بحد أقصى LIBRARY_FINE_CAP"""
+    per_day = Decimal(str(getattr(settings, 'LIBRARY_FINE_PER_DAY', '1.00')))
+    cap = Decimal(str(getattr(settings, 'LIBRARY_FINE_CAP', '30.00')))
+    return min(per_day * days_overdue, cap)
+
+
+def scan_overdue(now=None, batch_size=1000):
+    """
+    إيجاد الإعارات المتأخرة باستعلام نطاق واحد على الفهرس (status, due_date)،
+    ثم تحديث غراماتها بـ bulk_update وتسجيل إشعار يومي لكل منها بـ bulk_create.
+    يرجع عدد الإعارات المتأخرة، والغرامات التي تغيرت، والإشعارات الجديدة.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    overdue = Transaction.objects.overdue(now).order_by().only('pk', 'due_date', 'fine_amount')
+
+    found = updated = notified = 0
+    batch = []
+    for loan in overdue.iterator(chunk_size=batch_size):
+        batch.append(loan)
+        if len(batch) >= batch_size:
+            changed, created = _apply(batch, now, today, batch_size)
+            found, updated, notified = found + len(batch), updated + changed, notified + created
+            batch = []
+    if batch:
+        changed, created = _apply(batch, now, today, batch_size)
+        found, updated, notified = found + len(batch), updated + changed, notified + created
+
+    return {'overdue': found, 'fines_updated': updated, 'notices': notified}
+
+
+def _apply(loans, now, today, batch_size):
+    notices, changed = [], []
+    for loan in loans:
+        # أي جزء من يوم تأخير يحسب يوماً كاملاً
+        days = math.ceil((now - loan.due_date).total_seconds() / 86400)
+        fine = compute_fine(days)
+        notices.append(OverdueNotice(transaction_id=loan.pk, notice_date=today, days_overdue=days, fine_amount=fine))
+        if loan.fine_amount != fine:
+            loan.fine_amount = fine
+            changed.append(loan)
+
+    # إشعار واحد لكل إعارة في اليوم: إعادة تشغيل الفحص في نفس اليوم لا تكرر الإشعارات
+    notified = set(OverdueNotice.objects.filter(
+        transaction_id__in=[loan.pk for loan in loans], notice_date=today,
+    ).values_list('transaction_id', flat=True))
+    notices = [notice for notice in notices if notice.transaction_id not in notified]
+
+    with transaction.atomic():
+        Transaction.objects.bulk_update(changed, ['fine_amount'], batch_size=batch_size)
+        OverdueNotice.objects.bulk_create(notices, batch_size=batch_size, ignore_conflicts=True)
+    return len(changed), len(notices)
@@ -0,0 +1,93 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """
+    توحيد المسافات في نص البحث لزيادة نسبة الإصابة في الذاكرة المؤقتة.
+    حالة الأحرف تبقى كما هي: النموذج متعدد اللغات يميزها، فتوحيدها يغير متجه الاستعلام وترتيب النتائج.
+    """
+    return ' '.join(str(query).split())
+
+
+class QueryCache:
+    """
+    ذاكرة مؤقتة من نوع LRU بحجم محدود ومدة صلاحية (TTL) لكل عنصر، مع عدادات الإصابة والإخفاق.
+    يمكن دعمها اختيارياً بإطار التخزين المؤقت في Django (cache_alias) لتتشاركها جميع العمليات:
+    البحث يتم محلياً أولاً ثم في الذاكرة المشتركة.
+    """
+
+    def __init__(self, max_size=1024, ttl=3600, cache_alias=None, prefix='sls'):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shared(self):
+        if not self.cache_alias:
+            return None
+        from django.core.cache import caches
+        return caches[self.cache_alias]
+
+    def _shared_key(self, key):
+        # مفاتيح قصيرة وآمنة لجميع خوادم التخزين (مثل Memcached)
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return f"{self.prefix}:{digest}"
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        shared = self._shared()
+        if shared is not None:
+            value = shared.get(self._shared_key(key))
+            if value is not None:
+                self._store_local(key, value, now)
+                with self._lock:
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._store_local(key, value, time.monotonic())
+        shared = self._shared()
+        if shared is not None:
+            shared.set(self._shared_key(key), value, self.ttl)
+
+    def _store_local(self, key, value, now):
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,188 @@
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, FloatField, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyBookStats, DailySearchGap, RollupWatermark, SearchLog, Transaction
+
+
+class RollupConflict(Exception):
+    """عملية أخرى نقلت علامة التجميع أثناء عملنا؛ نتراجع حتى لا تحسب الصفوف مرتين"""
+
+
+_refresh_lock = threading.Lock()
+
+
+# ==========================================
+# 1. علامات التجميع (Watermarks)
+# ==========================================
+def _watermark(name):
+    mark, _ = RollupWatermark.objects.get_or_create(name=name)
+    return mark
+
+
+def _advance(mark, **values):
+    """نقل العلامة بشرط أنها لم تتغير منذ قراءتها (Optimistic Locking)"""
+    updated = RollupWatermark.objects.filter(
+        name=mark.name, position=mark.position, timestamp=mark.timestamp,
+    ).update(**values)
+    if not updated:
+        raise RollupConflict(mark.name)
+    for field, value in values.items():
+        setattr(mark, field, value)
+
+
+def _accumulate(model, key_fields, unique_fields, rows):
+    """
+    إضافة القيم الجديدة ({key: {field: value}}) إلى صفوف التجميع الموجودة
+    ثم كتابتها كلها بعملية upsert واحدة.
+    """
+    if not rows:
+        return
+    lookup = {f'{field}__in': {key[i] for key in rows} for i, field in enumerate(key_fields)}
+    existing = {
+        tuple(getattr(obj, field) for field in key_fields): obj
+        for obj in model.objects.filter(**lookup)
+    }
+    fields = sorted({field for values in rows.values() for field in values})
+    objects = []
+    for key, values in rows.items():
+        current = existing.get(key)
+        totals = {field: getattr(current, field) if current else 0 for field in fields}
+        for field, value in values.items():
+            totals[field] += value
+        objects.append(model(**dict(zip(key_fields, key)), **totals))
+    model.objects.bulk_create(
+        objects, batch_size=1000, update_conflicts=True, unique_fields=unique_fields, update_fields=fields,
+    )
+
+
+# ==========================================
+# 2. التجميع التزايدي (Incremental Rollups)
+# ==========================================
+def _count_by_day(name, queryset, key_field, date_field, model, count_field, chunk_size):
+    """
+    عدّ الصفوف الجديدة (معرفها أكبر من العلامة) لكل (key_field, يوم) وإضافتها إلى model.
+    نمر على نطاقات متتالية من المفتاح الأساسي حتى تبقى كل خطوة صغيرة مهما كبر الجدول.
+    المعرفات تحجز قبل تثبيت المعاملة (تسلسلات PostgreSQL أو الكتابة المتزامنة)، فقد يثبت صف بمعرف أصغر
+    بعد أن تتجاوزه العلامة. لذلك نتوقف عند آخر صف أقدم من ANALYTICS_ROLLUP_LAG (كما في rollup_returns):
+    أي معرف أصغر منه حجز قبل ذلك الصف بأكثر من المهلة فمعاملته ثبتت.
+    """
+    mark = _watermark(name)
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'ANALYTICS_ROLLUP_LAG', 60))
+    # بحث في نطاق المفتاح الأساسي بعد العلامة فقط (الصفوف التي سنعالجها على أي حال)
+    last = queryset.filter(id__gt=mark.position).aggregate(
+        last=Max('id', filter=Q(**{f'{date_field}__lte': cutoff})),
+    )['last'] or 0
+    processed = 0
+    while mark.position < last:
+        end = min(mark.position + chunk_size, last)
+        grouped = queryset.filter(id__gt=mark.position, id__lte=end) \
+            .annotate(day=TruncDate(date_field)) \
+            .values(key_field, 'day') \
+            .annotate(count=Count('id'))
+        with transaction.atomic():
+            rows = {(item[key_field], item['day']): {count_field: item['count']} for item in grouped}
+            _accumulate(model, (key_field, 'day'), [key_field.removesuffix('_id'), 'day'], rows)
+            _advance(mark, position=end)
+        processed += sum(values[count_field] for values in rows.values())
+    return processed
+
+
+def rollup_borrows(chunk_size=50000):
+    """عدد الطلبات لكل كتاب في كل يوم (من العمليات الجديدة فقط)"""
+    return _count_by_day(
+        'transactions', Transaction.objects.all(), 'book_id', 'request_date', DailyBookStats, 'borrows', chunk_size,
+    )
+
+
+def rollup_search_gaps(chunk_size=50000):
+    """عدد محاولات البحث الفاشلة لكل نص في كل يوم"""
+    return _count_by_day(
+        'search_gaps', SearchLog.objects.filter(result_count=0), 'query_text', 'timestamp', DailySearchGap, 'attempts', chunk_size,
+    )
+
+
+def rollup_returns():
+    """
+    عدد الإرجاعات ومجموع مدد الإعارة لكل كتاب حسب يوم الإرجاع.
+    الإرجاع يعدّل صفاً قديماً (return_date) ولا ينشئ صفاً جديداً، لذلك علامته زمنية.
+    نتوقف قبل الوقت الحالي بمهلة قصيرة حتى لا نتجاوز عمليات إرجاع لم تكتمل (لم تُثبت بعد).
+    """
+    mark = _watermark('returns')
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'ANALYTICS_ROLLUP_LAG', 60))
+    if mark.timestamp and mark.timestamp >= cutoff:
+        return 0
+
+    returned = Transaction.objects.filter(status='returned', borrow_date__isnull=False, return_date__lte=cutoff)
+    if mark.timestamp:
+        returned = returned.filter(return_date__gt=mark.timestamp)
+    grouped = returned.annotate(
+        day=TruncDate('return_date'),
+        duration=ExpressionWrapper(F('return_date') - F('borrow_date'), output_field=DurationField()),
+    ).values('book_id', 'day').annotate(count=Count('id'), total=Sum('duration'))
+
+    processed = 0
+    with transaction.atomic():
+        rows = {}
+        for item in grouped:
+            rows[(item['book_id'], item['day'])] = {
+                'returns': item['count'],
+                'loan_seconds': item['total'].total_seconds() if item['total'] else 0.0,
+            }
+            processed += item['count']
+        _accumulate(DailyBookStats, ('book_id', 'day'), ['book', 'day'], rows)
+        _advance(mark, timestamp=cutoff)
+    return processed
+
+
+def refresh_rollups():
+    """تحديث كل جداول التجميع بالصفوف الجديدة فقط؛ يرجع عدد الصفوف المعالجة لكل جدول"""
+    with _refresh_lock:
+        processed = {}
+        for name, rollup in (('borrows', rollup_borrows), ('returns', rollup_returns), ('search_gaps', rollup_search_gaps)):
+            try:
+                processed[name] = rollup()
+            except RollupConflict:
+                # عملية أخرى تقوم بالتحديث نفسه الآن
+                processed[name] = 0
+        return processed
+
+
+def reset_rollups():
+    """حذف كل التجميعات والعلامات (لإعادة البناء من البداية)"""
+    with transaction.atomic():
+        DailyBookStats.objects.all().delete()
+        DailySearchGap.objects.all().delete()
+        RollupWatermark.objects.all().delete()
+
+
+# ==========================================
+# 3. قوائم لوحة الإحصاءات (Top-N Readers)
+# ==========================================
+def most_borrowed(limit=5):
+    return DailyBookStats.objects.values('book_id', 'book__title') \
+        .annotate(total_borrows=Sum('borrows')) \
+        .order_by('-total_borrows')[:limit]
+
+
+def longest_average_loans(limit=5):
+    rows = DailyBookStats.objects.filter(returns__gt=0) \
+        .values('book_id', 'book__title') \
+        .annotate(total_returns=Sum('returns'), total_seconds=Sum('loan_seconds')) \
+        .annotate(avg_seconds=ExpressionWrapper(F('total_seconds') / F('total_returns'), output_field=FloatField())) \
+        .order_by('-avg_seconds')[:limit]
+    return [
+        {'book__title': row['book__title'], 'avg_days': timedelta(seconds=row['avg_seconds'])}
+        for row in rows
+    ]
+
+
+def search_gaps(limit=5):
+    return DailySearchGap.objects.values('query_text') \
+        .annotate(attempts=Sum('attempts')) \
+        .order_by('-attempts')[:limit]
@@ -0,0 +1,113 @@
+import atexit
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import SearchLog
+
+
+class SearchLogBuffer:
+    """
+    مخزن مؤقت لسجلات البحث (Buffered Log Writer).
+    بدلاً من عملية INSERT داخل كل طلب بحث، تضاف الأحداث لذاكرة العملية
+    وتكتب دفعة واحدة بـ bulk_create عند امتلاء الدفعة (batch_size) أو مرور flush_interval ثانية.
+    - capacity: الحد الأقصى للأحداث المنتظرة؛ ما زاد عنه يسقط ويحسب في dropped.
+    - عند إنهاء العملية يفرغ المخزن (atexit) حتى لا تضيع الأحداث المتبقية.
+    """
+
+    def __init__(self, batch_size=200, flush_interval=2.0, capacity=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self._events = deque()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._worker = None
+
+    def record(self, user_id, query_text, result_count):
+        """تسجيل حدث بحث دون أي عملية على قاعدة البيانات"""
+        event = (user_id, query_text[:255], result_count, timezone.now())
+        with self._condition:
+            if len(self._events) >= self.capacity:
+                self.dropped += 1
+                return
+            self._events.append(event)
+            self._start_worker()
+            if len(self._events) >= self.batch_size:
+                self._condition.notify()
+
+    def _start_worker(self):
+        # يبدأ الخيط عند أول حدث فقط، فلا تنشأ خيوط في أوامر الإدارة التي لا تبحث
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name='search-log-writer', daemon=True)
+            self._worker.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if len(self._events) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+            close_old_connections()
+            self.flush()
+
+    def _take(self):
+        with self._condition:
+            count = min(len(self._events), self.batch_size)
+            return [self._events.popleft() for _ in range(count)]
+
+    def flush(self):
+        """كتابة كل الأحداث المنتظرة على دفعات؛ ترجع عدد الأحداث المكتوبة"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take()
+                if not batch:
+                    break
+                try:
+                    SearchLog.objects.bulk_create([
+                        SearchLog(user_id=user_id, query_text=query_text, result_count=result_count, timestamp=timestamp)
+                        for user_id, query_text, result_count, timestamp in batch
+                    ])
+                except Exception as e:
+                    self.failed += len(batch)
+                    print(f"Search Log Flush Error: {e}")
+                    break
+                written += len(batch)
+                self.flushed += len(batch)
+        return written
+
+    def stats(self):
+        return {
+            'pending': len(self._events),
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_search_log():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = SearchLogBuffer(
+                    batch_size=getattr(settings, 'SEARCH_LOG_BATCH_SIZE', 200),
+                    flush_interval=getattr(settings, 'SEARCH_LOG_FLUSH_INTERVAL', 2.0),
+                    capacity=getattr(settings, 'SEARCH_LOG_CAPACITY', 10000),
+                )
+    return _buffer
+
+
+def log_search(user, query_text, result_count):
+    get_search_log().record(user.pk if user.is_authenticated else None, query_text, result_count)
@@ -0,0 +1,240 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import BookEmbedding
+from .vector_index import ExactIndex, QuantizedIndex, top_k
+from .vector_store import QuantizedMatrix
+
+# اسم الملف الذي يشير إلى الإصدار المنشور حالياً
+CURRENT = 'CURRENT'
+
+
+# ==========================================
+# 1. نشر الفهرس كملفات بإصدارات (Versioned Index Files)
+# ==========================================
+# كل إصدار مجلد مستقل لا يعدل بعد نشره: ids.npy وvectors.npy (float32) ومعها codes/scale/offset
+# عند تفعيل الضغط، و meta.json. النشر يكتب المجلد باسم مؤقت ثم يعيد تسميته، ثم يستبدل ملف CURRENT
+# بـ os.replace؛ وكلا العمليتين ذريتان (Atomic Rename)، فلا يرى أي عامل إصداراً ناقصاً.
+
+def _embedding_stats():
+    return BookEmbedding.objects.aggregate(count=Count('pk'), last=Max('updated_at'))
+
+
+def publish_index(directory, store, quantization=None, keep=3):
+    """كتابة إصدار جديد من متجهات المخزن ونشره؛ يرجع اسم الإصدار"""
+    os.makedirs(directory, exist_ok=True)
+    # الإحصاءات قبل القراءة: ما يتغير أثناء الكتابة يعامل كتغييرات لاحقة (Delta) عند القراءة
+    stats = _embedding_stats()
+    ids, matrix = store.read()
+
+    name = f"v{timezone.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+    staging = os.path.join(directory, f'.{name}.tmp')
+    os.makedirs(staging)
+    np.save(os.path.join(staging, 'ids.npy'), ids)
+    np.save(os.path.join(staging, 'vectors.npy'), matrix)
+    if quantization:
+        quantized = QuantizedMatrix.encode(matrix, quantization)
+        np.save(os.path.join(staging, 'codes.npy'), quantized.codes)
+        if quantized.scale is not None:
+            np.save(os.path.join(staging, 'scale.npy'), quantized.scale)
+            np.save(os.path.join(staging, 'offset.npy'), quantized.offset)
+    meta = {
+        'count': stats['count'],
+        'last_update': stats['last'].isoformat() if stats['last'] else None,
+        'quantization': quantization,
+    }
+    with open(os.path.join(staging, 'meta.json'), 'w') as handle:
+        json.dump(meta, handle)
+    os.rename(staging, os.path.join(directory, name))
+
+    pointer = os.path.join(directory, f'.{CURRENT}.{name}.tmp')
+    with open(pointer, 'w') as handle:
+        handle.write(name)
+    os.replace(pointer, os.path.join(directory, CURRENT))
+
+    prune_versions(directory, keep)
+    return name
+
+
+def prune_versions(directory, keep=3):
+    """
+    حذف الإصدارات الأقدم مع إبقاء آخر keep منها.
+    العامل الذي ما زال يقرأ إصداراً محذوفاً لا يتأثر: الملفات المربوطة بالذاكرة تبقى حتى يغلقها (POSIX).
+    """
+    versions = sorted(entry for entry in os.listdir(directory) if entry.startswith('v'))
+    for name in versions[:-keep] if keep else versions:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+# ==========================================
+# 2. القراءة المشتركة في العمال (Memory-mapped Reader)
+# ==========================================
+class OverlayIndex:
+    """
+    الفهرس المنشور (مربوط بالذاكرة) مع ما تغير في قاعدة البيانات بعد نشره:
+    الكتب المحذوفة أو المعدّلة تستبعد من الفهرس المنشور، والمعدّلة والجديدة تبحث في فهرس صغير دقيق.
+    """
+
+    def __init__(self, base, masked_ids, delta):
+        self.base = base
+        self.masked = np.asarray(masked_ids, dtype=np.int64)
+        self.delta = delta
+        self.matrix = base.matrix
+        self.version = None
+        # المستبعد من الفهرس المنشور هو ما كان فيه فعلاً (الكتب الجديدة في delta ليست فيه)
+        self._count = len(base) - int(np.isin(self.masked, base.ids).sum()) + len(delta)
+
+    def __len__(self):
+        return self._count
+
+    def search(self, vector, k, min_score=None):
+        ids, scores = self.base.search(vector, k + len(self.masked), min_score)
+        keep = ~np.isin(ids, self.masked)
+        delta_ids, delta_scores = self.delta.search(vector, k, min_score)
+        ids = np.concatenate([ids[keep], delta_ids])
+        scores = np.concatenate([scores[keep], delta_scores])
+        selected = top_k(scores, k)
+        return ids[selected], scores[selected]
+
+
+class SharedIndexVersion:
+    """إصدار منشور مفتوح للقراءة فقط عبر np.load(mmap_mode='r'): صفحاته في ذاكرة النظام المشتركة بين العمال"""
+
+    def __init__(self, directory, name, rerank=4):
+        path = os.path.join(directory, name)
+        self.name = name
+        with open(os.path.join(path, 'meta.json')) as handle:
+            self.meta = json.load(handle)
+        self.last_update = parse_datetime(self.meta['last_update']) if self.meta['last_update'] else None
+
+        self.ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode='r')
+        self.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        if self.meta['quantization']:
+            load = lambda field: np.load(os.path.join(path, f'{field}.npy'), mmap_mode='r')
+            scale = offset = None
+            if os.path.exists(os.path.join(path, 'scale.npy')):
+                scale, offset = np.asarray(load('scale')), np.asarray(load('offset'))
+            self.index = QuantizedIndex(self.ids, QuantizedMatrix(load('codes'), scale, offset), self.exact_vectors, rerank)
+        else:
+            self.index = ExactIndex(self.ids, self.vectors)
+        self.index.version = f"{name}:{self.published_version}"
+        self._lock = threading.Lock()
+        self._overlay = (None, None)
+
+    def exact_vectors(self, book_ids):
+        """إعادة الترتيب من المتجهات الدقيقة في نفس الإصدار (دون استعلام قاعدة البيانات)"""
+        return np.asarray(self.vectors[np.searchsorted(self.ids, book_ids)])
+
+    def for_store(self, store_version):
+        """
+        الفهرس المطابق لحالة المخزن الحالية: الإصدار المنشور وحده إن لم يتغير شيء بعد نشره،
+        وإلا مع طبقة التغييرات (تحسب مرة واحدة لكل إصدار من المخزن).
+        """
+        if store_version == self.published_version:
+            return self.index
+        version, index = self._overlay
+        if version == store_version:
+            return index
+        with self._lock:
+            version, index = self._overlay
+            if version != store_version:
+                index = self._build_overlay()
+                index.version = f"{self.name}:{store_version}"
+                self._overlay = (store_version, index)
+            return index
+
+    def embeddings(self, store_version):
+        """
+        (ids, matrix) بصيغة float32 لحساب الجيران، مطابقة لحالة المخزن: الملف المربوط بالذاكرة نفسه إن لم
+        يتغير شيء بعد نشره، وإلا نسخة مؤقتة منه مع طبقة التغييرات (لا تبقى في ذاكرة العامل بعد الاستدعاء).
+        """
+        index = self.for_store(store_version)
+        if index is self.index:
+            return self.ids, self.vectors
+        keep = ~np.isin(self.ids, index.masked)
+        if not keep.any():
+            return index.delta.ids, index.delta.matrix
+        ids = np.concatenate([self.ids[keep], index.delta.ids])
+        matrix = np.vstack([self.vectors[keep], index.delta.matrix])
+        order = np.argsort(ids, kind='stable')
+        return ids[order], matrix[order]
+
+    @property
+    def published_version(self):
+        # نفس صيغة EmbeddingStore.version
+        return f"{self.meta['count']}:{self.meta['last_update'] or ''}"
+
+    def _build_overlay(self):
+        changed = BookEmbedding.objects.all()
+        if self.last_update:
+            changed = changed.filter(updated_at__gt=self.last_update)
+        changed = dict(changed.values_list('book_id', 'vector'))
+        live = np.fromiter(BookEmbedding.objects.values_list('book_id', flat=True).iterator(), dtype=np.int64)
+        deleted = np.setdiff1d(self.ids, live)
+
+        delta_ids = np.asarray(sorted(changed), dtype=np.int64)
+        dimension = self.vectors.shape[1] if self.vectors.ndim == 2 else 0
+        delta = np.vstack([np.frombuffer(changed[book_id], dtype=np.float32) for book_id in delta_ids]) \
+            if len(delta_ids) else np.empty((0, dimension), dtype=np.float32)
+        return OverlayIndex(self.index, np.union1d(deleted, delta_ids), ExactIndex(delta_ids, delta))
+
+
+class SharedIndex:
+    """
+    يتابع ملف CURRENT في مجلد الفهارس، ويفتح الإصدار الجديد عند أول طلب بعد نشره.
+    الاستبدال إسناد مرجع واحد، فالطلب الجاري يكمل على الإصدار الذي بدأ به (لا يسقط أي استعلام).
+    """
+
+    def __init__(self, directory, rerank=4):
+        self.directory = directory
+        self.rerank = rerank
+        self._lock = threading.Lock()
+        self._current = (None, None)
+
+    def _pointer(self):
+        try:
+            stat = os.stat(os.path.join(self.directory, CURRENT))
+        except FileNotFoundError:
+            return None
+        # os.replace ينشئ ملفاً جديداً في كل نشر، فرقم الملف (inode) يتغير حتى لو تطابق الوقت
+        return stat.st_ino, stat.st_mtime_ns
+
+    def current(self):
+        """الإصدار المنشور حالياً (SharedIndexVersion) أو None إن لم ينشر أي إصدار بعد"""
+        pointer = self._pointer()
+        if pointer is None:
+            return None
+        key, version = self._current
+        if key == pointer:
+            return version
+        with self._lock:
+            key, version = self._current
+            if key != pointer:
+                with open(os.path.join(self.directory, CURRENT)) as handle:
+                    name = handle.read().strip()
+                if version is None or version.name != name:
+                    version = SharedIndexVersion(self.directory, name, self.rerank)
+                self._current = (pointer, version)
+            return version
+
+    def load(self, store):
+        """فهرس البحث من الملفات المنشورة مع تغييرات قاعدة البيانات اللاحقة، أو None"""
+        version = self.current()
+        if version is None:
+            return None
+        return version.for_store(store.version())
+
+    def embeddings(self, store):
+        """المتجهات الدقيقة من الملفات المنشورة مع تغييرات قاعدة البيانات اللاحقة، أو None"""
+        version = self.current()
+        if version is None:
+            return None
+        return version.embeddings(store.version())
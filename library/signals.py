@@ -0,0 +1,195 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Book, BookNeighbor, Transaction
+
+logger = logging.getLogger(__name__)
+
+# هذه الوحدة تستورد عند بدء التطبيق (LibraryConfig.ready)، لذلك وحدات المتجهات (numpy)
+# تستورد داخل الدوال فقط حتى لا يدفع كل أمر manage.py كلفة تحميلها
+
+# الحقول التي يتكون منها المحتوى الدلالي للكتاب.
+# أي حفظ لا يمس هذه الحقول (مثل تحديث available_copies) لا يستدعي إعادة التشفير.
+CONTENT_FIELDS = frozenset({'title', 'description', 'tags'})
+
+
+# ==========================================
+# طابور تحديث المتجهات (Embedding Update Queue)
+# ==========================================
+class EmbeddingUpdateQueue:
+    """
+    يجمع الكتب المعدّلة ويحدّث متجهاتها دفعة واحدة عند اعتماد المعاملة (on_commit).
+    الطابور خاص بكل خيط (Thread) لأن on_commit مرتبط باتصال قاعدة البيانات الخاص بالخيط،
+    وبذلك يكلف استيراد جماعي داخل معاملة واحدة عملية تشفير مجمّعة بدلاً من N عملية.
+    """
+
+    def __init__(self, flush_size=256):
+        self.flush_size = flush_size
+        self._local = threading.local()
+
+    @property
+    def _state(self):
+        state = self._local
+        if not hasattr(state, 'pending'):
+            state.pending = set()
+            # كتب فقدت أحد جيرانها بسبب الحذف ويجب إعادة حساب قوائمها
+            state.stale = set()
+            # دالة on_commit المسجلة للدفعة الحالية (None إن لم تسجل بعد)
+            state.callback = None
+            state.deferred = 0
+        return state
+
+    def enqueue(self, book):
+        state = self._state
+        state.pending.add(book.pk)
+        self._schedule(state)
+
+    def discard(self, book_id, stale_ids=()):
+        state = self._state
+        state.pending.discard(book_id)
+        state.stale.update(stale_ids)
+        state.stale.discard(book_id)
+        if state.stale:
+            self._schedule(state)
+
+    def _scheduled(self, state):
+        """
+        هل ما زالت دالة الدفعة مسجلة؟ Django يحذف دوال on_commit دون إشعار عند التراجع عن المعاملة
+        (أو نقطة الحفظ) التي سجلت فيها، فلا نعتمد على علامة ثابتة بل نبحث عن الدالة نفسها.
+        """
+        if state.callback is None:
+            return False
+        return any(func is state.callback for _, func, _ in transaction.get_connection().run_on_commit)
+
+    def _schedule(self, state):
+        if len(state.pending) >= self.flush_size:
+            self.flush()
+        elif not state.deferred and not self._scheduled(state):
+            # كائن جديد لكل دفعة حتى نميزه في قائمة on_commit
+            state.callback = self.flush
+            transaction.on_commit(state.callback)
+
+    def flush(self):
+        """تشفير الكتب المعلقة في دفعة واحدة، ثم تحديث قوائم الكتب المتشابهة المتأثرة"""
+        from .ai_engine import get_ai_engine
+        from .vector_store import book_content
+
+        state = self._state
+        state.callback = None
+        pending, state.pending = state.pending, set()
+        stale, state.stale = state.stale, set()
+        if not pending and not stale:
+            return 0
+
+        engine = get_ai_engine()
+        if engine.model is None:
+            # بدون نموذج لا يمكن التشفير؛ يمكن المزامنة لاحقاً عبر build_embeddings
+            return 0
+        try:
+            # المحتوى يقرأ عند التشفير لا عند الإضافة: ما أضيف في معاملة تراجعت يبقى في الطابور
+            # حتى الدفعة التالية، فالكتب التي تراجع إنشاؤها لا تظهر هنا، والتعديلات المتراجع عنها
+            # تعود لمحتواها المعتمد (ولا يعاد تشفيرها لأن بصمتها لم تتغير)
+            rows = Book.objects.filter(pk__in=list(pending)).values_list('pk', 'title', 'description', 'tags')
+            changed = engine.store.update(
+                ((book_id, book_content(title, description, tags)) for book_id, title, description, tags in rows),
+                engine.model,
+            )
+            if changed or stale:
+                engine.refresh_neighbors(changed, stale)
+            return len(changed)
+        except Exception:
+            logger.exception("Embedding update failed for books %s", sorted(pending))
+            return 0
+
+    @contextmanager
+    def deferred(self):
+        """تأجيل التحديث حتى نهاية الكتلة (مفيد للسكربتات التي تعمل خارج معاملة)"""
+        state = self._state
+        state.deferred += 1
+        try:
+            yield self
+        finally:
+            state.deferred -= 1
+            if not state.deferred:
+                self.flush()
+
+
+embedding_updates = EmbeddingUpdateQueue()
+
+
+# ==========================================
+# إشارات الكتب (Book Signals)
+# ==========================================
+@receiver(post_save, sender=Book, dispatch_uid='library.book_embedding_save')
+def queue_book_embedding(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """إضافة الكتاب لطابور إعادة التشفير عند إنشائه أو تعديل محتواه"""
+    if raw:
+        return
+    if update_fields is not None and not CONTENT_FIELDS.intersection(update_fields):
+        return
+    embedding_updates.enqueue(instance)
+
+
+@receiver(pre_delete, sender=Book, dispatch_uid='library.book_neighbors_delete')
+def collect_stale_neighbors(sender, instance, **kwargs):
+    """
+    قبل الحذف نحفظ الكتب التي تضم هذا الكتاب في قائمة جيرانها،
+    لأن صفوفها ستحذف تلقائياً (CASCADE) وستبقى قوائمها ناقصة.
+    """
+    instance._stale_neighbor_ids = list(
+        BookNeighbor.objects.filter(neighbor=instance).values_list('book_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Book, dispatch_uid='library.book_embedding_delete')
+def drop_book_embedding(sender, instance, **kwargs):
+    """
+    عند حذف الكتاب يُحذف متجهه تلقائياً (CASCADE)، ويكفي إزالته من الطابور
+    حتى لا نحاول تشفير كتاب لم يعد موجوداً، ثم إعادة حساب قوائم الكتب التي كانت تضمه.
+    """
+    embedding_updates.discard(instance.pk, getattr(instance, '_stale_neighbor_ids', ()))
+
+
+# ==========================================
+# إشارات الإعارة (Transaction Signals)
+# ==========================================
+def apply_interests(events):
+    """
+    تحديث بصمات الطلاب بعد اعتماد المعاملة؛ الخطأ هنا لا يجب أن يفشل عملية الإعارة.
+    التحديث تزايدي، فالاستعارة التي يسقط أثرها لا تعود أبداً: عند انشغال قاعدة البيانات
+    (OperationalError مثل "database is locked") نعيد المحاولة مع انتظار متزايد (INTEREST_UPDATE_RETRIES مرة).
+    """
+    from .interests import add_interests
+
+    def apply():
+        retries = getattr(settings, 'INTEREST_UPDATE_RETRIES', 5)
+        for attempt in range(retries + 1):
+            try:
+                add_interests(events)
+                return
+            except OperationalError:
+                if attempt == retries:
+                    logger.exception("Interest update failed after %d attempts: %s", attempt + 1, events)
+                    return
+                time.sleep(0.05 * 2 ** attempt)
+            except Exception:
+                logger.exception("Interest update failed: %s", events)
+                return
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Transaction, dispatch_uid='library.transaction_interest')
+def update_student_interest(sender, instance, raw=False, **kwargs):
+    """الاستعارة والتقييم العالي يقربان بصمة الطالب من متجه الكتاب (يحسب الوزن في Transaction.save)"""
+    weight = getattr(instance, '_interest_weight', 0.0)
+    if raw or not weight:
+        return
+    apply_interests([(instance.student_id, instance.book_id, weight)])
@@ -0,0 +1,165 @@
+import os
+import re
+import subprocess
+import sys
+import unittest
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# ==========================================
+# أدوات مساعدة للاختبارات (Test Helpers)
+# ==========================================
+# الجداول التي لا يسمح بمسحها كاملاً في المسارات الساخنة (تكبر مع الاستخدام)
+TRACKED_TABLES = ('library_transaction', 'library_searchlog')
+
+
+class QueryPlanAudit:
+    """
+    يسجل استعلامات SELECT المنفذة داخل الكتلة، ثم يشغل EXPLAIN QUERY PLAN لكل منها
+    ويجمع المسح الكامل (Full Scan) لأي جدول من الجداول المتابعة.
+    خاص بـ SQLite (قاعدة التطوير والاختبار)؛ صيغة الخطة تختلف في القواعد الأخرى.
+
+        with QueryPlanAudit() as audit:
+            client.get(url)
+        assert not audit.full_scans
+    """
+
+    def __init__(self, tables=TRACKED_TABLES):
+        self.tables = tables
+        self.queries = []
+        self.plans = []
+        self.full_scans = []
+        self._wrapper = None
+
+    def _record(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self._record)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+        if exc_info[0] is None:
+            self.explain()
+
+    def explain(self):
+        # SCAN <table> أو SCAN <table> AS <alias> أو SCAN <table> USING INDEX (مسح كامل للفهرس)
+        scan = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+        with connection.cursor() as cursor:
+            for sql, params in self.queries:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                details = [row[-1] for row in cursor.fetchall()]
+                self.plans.append((sql, details))
+                for detail in details:
+                    match = scan.match(detail)
+                    if match and match.group(1) in self.tables:
+                        self.full_scans.append((sql, detail))
+
+
+class QueryPlanTestMixin:
+    """اختبارات تفشل إذا عاد أي استعلام على الجداول المتابعة إلى المسح الكامل"""
+
+    tracked_tables = TRACKED_TABLES
+
+    def audit_query_plans(self):
+        if connection.vendor != 'sqlite':
+            raise unittest.SkipTest("EXPLAIN QUERY PLAN audit requires SQLite.")
+        return QueryPlanAudit(self.tracked_tables)
+
+    def assertNoFullScans(self, audit):
+        if audit.full_scans:
+            lines = [f"{detail}\n    {sql}" for sql, detail in audit.full_scans]
+            self.fail("Full table scans on tracked tables:\n" + "\n".join(lines))
+
+
+# ==========================================
+# عدد الاستعلامات لكل صفحة (Query Count)
+# ==========================================
+def query_shape(sql):
+    """شكل الاستعلام بعد حذف القيم الثابتة، لاكتشاف الاستعلام نفسه مكرراً لكل سطر (N+1)"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    return re.sub(r'\((?:\?, )+\?\)', '(?)', sql)
+
+
+class QueryCountTestMixin:
+    """تثبيت عدد الاستعلامات لكل صفحة حتى يظهر أي تراجع (مثل N+1) في الاختبارات"""
+
+    def assertViewQueries(self, expected, url, user=None, method='get', **kwargs):
+        if user is not None:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(self.client, method)(url, **kwargs)
+
+        count = len(captured.captured_queries)
+        if count != expected:
+            shapes = Counter(query_shape(query['sql']) for query in captured.captured_queries)
+            repeated = [f"{times}x {shape}" for shape, times in shapes.most_common() if times > 1]
+            details = "\n".join(repeated) or "\n".join(query['sql'] for query in captured.captured_queries)
+            self.fail(f"{url}: expected {expected} queries, got {count}.\n{details}")
+        return response
+
+
+# ==========================================
+# زمن الاستيراد عند الإقلاع (Import Time)
+# ==========================================
+# مكتبات تعلم الآلة الثقيلة: يجب ألا تستورد إلا عند أول بحث أو توصية
+HEAVY_MODULES = ('numpy', 'pandas', 'scipy', 'sklearn', 'torch', 'sentence_transformers', 'transformers')
+
+
+class ImportTimeReport:
+    """
+    تشغيل أمر manage.py في عملية مستقلة مع (python -X importtime) وتحليل الناتج.
+    ملاحظة: الوحدات التي يستوردها Django عبر import_module (الإعدادات وapps وadmin) لا تظهر بنفسها،
+    لكن كل ما تستورده بجمل import العادية يظهر، وهو ما نقيسه.
+
+        report = ImportTimeReport.run('check')
+        report.loaded('numpy'), report.cumulative_ms('library.')
+    """
+
+    LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+    def __init__(self, output):
+        # (name, self_us, cumulative_us, depth) بترتيب الطباعة: الوحدات الفرعية قبل الوحدة التي استوردتها
+        self.entries = []
+        for line in output.splitlines():
+            match = self.LINE.match(line)
+            if match:
+                own, total, indent, name = match.groups()
+                self.entries.append((name, int(own), int(total), len(indent) // 2))
+
+    @classmethod
+    def run(cls, *args):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', 'manage.py', *args],
+            cwd=settings.BASE_DIR, env=dict(os.environ), capture_output=True, text=True, timeout=120,
+        )
+        if result.returncode:
+            raise AssertionError(f"manage.py {' '.join(args)} failed:\n{result.stderr[-2000:]}")
+        return cls(result.stderr)
+
+    def loaded(self, package):
+        return any(name == package or name.startswith(package + '.') for name, *_ in self.entries)
+
+    def cumulative_ms(self, prefix):
+        """
+        زمن استيراد الوحدات التي تبدأ بـ prefix مع كل ما تستورده، دون عد الوحدة المتداخلة مرتين
+        (الوحدة التي يستوردها أحد أسلافها المطابقين محسوبة ضمن زمنه التراكمي)
+        """
+        total, parents = 0, []
+        # نمر من الآخر: الأب يطبع بعد أبنائه، فنعرف عند كل سطر هل داخل أب مطابق
+        for name, _, cumulative, depth in reversed(self.entries):
+            while parents and parents[-1][1] >= depth:
+                parents.pop()
+            inside = any(parent.startswith(prefix) for parent, _ in parents)
+            if name.startswith(prefix) and not inside:
+                total += cumulative
+            parents.append((name, depth))
+        return total / 1000
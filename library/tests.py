@@ -1,3 +1,1362 @@
-from django.test import TestCase
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+
+from . import inference, loans
+from .ai_engine import SmartLibraryAI, get_ai_engine, set_ai_engine
+from .catalog import Catalog
+from .coborrow import CoBorrowModel, build_coborrow, refresh_coborrow
+from .inference import InferenceExecutor
+from .interests import fingerprint_vector
+from .lexical_index import LexicalIndex, tokenize
+from .overdue import scan_overdue
+from .query_cache import QueryCache
+from .shared_index import SharedIndex, publish_index
+from .encoder_batcher import BatchingEncoder
+from .encoders import HashingEncoder, load_encoder
+from .models import (
+    BORROW_INTEREST_WEIGHT, LOAN_PERIOD, Book, BookEmbedding, BookNeighbor, DailyBookStats, DailySearchGap, NoCopiesAvailable, OverdueNotice, Reservation,
+    RollupWatermark, SearchLog, StudentProfile, Transaction,
+)
+from .testing import HEAVY_MODULES, ImportTimeReport, QueryCountTestMixin, QueryPlanTestMixin
+from .rollups import RollupConflict, _advance, _watermark, most_borrowed, refresh_rollups
+from .search_log import SearchLogBuffer
+from .signals import embedding_updates
+from .vector_index import ExactIndex, IVFIndex
+from .vector_store import EmbeddingStore, QuantizedMatrix, book_content, content_hash, normalize_rows
+
+
+# ==========================================
+# بيانات مشتركة للاختبارات (Fixtures)
+# ==========================================
+class LibraryTestCase(TestCase):
+    """ينشئ كتباً وطالباً ومشرفاً، ويستخدم المشفر المحلي الخفيف بدلاً من نموذج MiniLM"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = [
+            Book.objects.create(
+                isbn=f'978000000{index:04d}',
+                title=f'كتاب رقم {index}',
+                author='مؤلف',
+                description='وصف تجريبي',
+                tags='برمجة',
+                total_copies=3,
+                available_copies=3,
+            )
+            for index in range(5)
+        ]
+        cls.student_user = User.objects.create_user('student', password='password')
+        cls.student = StudentProfile.objects.create(user=cls.student_user, student_id='20240001', major='حاسوب')
+        cls.admin_user = User.objects.create_superuser('admin', password='password')
+
+    def setUp(self):
+        self.previous_engine = set_ai_engine(SmartLibraryAI(encoder=HashingEncoder()))
+
+    def tearDown(self):
+        set_ai_engine(self.previous_engine)
+
+
+# ==========================================
+# 1. خطط الاستعلامات (Query Plans)
+# ==========================================
+@override_settings(ANALYTICS_ROLLUP_LAG=0)
+class QueryPlanTests(QueryPlanTestMixin, LibraryTestCase):
+    """كل استعلامات الصفحات على جدولي العمليات والبحث يجب أن تستخدم فهرساً"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for book in cls.books:
+            Transaction.objects.create(book=book, student=cls.student)
+        Transaction.objects.create(book=cls.books[0], student=cls.student, status='active')
+        SearchLog.objects.create(user=cls.student_user, query_text='كتاب غير موجود', result_count=0)
+
+    def assertViewUsesIndexes(self, user, url, method='get'):
+        self.client.force_login(user)
+        with self.audit_query_plans() as audit:
+            getattr(self.client, method)(url)
+        self.assertTrue(audit.queries)
+        self.assertNoFullScans(audit)
+
+    def test_analytics_dashboard(self):
+        self.assertViewUsesIndexes(self.admin_user, reverse('library:analytics'))
+
+    def test_profile(self):
+        self.assertViewUsesIndexes(self.student_user, reverse('library:profile'))
+
+    def test_book_detail(self):
+        self.assertViewUsesIndexes(self.student_user, reverse('library:book_detail', args=[self.books[0].id]))
+
+    def test_borrow_request(self):
+        self.assertViewUsesIndexes(self.student_user, reverse('library:borrow_request', args=[self.books[1].id]))
+
+    def test_pending_and_active_lists(self):
+        # قائمتا لوحة الإحصاءات (لا يعرضهما القالب حالياً، لذلك نقيّمهما مباشرة)
+        with self.audit_query_plans() as audit:
+            list(Transaction.objects.filter(status='pending').order_by('request_date'))
+            list(Transaction.objects.filter(status='active').order_by('due_date'))
+        self.assertNoFullScans(audit)
+
+    def test_audit_reports_full_scans(self):
+        with self.audit_query_plans() as audit:
+            list(Transaction.objects.filter(user_rating=5))
+        self.assertEqual(len(audit.full_scans), 1)
+
+
+# ==========================================
+# 2. عدد الاستعلامات لكل صفحة (N+1)
+# ==========================================
+@override_settings(ANALYTICS_ROLLUP_LAG=0)
+class QueryCountTests(QueryCountTestMixin, LibraryTestCase):
+    """عدد الاستعلامات ثابت مهما زاد عدد السطور المعروضة"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for book in cls.books * 4:
+            Transaction.objects.create(book=book, student=cls.student)
+        for book in cls.books[:3]:
+            Transaction.objects.create(book=book, student=cls.student, status='active')
+
+    def test_profile(self):
+        # الجلسة، المستخدم، ملف الطالب، العمليات مع كتبها
+        self.assertViewQueries(4, reverse('library:profile'), self.student_user)
+
+    def test_analytics_dashboard(self):
+        url = reverse('library:analytics')
+        # الزيارة الأولى تبني التجميعات؛ نثبت عدد استعلامات الزيارات التالية
+        self.client.force_login(self.admin_user)
+        self.client.get(url)
+        self.assertViewQueries(15, url)
+
+    def test_admin_transaction_list(self):
+        self.assertViewQueries(5, reverse('admin:library_transaction_changelist'), self.admin_user)
+
+    def test_admin_student_list(self):
+        self.assertViewQueries(6, reverse('admin:library_studentprofile_changelist'), self.admin_user)
+
+
+# ==========================================
+# 3. المخزون تحت الضغط المتزامن (Concurrency)
+# ==========================================
+class InventoryConcurrencyTests(TransactionTestCase):
+    """موافقات متزامنة كثيرة على نفس الكتاب لا تتجاوز عدد النسخ ولا تضيع أي تحديث"""
+
+    copies = 5
+    threads = 20
+
+    def setUp(self):
+        self.previous_engine = set_ai_engine(SmartLibraryAI(encoder=HashingEncoder()))
+        self.book = Book.objects.create(isbn='9780000009999', title='كتاب مطلوب', author='مؤلف',
+                                        total_copies=self.copies, available_copies=self.copies)
+        self.requests = []
+        for index in range(self.threads):
+            user = User.objects.create(username=f'student{index}')
+            student = StudentProfile.objects.create(user=user, student_id=f'2024{index:04d}', major='حاسوب')
+            self.requests.append(Transaction.objects.create(book=self.book, student=student))
+
+    def tearDown(self):
+        set_ai_engine(self.previous_engine)
+
+    def run_concurrently(self, action, items):
+        barrier = threading.Barrier(len(items))
+        outcomes = []
+
+        def worker(item):
+            barrier.wait()
+            try:
+                # SQLite يرفض الكتابة المتزامنة بدلاً من انتظارها؛ نعيد المحاولة كما يفعل أي عميل
+                while True:
+                    try:
+                        outcomes.append(action(item))
+                        break
+                    except OperationalError:
+                        time.sleep(0.001)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(item,)) for item in items]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return outcomes
+
+    def approve(self, trans_id):
+        trans = Transaction.objects.get(pk=trans_id)
+        trans.status = 'active'
+        try:
+            trans.save()
+            return True
+        except NoCopiesAvailable:
+            return False
+
+    def test_concurrent_approvals_never_oversell(self):
+        outcomes = self.run_concurrently(self.approve, [trans.pk for trans in self.requests])
+
+        self.book.refresh_from_db()
+        self.assertEqual(outcomes.count(True), self.copies)
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(Transaction.objects.filter(status='active').count(), self.copies)
+        self.assertFalse(Transaction.objects.filter(status='pending', borrow_date__isnull=False).exists())
+        # كل استعارة دخلت بصمة طالبها رغم انشغال قاعدة البيانات (إعادة المحاولة بدلاً من إسقاط التحديث)
+        self.assertEqual(StudentProfile.objects.filter(interest_weight=BORROW_INTEREST_WEIGHT).count(), self.copies)
+
+    def test_duplicate_approval_and_return_count_once(self):
+        trans_id = self.requests[0].pk
+        self.run_concurrently(self.approve, [trans_id] * 8)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, self.copies - 1)
+
+        def give_back(pk):
+            trans = Transaction.objects.get(pk=pk)
+            trans.status = 'returned'
+            trans.save()
+
+        self.run_concurrently(give_back, [trans_id] * 8)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, self.copies)
+
+
+# ==========================================
+# 4. العمليات الجماعية على الإعارات (Bulk Actions)
+# ==========================================
+class BulkLoanTests(LibraryTestCase):
+
+    def test_approve_allocates_copies_by_request_order(self):
+        # 5 طلبات لكتاب فيه 3 نسخ، وطلبان لكتاب آخر
+        first = [Transaction.objects.create(book=self.books[0], student=self.student) for _ in range(5)]
+        second = [Transaction.objects.create(book=self.books[1], student=self.student) for _ in range(2)]
+
+        with self.assertNumQueries(8):
+            approved, unavailable = loans.approve_requests(Transaction.objects.all())
+
+        self.assertCountEqual(approved, [trans.pk for trans in first[:3] + second])
+        self.assertEqual(unavailable, [trans.pk for trans in first[3:]])
+        self.books[0].refresh_from_db()
+        self.books[1].refresh_from_db()
+        self.assertEqual(self.books[0].available_copies, 0)
+        self.assertEqual(self.books[1].available_copies, 1)
+
+        # نفس نتيجة Transaction.save: التواريخ ومدة الإعارة
+        trans = Transaction.objects.get(pk=first[0].pk)
+        self.assertEqual(trans.status, 'active')
+        self.assertEqual(trans.due_date - trans.borrow_date, LOAN_PERIOD)
+
+    def test_admin_reports_inventory_race(self):
+        trans = Transaction.objects.create(book=self.books[3], student=self.student)
+        raced = []
+
+        def lose_race(execute, sql, params, many, context):
+            # عملية أخرى تأخذ كل النسخ بين قراءة المخزون وخصمه
+            if sql.startswith('UPDATE "library_book"') and not raced:
+                raced.append(sql)
+                Book.objects.filter(pk=self.books[3].pk).update(available_copies=0)
+            return execute(sql, params, many, context)
+
+        self.client.force_login(self.admin_user)
+        with connection.execute_wrapper(lose_race):
+            response = self.client.post(
+                reverse('admin:library_transaction_changelist'),
+                {'action': 'approve_requests', '_selected_action': [trans.pk]}, follow=True,
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message.level for message in response.context['messages']], [messages.ERROR])
+        trans.refresh_from_db()
+        self.assertEqual(trans.status, 'pending')
+
+    def test_return_restores_inventory_once(self):
+        borrowed = [Transaction.objects.create(book=self.books[2], student=self.student) for _ in range(2)]
+        loans.approve_requests(Transaction.objects.filter(pk__in=[trans.pk for trans in borrowed]))
+
+        self.assertEqual(len(loans.mark_returned(Transaction.objects.all())), 2)
+        self.assertEqual(loans.mark_returned(Transaction.objects.all()), [])
+        self.books[2].refresh_from_db()
+        self.assertEqual(self.books[2].available_copies, 3)
+        self.assertFalse(Transaction.objects.filter(status='returned', return_date__isnull=True).exists())
+
+
+# ==========================================
+# 5. قائمة الانتظار (Reservation Waitlist)
+# ==========================================
+class ReservationTests(LibraryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.book = Book.objects.create(isbn='9780000008888', title='كتاب نادر', author='مؤلف', total_copies=1, available_copies=1)
+        self.loan = Transaction.objects.create(book=self.book, student=self.student, status='active')
+        self.waiting = []
+        for index in range(3):
+            user = User.objects.create(username=f'waiting{index}')
+            self.waiting.append(StudentProfile.objects.create(user=user, student_id=f'3000{index}', major='حاسوب'))
+
+    def reserve(self, student, priority=0):
+        return Reservation.objects.create(book=self.book, student=student, priority=priority)
+
+    def return_loan(self):
+        self.loan.status = 'returned'
+        self.loan.save()
+
+    def test_borrow_request_joins_queue_when_unavailable(self):
+        self.client.force_login(self.waiting[0].user)
+        self.client.get(reverse('library:borrow_request', args=[self.book.id]))
+        self.client.get(reverse('library:borrow_request', args=[self.book.id]))
+        reservation = Reservation.objects.get(book=self.book, student=self.waiting[0])
+        self.assertEqual(reservation.position(), 1)
+
+        response = self.client.get(reverse('library:book_detail', args=[self.book.id]))
+        self.assertEqual(response.context['queue_position'], 1)
+        self.assertEqual(response.context['queue_length'], 1)
+
+    def test_concurrent_queue_request_reports_existing_reservation(self):
+        self.client.force_login(self.waiting[0].user)
+        # الطلب المتزامن الآخر أضاف الحجز بعد بحث get_or_create وقبل إضافته
+        self.reserve(self.waiting[0])
+        with mock.patch.object(Reservation.objects, 'get_or_create', side_effect=IntegrityError):
+            response = self.client.get(reverse('library:borrow_request', args=[self.book.id]), follow=True)
+
+        self.assertRedirects(response, reverse('library:book_detail', args=[self.book.id]))
+        self.assertEqual([str(message) for message in response.context['messages']],
+                         ["أنت بالفعل في قائمة الانتظار (ترتيبك 1)."])
+        self.assertEqual(Reservation.objects.filter(book=self.book, student=self.waiting[0]).count(), 1)
+
+    def test_return_allocates_by_priority_then_fifo(self):
+        first, second = self.reserve(self.waiting[0]), self.reserve(self.waiting[1])
+        urgent = self.reserve(self.waiting[2], priority=5)
+        self.assertEqual([urgent.position(), first.position(), second.position()], [1, 2, 3])
+
+        self.return_loan()
+
+        urgent.refresh_from_db()
+        self.assertEqual(urgent.status, 'allocated')
+        self.assertEqual(urgent.transaction.status, 'pending')
+        self.assertTrue(urgent.transaction.reserved_copy)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(first.position(), 1)
+
+        # الموافقة على الطلب المحجوز لا تخصم نسخة ثانية
+        held = urgent.transaction
+        held.status = 'active'
+        held.save()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertFalse(Transaction.objects.get(pk=held.pk).reserved_copy)
+
+    def test_rejected_reservation_passes_copy_to_next(self):
+        first, second = self.reserve(self.waiting[0]), self.reserve(self.waiting[1])
+        self.return_loan()
+        first.refresh_from_db()
+
+        loans.reject_requests(Transaction.objects.filter(pk=first.transaction_id))
+
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'allocated')
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+    def test_reject_counts_reserved_requests_once(self):
+        self.reserve(self.waiting[0])
+        self.return_loan()
+        held = Transaction.objects.get(student=self.waiting[0], reserved_copy=True)
+        plain = Transaction.objects.create(book=self.books[0], student=self.waiting[1])
+
+        self.assertEqual(loans.reject_requests(Transaction.objects.filter(pk__in=[held.pk, plain.pk])), 2)
+        self.assertEqual(set(Transaction.objects.filter(pk__in=[held.pk, plain.pk]).values_list('status', flat=True)), {'rejected'})
+
+    def test_admin_restock_goes_to_waitlist_first(self):
+        reservation = self.reserve(self.waiting[0])
+        self.client.force_login(self.admin_user)
+        self.client.post(reverse('admin:library_book_change', args=[self.book.pk]), {
+            'title': self.book.title, 'author': self.book.author, 'isbn': self.book.isbn, 'category': '',
+            'description': '', 'tags': '', 'total_copies': 2, 'available_copies': 1, 'cover_image_url': '',
+        })
+
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, 'allocated')
+        self.assertTrue(reservation.transaction.reserved_copy)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+    def test_bulk_return_allocates_waitlist(self):
+        self.reserve(self.waiting[0])
+        loans.mark_returned(Transaction.objects.filter(pk=self.loan.pk))
+        self.assertTrue(Transaction.objects.filter(student=self.waiting[0], reserved_copy=True).exists())
+
+
+# ==========================================
+# 6. التأخير والغرامات (Overdue Scan)
+# ==========================================
+@override_settings(LIBRARY_FINE_PER_DAY='1.50', LIBRARY_FINE_CAP='10.00')
+class OverdueTests(QueryPlanTestMixin, LibraryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.late = Transaction.objects.create(book=self.books[0], student=self.student, status='active')
+        self.very_late = Transaction.objects.create(book=self.books[1], student=self.student, status='active')
+        self.on_time = Transaction.objects.create(book=self.books[2], student=self.student, status='active')
+        Transaction.objects.filter(pk=self.late.pk).update(due_date=now - timedelta(days=2, hours=3))
+        Transaction.objects.filter(pk=self.very_late.pk).update(due_date=now - timedelta(days=30))
+
+    def test_overdue_queryset_and_annotation(self):
+        with self.audit_query_plans() as audit:
+            overdue = set(Transaction.objects.overdue().values_list('pk', flat=True))
+        self.assertNoFullScans(audit)
+        self.assertEqual(overdue, {self.late.pk, self.very_late.pk})
+
+        flags = dict(Transaction.objects.with_overdue().values_list('pk', 'overdue'))
+        self.assertEqual([flags[self.late.pk], flags[self.on_time.pk]], [True, False])
+
+    def test_scan_computes_fines_and_records_notices_once_a_day(self):
+        result = scan_overdue()
+        self.assertEqual(result, {'overdue': 2, 'fines_updated': 2, 'notices': 2})
+        self.late.refresh_from_db()
+        self.very_late.refresh_from_db()
+        self.assertEqual(self.late.fine_amount, Decimal('4.50'))
+        self.assertEqual(self.very_late.fine_amount, Decimal('10.00'))
+
+        self.assertEqual(scan_overdue(), {'overdue': 2, 'fines_updated': 0, 'notices': 0})
+        self.assertEqual(OverdueNotice.objects.count(), 2)
+
+
+# ==========================================
+# 7. بصمة اهتمامات الطالب (Interest Fingerprint)
+# ==========================================
+class InterestFingerprintTests(LibraryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.python = Book.objects.create(isbn='9780000007001', title='Python basics', author='a', tags='python programming',
+                                          total_copies=2, available_copies=2)
+        self.django = Book.objects.create(isbn='9780000007002', title='Python web with Django', author='b',
+                                          tags='python programming web', total_copies=2, available_copies=2)
+        get_ai_engine().sync_embeddings()
+
+    def borrow(self, book, rating=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            trans = Transaction.objects.create(book=book, student=self.student, status='active')
+        if rating is not None:
+            with self.captureOnCommitCallbacks(execute=True):
+                trans = Transaction.objects.get(pk=trans.pk)
+                trans.user_rating = rating
+                trans.save()
+        self.student.refresh_from_db()
+        return trans
+
+    def test_borrow_and_rating_update_running_mean(self):
+        self.borrow(self.python)
+        self.assertEqual(self.student.interest_weight, 1.0)
+        first = fingerprint_vector(self.student)
+
+        self.borrow(self.books[0], rating=5)
+        # استعارة (1) + تقييم 5 (2)
+        self.assertEqual(self.student.interest_weight, 4.0)
+        self.assertFalse(np.allclose(first, fingerprint_vector(self.student)))
+
+    def test_home_recommends_unseen_similar_books(self):
+        self.borrow(self.python)
+        self.client.force_login(self.student_user)
+        self.client.get(reverse('library:home'))
+        # بعد تحميل الفهرس: الجلسة والمستخدم والملف والكتب المطلوبة سابقاً وفحص الإصدار والكتب الموصى بها
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('library:home'))
+        recommended = response.context['recommendations']
+        self.assertEqual(recommended[0], self.django)
+        self.assertNotIn(self.python, recommended)
+
+
+# ==========================================
+# 8. الاستعارة المشتركة (Co-Borrow Recommendations)
+# ==========================================
+class CoBorrowTests(LibraryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'coborrow.npz')
+        settings_override = override_settings(COBORROW_MODEL_PATH=self.path, ANALYTICS_ROLLUP_LAG=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.others = [
+            StudentProfile.objects.create(user=User.objects.create(username=f'reader{index}'), student_id=f'2024100{index}')
+            for index in range(2)
+        ]
+
+    def borrow(self, student, *books):
+        for book in books:
+            Transaction.objects.create(book=book, student=student, status='active')
+
+    def test_incremental_refresh_matches_full_build(self):
+        first, second, third = self.books[:3]
+        self.borrow(self.student, first, second)
+        self.borrow(self.others[0], first)
+        build_coborrow(batch_size=1)
+
+        # استعارة مكررة لنفس الكتاب لا تضاعف الوزن
+        self.borrow(self.student, third, first)
+        self.borrow(self.others[1], second, third)
+        self.assertEqual(refresh_coborrow(batch_size=1), 2)
+        refreshed = CoBorrowModel.load(self.path).matrix
+
+        rebuilt = build_coborrow(path=os.path.join(os.path.dirname(self.path), 'rebuilt.npz')).matrix
+        self.assertEqual((refreshed != rebuilt).nnz, 0)
+        self.assertEqual(refreshed[first.id, second.id], 1)
+        self.assertEqual(refreshed[second.id, third.id], 2)
+        self.assertEqual(refreshed[first.id, first.id], 2)
+
+    def test_similar_uses_diagonal_computed_on_load(self):
+        first, second, third = self.books[:3]
+        self.borrow(self.student, first, second, third)
+        self.borrow(self.others[0], first, second)
+        build_coborrow()
+
+        model = CoBorrowModel.load(self.path)
+        self.assertEqual(model.diagonal[first.id], 2)
+        with mock.patch.object(model.matrix, 'diagonal', side_effect=AssertionError('diagonal per request')):
+            self.assertEqual(model.similar(first.id), [second.id, third.id])
+
+    def test_book_detail_blends_co_borrowed_books(self):
+        # كتاب بعيد في المحتوى: لا يظهر إلا بفضل الاستعارة المشتركة
+        first = self.books[0]
+        second = Book.objects.create(isbn='9780000008001', title='Cooking', author='chef', tags='food recipes',
+                                     total_copies=3, available_copies=3)
+        self.assertNotIn(second, get_ai_engine().get_recommendations(first.id))
+        for student in self.others:
+            self.borrow(student, first, second)
+        build_coborrow()
+
+        self.client.force_login(self.student_user)
+        response = self.client.get(reverse('library:book_detail', args=[first.id]))
+        self.assertIn(second, response.context['similar_books'])
+        self.assertNotIn(first, response.context['similar_books'])
+
+
+# ==========================================
+# 9. زمن الإقلاع (Startup Import Time)
+# ==========================================
+class StartupImportTests(SimpleTestCase):
+    """
+    manage.py check يستورد التطبيق وملف الروابط (كل الصفحات بما فيها login_view) ولوحة الإدارة (BookAdmin)،
+    وهي نفس كلفة إقلاع أي أمر أو عامل (Worker) قبل أول طلب.
+    """
+
+    # حد أعلى سخي لاستيراد وحدات التطبيق (تحميل pandas وحده يتجاوزه)
+    import_budget_ms = 150
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.report = ImportTimeReport.run('check')
+
+    def test_management_commands_skip_ml_stack(self):
+        loaded = [package for package in HEAVY_MODULES if self.report.loaded(package)]
+        self.assertEqual(loaded, [], "Heavy ML packages imported at startup; import them inside the functions that use them.")
+
+    def test_app_import_time_budget(self):
+        self.assertLess(self.report.cumulative_ms('library.'), self.import_budget_ms)
+
+    def test_scripts_calling_setup_do_not_warm_up_engine(self):
+        # أي عملية غير الخادم (سكربت، عامل مهام، pytest) لا تحمّل النموذج؛ التسخين من wsgi.py / asgi.py فقط
+        script = (
+            "import sys, threading, django; django.setup(); "
+            "print('library.ai_engine' in sys.modules, any(t.name == 'ai-engine-warmup' for t in threading.enumerate()))"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=120,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'sls_project.settings'},
+        )
+        self.assertEqual(result.stdout.split(), ['False', 'False'], result.stderr[-2000:])
+
+
+# ==========================================
+# 10. لقطة الفهرس العمودية (Catalog Snapshot)
+# ==========================================
+class CatalogSnapshotTests(LibraryTestCase):
+
+    def test_snapshot_matches_books_and_interns_titles(self):
+        Book.objects.create(isbn='9780000009001', title=self.books[0].title, author='b', tags='تاريخ',
+                            total_copies=1, available_copies=1)
+        snapshot = Catalog().load()
+
+        books = Book.objects.order_by('pk')
+        self.assertEqual(
+            list(snapshot.rows()),
+            [(book.pk, book_content(book.title, book.description, book.tags)) for book in books],
+        )
+        # عنوان مكرر يخزن مرة واحدة
+        self.assertEqual(len(snapshot.titles), len(self.books))
+        self.assertEqual(snapshot.title(self.books[1].pk), self.books[1].title)
+        self.assertIsNone(snapshot.title(0))
+        self.assertFalse(snapshot.ids.flags.writeable)
+        self.assertGreater(snapshot.bytes_per_book, 0)
+
+    def test_snapshot_is_swapped_when_catalog_changes(self):
+        catalog = Catalog()
+        first = catalog.load()
+        self.assertIs(catalog.load(), first)
+
+        book = self.books[2]
+        book.title = 'عنوان جديد'
+        book.save()
+        second = catalog.load()
+        self.assertIsNot(second, first)
+        self.assertEqual(second.title(book.pk), 'عنوان جديد')
+        # الطلبات الجارية على اللقطة القديمة لا تتأثر
+        self.assertEqual(first.title(book.pk), 'كتاب رقم 2')
+
+    def test_search_titles_come_from_snapshot(self):
+        engine = get_ai_engine()
+        engine.semantic_search('كتاب')
+        with self.assertNumQueries(2):
+            # إصدار الفهرس ثم إصدار مخزن المتجهات؛ العناوين من اللقطة
+            results = engine.semantic_search('مؤلف')
+        self.assertTrue(results)
+        titles = {book.pk: book.title for book in self.books}
+        self.assertTrue(all(result['title'] == titles[result['id']] for result in results))
+
+
+# ==========================================
+# 11. ضغط المتجهات (Vector Quantization)
+# ==========================================
+class VectorQuantizationTests(LibraryTestCase):
+
+    def test_int8_uses_per_dimension_scale_and_offset(self):
+        rng = np.random.default_rng(0)
+        matrix = normalize_rows(rng.standard_normal((200, 32)))
+        quantized = QuantizedMatrix.encode(matrix, 'int8')
+        self.assertEqual(quantized.codes.dtype, np.int8)
+        self.assertEqual(quantized.scale.shape, (32,))
+        self.assertLess(np.abs(quantized.decode() - matrix).max(), quantized.scale.max())
+        # الضرب النقطي المضغوط يطابق الضرب في المتجهات بعد فك الضغط
+        np.testing.assert_allclose(quantized.dot(matrix[0]), quantized.decode() @ matrix[0], rtol=1e-4, atol=1e-4)
+        self.assertLessEqual(quantized.nbytes, matrix.nbytes // 4 + 2 * 32 * 4)
+
+    def test_quantized_search_reranks_with_exact_vectors(self):
+        engine = get_ai_engine()
+        exact = engine.semantic_search('كتاب رقم 3')
+        query = engine.encode_query('كتاب رقم 3')
+        exact_ids, exact_scores = engine._load_index().search(query, 3)
+        for mode in ('float16', 'int8'):
+            with self.subTest(mode=mode), override_settings(AI_VECTOR_QUANTIZATION=mode):
+                engine = SmartLibraryAI(encoder=HashingEncoder())
+                results = engine.semantic_search('كتاب رقم 3')
+                self.assertEqual([result['id'] for result in results], [result['id'] for result in exact])
+
+                index = engine._load_index()
+                self.assertIsInstance(index.matrix, QuantizedMatrix)
+                ids, scores = index.search(query, 3)
+                # الدرجات النهائية محسوبة من المتجهات الدقيقة لا المضغوطة
+                np.testing.assert_array_equal(ids, exact_ids)
+                np.testing.assert_allclose(scores, exact_scores, rtol=1e-6)
+
+
+# ==========================================
+# 12. خيارات المشفر (Encoder Backends)
+# ==========================================
+class EncoderBackendTests(SimpleTestCase):
+
+    @override_settings(AI_ENCODER_BACKEND='hashing', AI_ENCODER_MAX_SEQ_LENGTH=3, AI_ENCODER_THREADS=2)
+    def test_engine_uses_configured_backend_and_truncation(self):
+        engine = SmartLibraryAI()
+        self.assertIsInstance(engine.model, HashingEncoder)
+        self.assertEqual(engine.model.max_seq_length, 3)
+        # النص الطويل يقص بعد أول 3 رموز
+        long_text, short_text = engine.model.encode(['one two three four five', 'one two three'])
+        np.testing.assert_array_equal(long_text, short_text)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            load_encoder('onnx')
+
+
+# ==========================================
+# 13. الفهرس المشترك بين العمال (Shared Memory-mapped Index)
+# ==========================================
+class SharedIndexTests(LibraryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(AI_SHARED_INDEX_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.local = get_ai_engine()
+        self.local.sync_embeddings()
+
+    def search(self, engine, text):
+        return [int(book_id) for book_id in engine._load_index().search(self.local.encode_query(text), 5)[0]]
+
+    def test_workers_read_published_files_and_overlay_later_changes(self):
+        publish_index(self.directory, EmbeddingStore())
+        worker = SmartLibraryAI(encoder=HashingEncoder())
+        index = worker._load_index()
+        self.assertIsInstance(index.matrix, np.memmap)
+        self.assertEqual(self.search(worker, 'كتاب رقم 1'), self.search(self.local, 'كتاب رقم 1'))
+
+        # تعديلات بعد النشر: تظهر فوراً دون إعادة النشر
+        edited = self.books[3]
+        edited.title = 'Cooking recipes'
+        edited.save()
+        self.books[1].delete()
+        self.local.sync_embeddings()
+
+        self.assertEqual(self.search(worker, 'Cooking recipes'), self.search(self.local, 'Cooking recipes'))
+        self.assertNotIn(self.books[1].pk, self.search(worker, 'كتاب رقم 1'))
+        self.assertEqual(self.search(worker, 'Cooking recipes')[0], edited.pk)
+
+    def test_new_version_is_picked_up_without_dropping_old_readers(self):
+        first = publish_index(self.directory, EmbeddingStore(), keep=1)
+        worker = SharedIndex(self.directory)
+        old = worker.load(EmbeddingStore())
+        self.assertTrue(old.version.startswith(first))
+
+        second = publish_index(self.directory, EmbeddingStore(), keep=1)
+        self.assertEqual(sorted(name for name in os.listdir(self.directory) if name.startswith('v')), [second])
+        current = worker.load(EmbeddingStore())
+        self.assertTrue(current.version.startswith(second))
+        # طلب بدأ على الإصدار القديم يكمل رغم حذف ملفاته
+        query = self.local.encode_query('كتاب')
+        np.testing.assert_array_equal(old.search(query, 3)[0], current.search(query, 3)[0])
+
+    def test_overlay_counts_replaced_and_added_rows(self):
+        publish_index(self.directory, EmbeddingStore())
+        edited = self.books[3]
+        edited.title = 'Cooking recipes'
+        edited.save()
+        self.books[1].delete()
+        Book.objects.create(isbn='9780000000400', title='Gardening', author='مؤلف')
+        self.local.sync_embeddings()
+
+        index = SharedIndex(self.directory).load(EmbeddingStore())
+        self.assertEqual(len(index), BookEmbedding.objects.count())
+
+    def test_neighbors_read_mapped_vectors_not_a_worker_copy(self):
+        publish_index(self.directory, EmbeddingStore())
+        edited = self.books[3]
+        edited.title = 'Cooking recipes'
+        edited.save()
+        self.local.sync_embeddings()
+        self.local.rebuild_neighbors()
+        expected = {book.pk: self.local.get_recommendations(book.pk) for book in self.books}
+
+        BookNeighbor.objects.all().delete()
+        worker = SmartLibraryAI(encoder=HashingEncoder())
+        # القائمة تحسب عند الطلب (fill_neighbors) ثم التحديث بعد تعديل كتاب (refresh_neighbors)
+        self.assertEqual(worker.get_recommendations(self.books[0].pk), expected[self.books[0].pk])
+        worker.refresh_neighbors([edited.pk])
+        self.assertEqual(worker.get_recommendations(edited.pk), expected[edited.pk])
+        # لم تحمّل نسخة float32 خاصة بالعامل من قاعدة البيانات
+        self.assertIsNone(worker.store.loaded_version)
+
+    def test_quantized_files_rerank_from_mapped_vectors(self):
+        publish_index(self.directory, EmbeddingStore(), quantization='int8')
+        with self.assertNumQueries(1):
+            # فحص إصدار المخزن فقط؛ المتجهات الدقيقة من الملف لا من قاعدة البيانات
+            index = SharedIndex(self.directory).load(EmbeddingStore())
+            ids, _ = index.search(self.local.encode_query('كتاب رقم 2'), 3)
+        self.assertIsInstance(index.matrix, QuantizedMatrix)
+        self.assertEqual(ids.tolist(), self.search(self.local, 'كتاب رقم 2')[:3])
+
+
+# ==========================================
+# 14. تحديث مخزن المتجهات (Embedding Freshness)
+# ==========================================
+class EmbeddingFreshnessTests(LibraryTestCase):
+
+    def test_rebuild_overwrites_vectors_in_place(self):
+        get_ai_engine().sync_embeddings()
+        before = dict(BookEmbedding.objects.values_list('book_id', 'vector'))
+
+        # إعادة بناء تفشل في منتصفها لا تترك المخزن فارغاً
+        set_ai_engine(SmartLibraryAI(encoder=RecordingEncoder(error=RuntimeError('model failed'))))
+        with self.assertRaises(RuntimeError):
+            call_command('build_embeddings', '--rebuild', '--skip-neighbors', stdout=io.StringIO())
+        self.assertEqual(dict(BookEmbedding.objects.values_list('book_id', 'vector')), before)
+
+        # مشفر جديد: كل المتجهات تستبدل في مكانها (نفس الصفوف، متجهات مختلفة)
+        set_ai_engine(SmartLibraryAI(encoder=HashingEncoder(max_seq_length=1)))
+        call_command('build_embeddings', '--rebuild', '--skip-neighbors', stdout=io.StringIO())
+        after = dict(BookEmbedding.objects.values_list('book_id', 'vector'))
+        self.assertEqual(set(after), set(before))
+        self.assertTrue(all(after[book_id] != before[book_id] for book_id in before))
+
+    def test_rolled_back_changes_do_not_block_the_queue(self):
+        # نبدأ بطابور فارغ (ما بقي من إنشاء الكتب المشتركة في setUpTestData يشفر الآن)
+        embedding_updates.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Book.objects.create(isbn='9780000000100', title='مسودة', author='مؤلف', total_copies=1, available_copies=1)
+                raise RuntimeError
+            added = Book.objects.create(isbn='9780000000101', title='Cooking recipes', author='مؤلف',
+                                        total_copies=1, available_copies=1)
+            edited = self.books[0]
+            edited.title = 'Gardening'
+            edited.save()
+
+        stored = dict(BookEmbedding.objects.values_list('book_id', 'content_hash'))
+        self.assertIn(added.pk, stored)
+        self.assertEqual(stored[edited.pk], content_hash(book_content(edited.title, edited.description, edited.tags)))
+
+    def test_recommendations_fill_missing_neighbors_on_demand(self):
+        get_ai_engine().sync_embeddings()
+        self.assertFalse(BookNeighbor.objects.exists())
+        recommended = get_ai_engine().get_recommendations(self.books[0].pk)
+        self.assertEqual(len(recommended), 4)
+        self.assertNotIn(self.books[0], recommended)
+
+    def test_empty_store_falls_back_to_lexical_search(self):
+        # لا تشفير لكامل الفهرس داخل طلب البحث؛ البناء من build_embeddings
+        results = get_ai_engine().semantic_search('كتاب رقم 3')
+        self.assertFalse(BookEmbedding.objects.exists())
+        self.assertEqual(results[0]['id'], self.books[3].pk)
+
+
+# ==========================================
+# 15. تجميع استعلامات التشفير (Micro-batching)
+# ==========================================
+class RecordingEncoder(HashingEncoder):
+    """مشفر يسجل كل دفعة، ويمكن إيقافه عند أول دفعة أو جعله يفشل"""
+
+    def __init__(self, error=None, hold=False):
+        super().__init__()
+        self.batches = []
+        self.error = error
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+
+    def encode(self, sentences, **kwargs):
+        self.batches.append(list(sentences))
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return super().encode(sentences, **kwargs)
+
+
+class BatchingEncoderTests(SimpleTestCase):
+
+    def test_thread_starts_on_first_query_only(self):
+        batcher = BatchingEncoder(RecordingEncoder())
+        self.assertIsNone(batcher._worker)
+        self.assertEqual(batcher.encode(['كتاب']).shape, (1, HashingEncoder().dimension))
+        self.assertTrue(batcher._worker.is_alive())
+
+    def test_concurrent_queries_share_one_batch(self):
+        encoder = RecordingEncoder()
+        batcher = BatchingEncoder(encoder, max_batch_size=3, max_wait=5)
+        futures = [batcher.submit(text) for text in ('أ', 'ب', 'ج')]
+        vectors = [future.result(5) for future in futures]
+        self.assertEqual(encoder.batches, [['أ', 'ب', 'ج']])
+        np.testing.assert_allclose(vectors[1], encoder.encode(['ب'])[0])
+        self.assertEqual(batcher.stats()['average_batch_size'], 3.0)
+
+    def test_cancelled_queries_are_skipped(self):
+        encoder = RecordingEncoder(hold=True)
+        batcher = BatchingEncoder(encoder, max_batch_size=1)
+        first = batcher.submit('أول')
+        self.assertTrue(encoder.started.wait(5))
+        cancelled = batcher.submit('ملغى')
+        self.assertTrue(cancelled.cancel())
+        last = batcher.submit('أخير')
+        encoder.release.set()
+        first.result(5), last.result(5)
+        self.assertEqual(encoder.batches, [['أول'], ['أخير']])
+
+    def test_encoder_errors_reach_every_caller(self):
+        batcher = BatchingEncoder(RecordingEncoder(error=RuntimeError('model failed')), max_batch_size=2, max_wait=5)
+        futures = [batcher.submit(text) for text in ('أ', 'ب')]
+        for future in futures:
+            with self.assertRaisesRegex(RuntimeError, 'model failed'):
+                future.result(5)
+
+    def test_worker_is_restarted_after_fork(self):
+        batcher = BatchingEncoder(RecordingEncoder())
+        batcher.encode(['قبل'])
+        parent_worker = batcher._worker
+        # نفس ما يراه عامل ورث الكائن بعد التفرع: رقم العملية تغيّر وخيط الأم غير موجود
+        batcher._pid = -1
+        self.assertEqual(len(batcher.encode(['بعد'])), 1)
+        self.assertIsNot(batcher._worker, parent_worker)
+
+
+# ==========================================
+# 16. البحث النصي (BM25 Lexical Index)
+# ==========================================
+class LexicalIndexTests(LibraryTestCase):
+
+    def search(self, index, text):
+        index.refresh()
+        return index.search(text, k=10)[0].tolist()
+
+    def test_arabic_normalization(self):
+        self.assertEqual(tokenize('الْمَكْتَبَةُ والمكتبة بالمكتبة للمكتبة'), ['مكتبه'] * 4)
+        self.assertEqual(tokenize('أحمد إسلام آداب مستشفى'), ['احمد', 'اسلام', 'اداب', 'مستشفي'])
+        self.assertEqual(tokenize('Python ٱلبرمجة'), ['python', 'برمجه'])
+
+    def test_article_is_kept_on_short_stems(self):
+        # "بالون" ليست "ب + ال + ون"، و"الله" ليست "ال + له"
+        self.assertEqual(tokenize('بالون الله والله'), ['بالون', 'الله', 'والله'])
+        Book.objects.create(isbn='9780000000300', title='له وطن', author='مؤلف')
+        self.assertEqual(self.search(LexicalIndex(), 'الله'), [])
+
+    def test_bm25_scores(self):
+        Book.objects.all().delete()
+        first = Book.objects.create(isbn='111', title='python', author='smith')
+        second = Book.objects.create(isbn='222', title='java', author='smith', description='python')
+        index = LexicalIndex()
+        index.refresh()
+
+        # الطولان الموزونان 7 و8 (العنوان ×3، المؤلف وISBN ×2، الوصف ×1)، والمتوسط 7.5
+        idf = math.log(1 + 0.5 / 2.5)
+        expected = [idf * 3 * 2.2 / (3 + 1.2 * (0.25 + 0.75 * 7 / 7.5)),
+                    idf * 1 * 2.2 / (1 + 1.2 * (0.25 + 0.75 * 8 / 7.5))]
+        ids, scores = index.search('Python', k=10)
+        self.assertEqual(ids.tolist(), [first.pk, second.pk])
+        np.testing.assert_allclose(scores, expected, rtol=1e-5)
+
+        # المصطلح النادر يرجح على المشترك بين كل الكتب
+        self.assertEqual(index.search('smith java', k=10)[0].tolist(), [second.pk, first.pk])
+
+    def test_incremental_refresh_tracks_edits_additions_and_deletions(self):
+        index = LexicalIndex()
+        self.assertEqual(self.search(index, 'كتاب رقم 2')[0], self.books[2].pk)
+
+        edited = self.books[1]
+        edited.title = 'Cooking recipes'
+        edited.save()
+        self.books[4].delete()
+        added = Book.objects.create(isbn='9780000000301', title='Gardening', author='مؤلف')
+
+        self.assertEqual(self.search(index, 'Cooking'), [edited.pk])
+        self.assertEqual(self.search(index, 'Gardening'), [added.pk])
+        self.assertNotIn(self.books[4].pk, self.search(index, 'كتاب'))
+        self.assertEqual(len(index), 5)
+
+    def test_delete_and_late_commit_with_same_count(self):
+        index = LexicalIndex()
+        index.refresh()
+        # حذف كتاب، وكتاب اعتمد بعد التحديث بوقت أقدم من العلامة (معاملة طويلة): العدد لم يتغير
+        self.books[0].delete()
+        late = Book.objects.create(isbn='9780000000302', title='Gardening', author='مؤلف')
+        Book.objects.filter(pk=late.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        self.books[2].save()
+
+        self.assertEqual(self.search(index, 'Gardening'), [late.pk])
+        self.assertNotIn(self.books[0].pk, self.search(index, 'كتاب'))
+        self.assertEqual(len(index), 5)
+
+    def test_hyphenated_isbn_matches_without_the_model(self):
+        first = Book.objects.create(isbn='978-1612680194', title='Rich Dad Poor Dad', author='Kiyosaki')
+        second = Book.objects.create(isbn='978-1612680200', title='Cashflow Quadrant', author='Kiyosaki')
+        self.assertIn('9781612680194', tokenize(first.isbn))
+
+        encoder = RecordingEncoder()
+        engine = SmartLibraryAI(encoder=encoder)
+        engine.sync_embeddings()
+        encoder.batches.clear()
+
+        for query in ('978-1612680194', '9781612680194', '978 1612680194'):
+            self.assertEqual([result['id'] for result in engine.semantic_search(query)], [first.pk])
+        self.assertEqual([result['id'] for result in engine.semantic_search('978-16126')], [first.pk, second.pk])
+        self.assertEqual(encoder.batches, [])
+
+
+# ==========================================
+# 17. رفض الطلبات عند امتلاء منفذ الاستدلال (Backpressure)
+# ==========================================
+class InferenceBackpressureTests(LibraryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # منفذ بمكان واحد يشغله عمل معلق حتى نهاية الاختبار
+        self.executor = InferenceExecutor(max_workers=1, max_queue=0)
+        self.release = threading.Event()
+        self.executor.submit(self.release.wait, 5)
+        self.addCleanup(self.release.set)
+        previous, inference._executor = inference._executor, self.executor
+        self.addCleanup(setattr, inference, '_executor', previous)
+        self.client.force_login(self.student_user)
+
+    def test_saturated_executor_returns_503(self):
+        response = self.client.get(reverse('library:search_api'), {'q': 'كتاب'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertIn('error', response.json())
+
+        response = self.client.get(reverse('library:search_async'), {'q': 'كتاب'})
+        self.assertEqual(response.status_code, 503)
+
+
+# ==========================================
+# 18. تسجيل عمليات البحث على دفعات (Buffered Search Log)
+# ==========================================
+class SearchLogBufferTests(TransactionTestCase):
+    """خيط الكتابة يستخدم اتصال قاعدة بيانات خاصاً به، فالبيانات يجب أن تكون معتمدة فعلاً"""
+
+    def test_full_batch_is_written_without_waiting_for_interval(self):
+        buffer = SearchLogBuffer(batch_size=3, flush_interval=60)
+        # لا نترك أحداثاً لتفريغ atexit (يعمل بعد حذف قاعدة الاختبار فيكتب في القاعدة الحقيقية)
+        self.addCleanup(buffer.flush)
+        for index in range(3):
+            buffer.record(None, f'استعلام {index}', index)
+
+        deadline = time.monotonic() + 5
+        while buffer.stats()['flushed'] < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(buffer.stats(), {'pending': 0, 'flushed': 3, 'dropped': 0, 'failed': 0})
+        self.assertEqual(sorted(SearchLog.objects.values_list('result_count', flat=True)), [0, 1, 2])
+
+    def test_events_beyond_capacity_are_counted_as_dropped(self):
+        buffer = SearchLogBuffer(batch_size=100, flush_interval=60, capacity=2)
+        self.addCleanup(buffer.flush)
+        for index in range(5):
+            buffer.record(None, f'استعلام {index}', index)
+        self.assertEqual(buffer.stats()['pending'], 2)
+        self.assertEqual(buffer.stats()['dropped'], 3)
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(sorted(SearchLog.objects.values_list('result_count', flat=True)), [0, 1])
+        # بعد التفريغ يقبل المخزن أحداثاً جديدة
+        buffer.record(None, 'استعلام أخير', 9)
+        self.assertEqual(buffer.stats()['pending'], 1)
+
+
+# ==========================================
+# 19. جداول الإحصاءات التزايدية (Rollup Watermarks)
+# ==========================================
+@override_settings(ANALYTICS_ROLLUP_LAG=0)
+class RollupTests(LibraryTestCase):
+
+    def borrow(self, book, returned=False):
+        trans = Transaction.objects.create(book=book, student=self.student)
+        if returned:
+            now = timezone.now()
+            Transaction.objects.filter(pk=trans.pk).update(
+                status='returned', borrow_date=now - timedelta(days=3), return_date=now,
+            )
+        return trans
+
+    def snapshot(self):
+        return (
+            sorted(DailyBookStats.objects.values_list('book_id', 'day', 'borrows', 'returns', 'loan_seconds')),
+            sorted(DailySearchGap.objects.values_list('query_text', 'day', 'attempts')),
+        )
+
+    def test_second_run_is_idempotent(self):
+        self.borrow(self.books[0])
+        self.borrow(self.books[0], returned=True)
+        SearchLog.objects.create(query_text='كتاب مفقود', result_count=0)
+        SearchLog.objects.create(query_text='كتاب موجود', result_count=3)
+
+        self.assertEqual(refresh_rollups(), {'borrows': 2, 'returns': 1, 'search_gaps': 1})
+        first = self.snapshot()
+        self.assertEqual(refresh_rollups(), {'borrows': 0, 'returns': 0, 'search_gaps': 0})
+        call_command('rollup_stats', stdout=io.StringIO())
+        self.assertEqual(self.snapshot(), first)
+
+    def test_rows_after_watermark_are_counted_once(self):
+        self.borrow(self.books[0])
+        refresh_rollups()
+
+        self.borrow(self.books[0])
+        self.borrow(self.books[1], returned=True)
+        SearchLog.objects.create(query_text='كتاب مفقود', result_count=0)
+        self.assertEqual(refresh_rollups(), {'borrows': 2, 'returns': 1, 'search_gaps': 1})
+        self.assertEqual(refresh_rollups(), {'borrows': 0, 'returns': 0, 'search_gaps': 0})
+
+        # نفس النتيجة لو بنيت الجداول من البداية
+        incremental = self.snapshot()
+        call_command('rollup_stats', '--rebuild', stdout=io.StringIO())
+        self.assertEqual(self.snapshot(), incremental)
+        self.assertEqual(most_borrowed()[0]['total_borrows'], 2)
+
+    @override_settings(ANALYTICS_ROLLUP_LAG=60)
+    def test_row_committed_late_with_lower_id_is_counted(self):
+        # طلب حديث (أحدث من المهلة) لا تتجاوزه العلامة بعد
+        later = Transaction.objects.create(id=1000, book=self.books[0], student=self.student)
+        self.assertEqual(refresh_rollups()['borrows'], 0)
+
+        # معاملة حجزت معرفاً أصغر وثبتت بعد التشغيل السابق
+        Transaction.objects.create(id=999, book=self.books[1], student=self.student)
+        Transaction.objects.filter(pk__in=[999, later.pk]).update(request_date=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(refresh_rollups()['borrows'], 2)
+        self.assertEqual(refresh_rollups()['borrows'], 0)
+        self.assertEqual(_watermark('transactions').position, 1000)
+
+    def test_stale_watermark_is_rejected(self):
+        mark = _watermark('transactions')
+        concurrent = _watermark('transactions')
+        _advance(concurrent, position=10)
+        with self.assertRaises(RollupConflict):
+            _advance(mark, position=5)
+        self.assertEqual(RollupWatermark.objects.get(name='transactions').position, 10)
+
+
+# ==========================================
+# 20. الفهرس التقريبي (IVF Index)
+# ==========================================
+def clustered_vectors(count, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    matrix = centers[rng.integers(0, clusters, count)] + 0.3 * rng.normal(size=(count, dim))
+    return np.arange(1, count + 1), normalize_rows(matrix.astype(np.float32))
+
+
+class IVFIndexTests(SimpleTestCase):
+
+    def test_recall_against_exact_search(self):
+        ids, matrix = clustered_vectors(2000)
+        exact = ExactIndex(ids, matrix)
+        ivf = IVFIndex(ids, matrix, nlist=20, nprobe=4, seed=0)
+        queries = normalize_rows(matrix[::40] + 0.1 * np.random.default_rng(1).normal(size=(50, 32)).astype(np.float32))
+
+        recall = np.mean([len(np.intersect1d(exact.search(query, 10)[0], ivf.search(query, 10)[0])) / 10
+                          for query in queries])
+        self.assertGreaterEqual(recall, 0.95)
+
+    def test_empty_index(self):
+        index = IVFIndex([], np.empty((0, 8), dtype=np.float32))
+        ids, scores = index.search(np.ones(8, dtype=np.float32), 5)
+        self.assertEqual((len(index), len(ids), len(scores)), (0, 0, 0))
+
+    def test_k_and_nlist_larger_than_index(self):
+        ids, matrix = clustered_vectors(5)
+        index = IVFIndex(ids, matrix, nlist=50, nprobe=50)
+        self.assertEqual(index.nlist, 5)
+
+        found, scores = index.search(matrix[2], 10)
+        expected, expected_scores = ExactIndex(ids, matrix).search(matrix[2], 10)
+        np.testing.assert_array_equal(found, expected)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+
+    def test_update_reuses_centroids_until_drift_threshold(self):
+        ids, matrix = clustered_vectors(1000)
+        index = IVFIndex(ids, matrix, nlist=20, retrain_drift=0.2)
+
+        # تعديل كتاب واحد: نفس المراكز، والكتاب المعدل في قائمته الجديدة
+        edited = matrix.copy()
+        edited[5] = matrix[500]
+        updated = index.update(ids, edited)
+        self.assertIs(updated.centroids, index.centroids)
+        self.assertEqual(updated.drift, 1)
+        self.assertIn(6, updated.search(matrix[500], 2)[0])
+
+        # أكثر من 20% من الكتب تغيرت: يعاد التدريب
+        edited[:250] = matrix[500:750]
+        retrained = updated.update(ids, edited)
+        self.assertIsNot(retrained.centroids, index.centroids)
+        self.assertEqual(retrained.drift, 0)
+
+    @override_settings(AI_VECTOR_INDEX_BACKEND='ivf')
+    def test_engine_does_not_retrain_after_single_edit(self):
+        engine = SmartLibraryAI(encoder=HashingEncoder())
+        ids, matrix = clustered_vectors(100)
+        engine._load_embeddings = lambda serving=False: (ids, matrix)
+        first = engine._load_index()
+
+        matrix = matrix.copy()
+        matrix[0] = matrix[1]
+        second = engine._load_index()
+        self.assertIsNot(second, first)
+        self.assertIs(second.centroids, first.centroids)
+
+
+# ==========================================
+# 21. الذاكرة المؤقتة للاستعلامات والنتائج (Query Cache)
+# ==========================================
+class QueryCacheTests(SimpleTestCase):
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = QueryCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+
+    @mock.patch('library.query_cache.time.monotonic')
+    def test_entries_expire_after_ttl(self, clock):
+        cache = QueryCache(ttl=10)
+        clock.return_value = 100.0
+        cache.set('a', 1)
+        clock.return_value = 109.9
+        self.assertEqual(cache.get('a'), 1)
+        clock.return_value = 110.0
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_hit_and_miss_counters(self):
+        cache = QueryCache()
+        cache.get('a')
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('a')
+        self.assertEqual(cache.stats(), {'size': 1, 'hits': 2, 'misses': 1, 'hit_rate': 2 / 3})
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'query-cache-tests'},
+    })
+    def test_django_cache_is_shared_between_instances(self):
+        writer = QueryCache(cache_alias='shared', prefix='test')
+        reader = QueryCache(cache_alias='shared', prefix='test')
+        self.addCleanup(writer._shared().clear)
+
+        writer.set(('v1', 'python'), [1, 2])
+        self.assertEqual(reader.get(('v1', 'python')), [1, 2])
+        self.assertEqual(reader.stats()['size'], 1)
+        self.assertIsNone(reader.get(('v2', 'python')))
+        self.assertEqual((reader.hits, reader.misses), (1, 1))
+
+
+class SearchCacheTests(LibraryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.encoder = RecordingEncoder()
+        self.engine = SmartLibraryAI(encoder=self.encoder)
+        self.engine.sync_embeddings()
+        self.encoder.batches.clear()
+
+    def test_query_text_is_encoded_as_typed(self):
+        self.engine.encode_query('  Python   Basics ')
+        self.engine.encode_query('Python Basics')
+        self.engine.encode_query('python basics')
+        # المسافات توحد في المفتاح فقط، وحالة الأحرف تغير المتجه فلا تشترك في المفتاح
+        self.assertEqual(self.encoder.batches, [['  Python   Basics '], ['python basics']])
+
+    def test_results_are_invalidated_when_an_index_changes(self):
+        first = self.engine.semantic_search('كتاب رقم 2')
+        self.assertEqual(self.engine.semantic_search('كتاب رقم 2'), first)
+        self.assertEqual(self.engine.result_cache.hits, 1)
+
+        # كتاب جديد: يتغير إصدار الفهرس النصي (المتجهات لم تحدث بعد)
+        added = Book.objects.create(isbn='9780000000500', title='كتاب رقم 2 جديد', author='مؤلف')
+        self.assertIn(added.pk, [result['id'] for result in self.engine.semantic_search('كتاب رقم 2')])
+        self.assertEqual(self.engine.result_cache.hits, 1)
+
+        # تحديث المتجهات: يتغير إصدار فهرس المتجهات
+        version = self.engine._load_index().version
+        self.engine.sync_embeddings()
+        self.engine.semantic_search('كتاب رقم 2')
+        self.assertNotEqual(self.engine._load_index().version, version)
+        self.assertEqual(self.engine.result_cache.hits, 1)
+
+
+# ==========================================
+# 22. استيراد الكتب بالجملة (import_books)
+# ==========================================
+class ImportBooksTests(LibraryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.encoder = RecordingEncoder()
+        set_ai_engine(SmartLibraryAI(encoder=self.encoder))
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(text)
+        return path
+
+    def run_import(self, *args):
+        output = io.StringIO()
+        call_command('import_books', *args, stdout=output)
+        return output.getvalue()
+
+    def test_existing_isbn_is_updated_not_duplicated(self):
+        existing = self.books[0]
+        Book.objects.filter(pk=existing.pk).update(available_copies=1)
+        path = self.write('books.csv', (
+            'isbn,title,author,total_copies\n'
+            f'{existing.isbn},Updated title,New author,7\n'
+            '9780000000600,New book,Author,2\n'
+        ))
+        self.run_import(path)
+
+        self.assertEqual(Book.objects.count(), len(self.books) + 1)
+        existing.refresh_from_db()
+        self.assertEqual((existing.title, existing.author, existing.total_copies), ('Updated title', 'New author', 7))
+        # النسخ المتاحة تعكس الإعارات الجارية فلا يغيرها الاستيراد
+        self.assertEqual(existing.available_copies, 1)
+        self.assertEqual(BookEmbedding.objects.filter(book__isbn__in=[existing.isbn, '9780000000600']).count(), 2)
+        self.assertTrue(BookNeighbor.objects.filter(book=existing).exists())
+
+    def test_malformed_rows_are_skipped_and_counted(self):
+        path = self.write('books.jsonl', '\n'.join([
+            '{"isbn": "9780000000601", "title": "Valid"}',
+            '{"isbn": "9780000000602"}',
+            '{"title": "No ISBN"}',
+            '{"isbn": "9780000000603", "title": "Bad copies", "total_copies": "many"}',
+            '{not json',
+            '{"isbn": "9780000000604", "title": "Also valid", "total_copies": 3}',
+        ]))
+        output = self.run_import(path, '--skip-neighbors')
+
+        self.assertIn('imported 2 books, skipped 4 invalid rows', output)
+        self.assertEqual(set(Book.objects.filter(isbn__startswith='97800000006').values_list('isbn', flat=True)),
+                         {'9780000000601', '9780000000604'})
+
+    def test_resumes_from_checkpoint_after_interruption(self):
+        path = self.write('books.csv', 'isbn,title\n' + ''.join(
+            f'97800000007{index:02d},Imported {index}\n' for index in range(5)
+        ))
+
+        # انقطاع عند تشفير الدفعة الثانية: الدفعة الأولى محفوظة ونقطة الاستئناف بعدها
+        encode = self.encoder.encode
+        calls = []
+
+        def interrupted(sentences, **kwargs):
+            calls.append(sentences)
+            if len(calls) == 2:
+                raise RuntimeError('killed')
+            return encode(sentences, **kwargs)
+
+        with mock.patch.object(self.encoder, 'encode', side_effect=interrupted):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, '--chunk-size', '2', '--skip-neighbors')
+        self.assertEqual(Book.objects.filter(isbn__startswith='97800000007').count(), 4)
+        with open(f'{path}.import-state.json', encoding='utf-8') as handle:
+            self.assertEqual(json.load(handle)['rows'], 2)
+
+        self.encoder.batches.clear()
+        output = self.run_import(path, '--chunk-size', '2', '--skip-neighbors')
+        self.assertIn('Resuming', output)
+        self.assertIn('imported 3 books', output)
+        self.assertEqual(Book.objects.filter(isbn__startswith='97800000007').count(), 5)
+        self.assertEqual(BookEmbedding.objects.filter(book__isbn__startswith='97800000007').count(), 5)
+        # الصفوف المنجزة قبل الانقطاع لا يعاد تشفيرها
+        encoded = [content for batch in self.encoder.batches for content in batch]
+        self.assertFalse(any(content.startswith(('Imported 0', 'Imported 1')) for content in encoded))
+        self.assertFalse(os.path.exists(f'{path}.import-state.json'))
@@ -26,6 +26,10 @@ urlpatterns = [
     
     # صفحة نتائج البحث الدلالي (تستخدم الذكاء الاصطناعي)
     path('search/', views.search_view, name='search'),
+
+    # نسخة غير متزامنة من البحث (للتشغيل عبر ASGI) وواجهة JSON له
+    path('search/async/', views.search_async_view, name='search_async'),
+    path('api/search/', views.search_api, name='search_api'),
     
     # صفحة تفاصيل الكتاب (وتحوي التوصيات المشابهة وزر الاستعارة)
     path('book/<int:book_id>/', views.book_detail, name='book_detail'),
@@ -0,0 +1,214 @@
+import copy
+
+import numpy as np
+
+
+def top_k(scores, k, min_score=None):
+    """
+    اختيار أفضل k نتيجة بدون ترتيب كامل: argpartition بتعقيد O(N)
+    ثم ترتيب العناصر المختارة فقط (O(k log k)).
+    """
+    candidates = np.flatnonzero(scores > min_score) if min_score is not None else np.arange(len(scores))
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+# ==========================================
+# 1. الواجهة المشتركة (Vector Index Interface)
+# ==========================================
+class VectorIndex:
+    """
+    فهرس المتجهات: يستقبل معرفات الكتب ومصفوفة متجهاتها المطبّعة (float32)،
+    ويجيب على الاستعلام search(vector, k, min_score) بمعرفات أقرب الكتب ودرجات تشابهها.
+    """
+
+    # إصدار البيانات التي بني منها الفهرس (مفتاح الذاكرة المؤقتة للنتائج)
+    version = None
+
+    def __init__(self, ids, matrix):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, vector, k, min_score=None):
+        raise NotImplementedError
+
+
+# ==========================================
+# 2. البحث الدقيق (Exact Brute-force)
+# ==========================================
+class ExactIndex(VectorIndex):
+    """مقارنة الاستعلام مع جميع الكتب بعملية ضرب واحدة، ثم argpartition لأفضل k"""
+
+    def search(self, vector, k, min_score=None):
+        if not len(self.ids):
+            return self.ids, np.empty(0, dtype=np.float32)
+        scores = self.matrix @ np.asarray(vector, dtype=np.float32)
+        selected = top_k(scores, k, min_score)
+        return self.ids[selected], scores[selected]
+
+
+# ==========================================
+# 3. البحث التقريبي (IVF - Inverted File Index)
+# ==========================================
+class IVFIndex(VectorIndex):
+    """
+    فهرس تقريبي (Approximate Nearest Neighbour) مبني بـ NumPy فقط:
+    - تقسيم الكتب إلى nlist مجموعة بخوارزمية K-Means الكروية (Spherical K-Means).
+    - عند البحث نقارن الاستعلام مع المراكز أولاً، ثم نفحص كتب أقرب nprobe مجموعات فقط.
+    الكتب مرتبة حسب المجموعة بحيث تكون كل قائمة شريحة متصلة في الذاكرة.
+    بعد تعديل بعض الكتب يبنى الفهرس الجديد بـ update() بنفس المراكز، ولا يعاد التدريب إلا بعد أن تتجاوز
+    الكتب المضافة أو المعدلة أو المحذوفة منذ التدريب نسبة retrain_drift من الفهرس.
+    """
+
+    def __init__(self, ids, matrix, nlist=None, nprobe=8, iterations=10, seed=0, retrain_drift=0.2):
+        count = len(ids)
+        self.options = {'nlist': nlist, 'nprobe': nprobe, 'iterations': iterations, 'seed': seed,
+                         'retrain_drift': retrain_drift}
+        self.nlist = max(1, min(count, nlist or int(np.sqrt(count)) or 1))
+        self.nprobe = max(1, min(nprobe, self.nlist))
+        # عدد الكتب التي تغيرت منذ تدريب المراكز
+        self.drift = 0
+
+        if not count:
+            super().__init__(ids, matrix)
+            self.centroids = np.empty((0, 0), dtype=np.float32)
+            self.assignments = np.empty(0, dtype=np.int64)
+            self.offsets = np.zeros(1, dtype=np.int64)
+            return
+
+        rng = np.random.default_rng(seed)
+        self.centroids = self._train(matrix, iterations, rng)
+        self._fill(np.asarray(ids, dtype=np.int64), matrix, self._assign(matrix))
+
+    def _fill(self, ids, matrix, assignments):
+        order = np.argsort(assignments, kind='stable')
+        VectorIndex.__init__(self, ids[order], np.ascontiguousarray(matrix[order]))
+        self.assignments = assignments[order]
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=self.nlist), out=self.offsets[1:])
+
+    def update(self, ids, matrix, block=4096):
+        """
+        فهرس للبيانات المحدثة دون تدريب K-Means: الكتب التي لم يتغير متجهها تبقى في قائمتها،
+        والمضافة أو المعدلة فقط تقارن بالمراكز الحالية.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self.ids) or not len(ids) or matrix.shape[1] != self.centroids.shape[1]:
+            return IVFIndex(ids, matrix, **self.options)
+
+        # موقع كل كتاب في الفهرس السابق (إن وجد فيه)
+        by_id = np.argsort(self.ids)
+        found = np.minimum(np.searchsorted(self.ids, ids, sorter=by_id), len(self.ids) - 1)
+        previous = by_id[found]
+        unchanged = self.ids[previous] == ids
+        for start in range(0, len(ids), block):
+            rows = slice(start, start + block)
+            unchanged[rows] &= (self.matrix[previous[rows]] == matrix[rows]).all(axis=1)
+
+        changed = ~unchanged
+        removed = len(self.ids) - int(np.isin(self.ids, ids).sum())
+        drift = self.drift + int(changed.sum()) + removed
+        if drift > self.options['retrain_drift'] * len(ids):
+            return IVFIndex(ids, matrix, **self.options)
+
+        assignments = np.empty(len(ids), dtype=np.int64)
+        assignments[unchanged] = self.assignments[previous[unchanged]]
+        assignments[changed] = self._assign(matrix[changed])
+
+        index = copy.copy(self)
+        index._fill(ids, matrix, assignments)
+        index.drift = drift
+        return index
+
+    def _assign(self, matrix, block=4096):
+        assignments = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), block):
+            assignments[start:start + block] = np.argmax(matrix[start:start + block] @ self.centroids.T, axis=1)
+        return assignments
+
+    def _train(self, matrix, iterations, rng):
+        # التدريب على عينة محدودة يكفي لتقدير المراكز ويحافظ على سرعة البناء
+        sample_size = min(len(matrix), self.nlist * 256)
+        sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+        self.centroids = sample[rng.choice(sample_size, self.nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = self._assign(sample)
+            counts = np.bincount(assignments, minlength=self.nlist)
+            filled = counts > 0
+            starts = (np.cumsum(counts) - counts)[filled]
+            sums = np.zeros_like(self.centroids)
+            sums[filled] = np.add.reduceat(sample[np.argsort(assignments, kind='stable')], starts, axis=0)
+
+            # المجموعات الفارغة تعاد تهيئتها بنقطة عشوائية من العينة
+            empty = ~filled
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.centroids = (sums / norms).astype(np.float32)
+        return self.centroids
+
+    def search(self, vector, k, min_score=None):
+        if not len(self.ids):
+            return self.ids, np.empty(0, dtype=np.float32)
+        vector = np.asarray(vector, dtype=np.float32)
+
+        probes = top_k(self.centroids @ vector, self.nprobe)
+        positions = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probes])
+        scores = np.concatenate([self.matrix[self.offsets[c]:self.offsets[c + 1]] @ vector for c in probes])
+
+        selected = top_k(scores, k, min_score)
+        return self.ids[positions[selected]], scores[selected]
+
+
+# ==========================================
+# 4. البحث المضغوط مع إعادة الترتيب (Quantized Search + Re-ranking)
+# ==========================================
+class QuantizedIndex(VectorIndex):
+    """
+    مقارنة الاستعلام مع كل الكتب بالمتجهات المضغوطة (QuantizedMatrix) لاختيار k * rerank مرشح،
+    ثم إعادة ترتيبهم بالمتجهات الدقيقة (float32) التي ترجعها exact_vectors(ids) للمرشحين فقط.
+    min_score يطبق على الدرجات الدقيقة بعد إعادة الترتيب.
+    """
+
+    def __init__(self, ids, matrix, exact_vectors, rerank=4):
+        super().__init__(ids, matrix)
+        self.exact_vectors = exact_vectors
+        self.rerank = max(1, rerank)
+
+    def search(self, vector, k, min_score=None):
+        if not len(self.ids):
+            return self.ids, np.empty(0, dtype=np.float32)
+        vector = np.asarray(vector, dtype=np.float32)
+
+        candidates = top_k(self.matrix.dot(vector), k * self.rerank)
+        candidate_ids = self.ids[candidates]
+        scores = self.exact_vectors(candidate_ids) @ vector
+
+        selected = top_k(scores, k, min_score)
+        return candidate_ids[selected], scores[selected]
+
+
+INDEX_BACKENDS = {
+    'exact': ExactIndex,
+    'ivf': IVFIndex,
+}
+
+
+def build_index(ids, matrix, backend='exact', previous=None, **options):
+    """
+    إنشاء الفهرس حسب الإعداد AI_VECTOR_INDEX_BACKEND.
+    previous: الفهرس السابق من نفس النوع، يحدّث تدريجياً إن كان يدعم ذلك (IVFIndex.update).
+    """
+    try:
+        index_class = INDEX_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown vector index backend: {backend}")
+    if type(previous) is index_class and hasattr(previous, 'update'):
+        return previous.update(ids, matrix)
+    return index_class(ids, matrix, **options)
@@ -0,0 +1,245 @@
+import hashlib
+import threading
+
+import numpy as np
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import BookEmbedding
+
+
+def book_content(title, description, tags):
+    """النص الذي يمثل الكتاب دلالياً (نفس الصيغة المستخدمة في بناء السياق)"""
+    return f"{title} {description} {tags}"
+
+
+def content_hash(content):
+    """بصمة المحتوى: تتغير فقط عند تغيّر العنوان أو الوصف أو الوسوم"""
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def normalize_rows(matrix):
+    """تطبيع المتجهات (L2) بحيث يصبح حاصل الضرب النقطي مساوياً لتشابه جيب التمام"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# ==========================================
+# ضغط المتجهات (Vector Quantization)
+# ==========================================
+QUANTIZATION_MODES = (None, 'float16', 'int8')
+
+
+class QuantizedMatrix:
+    """
+    مصفوفة متجهات مضغوطة للبحث:
+    - 'float16': نصف الذاكرة بدقة كافية لترتيب المرشحين.
+    - 'int8': ربع الذاكرة بتكميم خطي لكل بُعد (Per-dimension Scalar Quantization):
+      x ≈ offset + scale * code حيث code بين -128 و127، و scale/offset محسوبة من أصغر وأكبر قيمة في كل بُعد.
+    """
+
+    def __init__(self, codes, scale=None, offset=None):
+        self.codes = codes
+        self.scale = scale
+        self.offset = offset
+
+    @classmethod
+    def encode(cls, matrix, mode):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if mode == 'float16':
+            return cls(matrix.astype(np.float16))
+        if mode != 'int8':
+            raise ValueError(f"Unknown vector quantization: {mode}")
+        if not matrix.size:
+            return cls(matrix.astype(np.int8), np.ones(matrix.shape[1:], np.float32), np.zeros(matrix.shape[1:], np.float32))
+
+        low, high = matrix.min(axis=0), matrix.max(axis=0)
+        scale = (high - low) / 255
+        scale[scale == 0] = 1.0
+        codes = np.clip(np.rint((matrix - low) / scale) - 128, -128, 127).astype(np.int8)
+        return cls(codes, scale.astype(np.float32), (low + 128 * scale).astype(np.float32))
+
+    @property
+    def mode(self):
+        return 'float16' if self.codes.dtype == np.float16 else 'int8'
+
+    def __len__(self):
+        return len(self.codes)
+
+    def decode(self, rows=slice(None)):
+        codes = self.codes[rows].astype(np.float32)
+        return codes if self.scale is None else codes * self.scale + self.offset
+
+    def dot(self, vector, block=1024):
+        """
+        الضرب النقطي التقريبي مع متجه الاستعلام على كتل (لحصر الذاكرة المؤقتة):
+        في int8: codes · (scale * v) + offset · v دون فك ضغط المصفوفة.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        weights, bias = (vector, 0.0) if self.scale is None else (self.scale * vector, float(self.offset @ vector))
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), block):
+            scores[start:start + block] = self.codes[start:start + block].astype(np.float32) @ weights
+        return scores + bias
+
+    @property
+    def nbytes(self):
+        extra = 0 if self.scale is None else self.scale.nbytes + self.offset.nbytes
+        return self.codes.nbytes + extra
+
+
+class EmbeddingStore:
+    """
+    مخزن متجهات الكتب (Embedding Store).
+    المتجهات محفوظة في جدول BookEmbedding، ويحتفظ كل عامل (Worker) بنسخة منها
+    كمصفوفة float32 واحدة في الذاكرة، يعاد تحميلها فقط عند تغيّر إصدار المخزن.
+    """
+
+    def __init__(self, batch_size=256, quantization=None):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown vector quantization: {quantization}")
+        self.batch_size = batch_size
+        # None (float32) أو 'float16' أو 'int8': الصيغة التي يحتفظ بها العامل في الذاكرة للبحث
+        self.quantization = quantization
+        self._lock = threading.Lock()
+        # (version, ids, matrix) تستبدل دفعة واحدة لضمان قراءة متسقة
+        self._snapshot = (None, np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32))
+        # (version, ids, QuantizedMatrix) للبحث عند تفعيل الضغط
+        self._quantized = (None, np.empty(0, dtype=np.int64), None)
+
+    def version(self):
+        """إصدار المخزن: يتغير مع أي إضافة أو تعديل أو حذف لمتجه"""
+        stats = BookEmbedding.objects.aggregate(count=Count('pk'), last=Max('updated_at'))
+        last = stats['last'].isoformat() if stats['last'] else ''
+        return f"{stats['count']}:{last}"
+
+    @property
+    def loaded_version(self):
+        """إصدار المصفوفة المحمّلة حالياً في الذاكرة (المضغوطة عند تفعيل الضغط)"""
+        return (self._quantized if self.quantization else self._snapshot)[0]
+
+    def read(self):
+        """قراءة (ids, matrix) كاملة بصيغة float32 دون الاحتفاظ بها في الذاكرة"""
+        rows = BookEmbedding.objects.order_by('book_id').values_list('book_id', 'vector')
+        ids = []
+        vectors = []
+        for book_id, vector in rows.iterator(chunk_size=2000):
+            ids.append(book_id)
+            vectors.append(np.frombuffer(vector, dtype=np.float32))
+        matrix = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+        return np.asarray(ids, dtype=np.int64), matrix
+
+    def load(self):
+        """إرجاع (ids, matrix) مع إعادة التحميل من قاعدة البيانات عند تغيّر الإصدار فقط"""
+        version = self.version()
+        snapshot = self._snapshot
+        if snapshot[0] == version:
+            return snapshot[1], snapshot[2]
+
+        with self._lock:
+            if self._snapshot[0] != version:
+                self._snapshot = (version, *self.read())
+            return self._snapshot[1], self._snapshot[2]
+
+    def load_quantized(self):
+        """
+        مثل load لكن يحتفظ بالمتجهات مضغوطة فقط (QuantizedMatrix)؛
+        مصفوفة float32 تقرأ مؤقتاً للضغط ثم تترك.
+        """
+        version = self.version()
+        snapshot = self._quantized
+        if snapshot[0] == version:
+            return snapshot[1], snapshot[2]
+
+        with self._lock:
+            if self._quantized[0] != version:
+                ids, matrix = self.read()
+                self._quantized = (version, ids, QuantizedMatrix.encode(matrix, self.quantization))
+            return self._quantized[1], self._quantized[2]
+
+    def exact_vectors(self, book_ids):
+        """المتجهات الدقيقة (float32) لكتب محددة بنفس ترتيب book_ids، لإعادة ترتيب المرشحين"""
+        book_ids = [int(book_id) for book_id in book_ids]
+        stored = dict(BookEmbedding.objects.filter(book_id__in=book_ids).values_list('book_id', 'vector'))
+        dimension = len(next(iter(stored.values()), b'')) // 4
+        matrix = np.zeros((len(book_ids), dimension), dtype=np.float32)
+        for row, book_id in enumerate(book_ids):
+            if book_id in stored:
+                matrix[row] = np.frombuffer(stored[book_id], dtype=np.float32)
+        return matrix
+
+    def sync(self, rows, encoder, force=False):
+        """
+        مزامنة المخزن مع الكتب: rows عبارة عن أزواج (book_id, content).
+        يتم تشفير الكتب الجديدة أو التي تغيّر محتواها فقط، على دفعات (Batches).
+        force=True: إعادة تشفير كل الكتب (بعد تغيير المشفر) بالكتابة فوق صفوفها دفعة بدفعة،
+        فيبقى المخزن ممتلئاً طوال العملية ولا يخسر متجهاته إن فشلت في منتصفها.
+        يرجع عدد المتجهات التي أعيد حسابها.
+        """
+        stored = dict(BookEmbedding.objects.values_list('book_id', 'content_hash'))
+        seen = set()
+        pending = []
+        for book_id, content in rows:
+            seen.add(book_id)
+            digest = content_hash(content)
+            if force or stored.get(book_id) != digest:
+                pending.append((book_id, content, digest))
+
+        self._encode_and_write(pending, encoder)
+
+        orphans = set(stored) - seen
+        if orphans:
+            self.remove(orphans)
+        return len(pending)
+
+    def update(self, rows, encoder):
+        """
+        تحديث جزئي لمجموعة محددة من الكتب (تستخدمه إشارات الحفظ).
+        لا يعاد تشفير الكتاب إلا إذا تغيّرت بصمة محتواه فعلاً.
+        يرجع معرفات الكتب التي أعيد تشفيرها.
+        """
+        pending = self.stale_rows(rows)
+        self._encode_and_write(pending, encoder)
+        return [book_id for book_id, _, _ in pending]
+
+    def stale_rows(self, rows):
+        """
+        من بين أزواج (book_id, content) ترجع الكتب التي تحتاج تشفيراً
+        على شكل (book_id, content, content_hash).
+        """
+        rows = list(rows)
+        stored = dict(
+            BookEmbedding.objects.filter(book_id__in=[book_id for book_id, _ in rows])
+            .values_list('book_id', 'content_hash')
+        )
+        pending = []
+        for book_id, content in rows:
+            digest = content_hash(content)
+            if stored.get(book_id) != digest:
+                pending.append((book_id, content, digest))
+        return pending
+
+    def remove(self, book_ids):
+        """حذف متجهات كتب محددة"""
+        BookEmbedding.objects.filter(book_id__in=list(book_ids)).delete()
+
+    def _encode_and_write(self, pending, encoder):
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            self.write(batch, encoder.encode([content for _, content, _ in batch]))
+
+    def write(self, batch, vectors):
+        """كتابة متجهات محسوبة مسبقاً لصفوف (book_id, content, content_hash)"""
+        vectors = normalize_rows(vectors)
+        now = timezone.now()
+        BookEmbedding.objects.bulk_create(
+            [
+                BookEmbedding(book_id=book_id, content_hash=digest, vector=vector.tobytes(), updated_at=now)
+                for (book_id, _, digest), vector in zip(batch, vectors)
+            ],
+            update_conflicts=True,
+            unique_fields=['book'],
+            update_fields=['content_hash', 'vector', 'updated_at'],
+        )
@@ -1,12 +1,20 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
-from django.db.models import Count, Avg, F, ExpressionWrapper, DurationField, Q
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q, Sum
 from django.utils import timezone
-from .models import Book, SearchLog, Transaction, StudentProfile
-from .ai_engine import SmartLibraryAI
+from .models import Book, NoCopiesAvailable, Reservation, Transaction, StudentProfile
+from .inference import InferenceQueueFull, get_inference_executor
+from .search_log import log_search
+# ملاحظة: محرك الذكاء الاصطناعي (numpy/scipy وsentence_transformers) يستورد داخل الدوال التي تحتاجه فقط،
+# حتى لا تدفع أوامر manage.py وصفحات الدخول والإدارة كلفة تحميله عند الإقلاع
+from . import rollups
 from .forms import UserRegistrationForm
 
 # ==========================================
@@ -87,15 +95,14 @@ def logout_view(request):
 @login_required
 def home(request):
     """الصفحة الرئيسية: تعرض أحدث الكتب أو التوصيات"""
+    from .ai_engine import get_ai_engine
+
     # 1. جلب الكتب المقترحة (AI Recommendations) إذا توفرت بيانات
-    ai_engine = SmartLibraryAI()
     recommended_books = []
     
-    # محاولة جلب توصيات بناءً على تخصص الطالب أو آخر استعارة
+    # توصيات شخصية من بصمة اهتمامات الطالب (متوسط متجهات ما استعاره أو قيّمه عالياً)
     if hasattr(request.user, 'studentprofile'):
-        # هنا يمكن تطوير المنطق لجلب كتب حسب التخصص
-        # حالياً سنجلب أحدث الكتب كافتراضي
-        pass
+        recommended_books = get_ai_engine().recommend_for_student(request.user.studentprofile)
 
     # إذا لم توجد توصيات خاصة، نعرض أحدث الكتب المضافة
     if not recommended_books:
@@ -103,50 +110,114 @@ def home(request):
     else:
         books = recommended_books
 
-    return render(request, 'library/home.html', {'books': books})
+    return render(request, 'library/home.html', {'recommendations': books})
 
 @login_required
 def search_view(request):
     """صفحة البحث الدلالي (Semantic Search)"""
+    from .ai_engine import get_ai_engine
+
     query = request.GET.get('q', '')
     results = []
     
     if query:
         # 1. تسجيل عملية البحث لتحليل الفجوة لاحقاً
         # نبحث أولاً هل سيجد نتائج أم لا، ثم نسجل
-        ai_engine = SmartLibraryAI()
+        ai_engine = get_ai_engine()
         results = ai_engine.semantic_search(query)
         
-        # تسجيل في السجل
-        SearchLog.objects.create(
-            user=request.user,
-            query_text=query,
-            result_count=len(results)
-        )
+        # تسجيل في السجل (يكتب على دفعات في الخلفية)
+        log_search(request.user, query, len(results))
     
     return render(request, 'library/search.html', {'results': results, 'query': query})
 
+# ==========================================
+# البحث غير المتزامن (Async Search - ASGI)
+# ==========================================
+# عند التشغيل عبر ASGI (مثل uvicorn) لا يحجز الطلب خيطاً أثناء الاستدلال،
+# بل ينتظر نتيجة المنفذ المحدود، فتستطيع عملية واحدة خدمة عدد كبير من العملاء البطيئين.
+
+def _run_search(query):
+    from .ai_engine import get_ai_engine
+
+    return get_ai_engine().semantic_search(query)
+
+
+async def _async_search(user, query):
+    """تنفيذ البحث في المنفذ المحدود ثم تسجيله في الخلفية دون تأخير الاستجابة"""
+    results = await get_inference_executor().run(_run_search, query)
+    log_search(user, query, len(results))
+    return results
+
+
+async def search_async_view(request):
+    """نسخة غير متزامنة من صفحة البحث الدلالي"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    query = request.GET.get('q', '')
+    results = []
+    if query:
+        try:
+            results = await _async_search(user, query)
+        except InferenceQueueFull:
+            response = HttpResponse("الخادم مشغول حالياً، الرجاء المحاولة بعد قليل.", status=503)
+            response['Retry-After'] = '1'
+            return response
+
+    return await sync_to_async(render)(request, 'library/search.html', {'results': results, 'query': query})
+
+
+async def search_api(request):
+    """واجهة JSON للبحث الدلالي: /api/search/?q=..."""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': "يجب تسجيل الدخول."}, status=401)
+
+    query = request.GET.get('q', '')
+    results = []
+    if query:
+        try:
+            results = await _async_search(user, query)
+        except InferenceQueueFull:
+            response = JsonResponse({'error': "الخادم مشغول حالياً، الرجاء المحاولة بعد قليل."}, status=503)
+            response['Retry-After'] = '1'
+            return response
+
+    return JsonResponse({'query': query, 'count': len(results), 'results': results})
+
 @login_required
 def book_detail(request, book_id):
     """صفحة تفاصيل الكتاب مع التوصيات المشابهة"""
+    from .ai_engine import get_ai_engine
+    from .coborrow import blend_recommendations
+
     book = get_object_or_404(Book, id=book_id)
     
-    # 1. جلب كتب مشابهة (AI)
-    ai_engine = SmartLibraryAI()
-    similar_titles = ai_engine.get_recommendations(book.id)
-    similar_books = Book.objects.filter(title__in=similar_titles)
+    # 1. جلب كتب مشابهة (AI) من جدول الجيران المحسوب مسبقاً، مدموجة مع "من استعار هذا استعار أيضاً"
+    ai_engine = get_ai_engine()
+    similar_books = blend_recommendations(book.id, ai_engine.get_recommendations(book.id))
     
-    # 2. التحقق من حالة الاستعارة للطالب الحالي
+    # 2. التحقق من حالة الاستعارة للطالب الحالي (طلب معلق أو إعارة جارية)
     active_transaction = Transaction.objects.filter(
         student__user=request.user,
         book=book,
-        is_returned=False
-    ).exclude(status='rejected').first()
+        status__in=['pending', 'active']
+    ).first()
+
+    # 3. موقع الطالب في قائمة الانتظار (إن كان ينتظر) وطول القائمة
+    reservation = None
+    if active_transaction is None:
+        reservation = Reservation.objects.filter(student__user=request.user, book=book, status='waiting').first()
 
     context = {
         'book': book,
         'similar_books': similar_books,
-        'active_transaction': active_transaction
+        'active_transaction': active_transaction,
+        'reservation': reservation,
+        'queue_position': reservation.position() if reservation else None,
+        'queue_length': Reservation.queue(book.id).count(),
     }
     return render(request, 'library/detail.html', context)
 
@@ -160,22 +231,32 @@ def borrow_request(request, book_id):
     book = get_object_or_404(Book, id=book_id)
     student = get_object_or_404(StudentProfile, user=request.user)
 
-    # التحقق من توفر نسخ
-    if book.available_copies < 1:
-        messages.error(request, "عذراً، لا توجد نسخ متاحة حالياً.")
-        return redirect('library:book_detail', book_id=book.id)
-
     # التحقق من عدم وجود طلب مسبق نشط
     existing_loan = Transaction.objects.filter(
         student=student, 
         book=book, 
-        is_returned=False
-    ).exclude(status='rejected').exists()
+        status__in=['pending', 'active']
+    ).exists()
 
     if existing_loan:
         messages.warning(request, "لديك طلب مسبق لهذا الكتاب قيد المعالجة أو لديك الكتاب بالفعل.")
         return redirect('library:book_detail', book_id=book.id)
 
+    # لا توجد نسخ متاحة: إضافة الطالب لقائمة الانتظار، وستخصص له نسخة تلقائياً عند إرجاعها
+    if book.available_copies < 1:
+        try:
+            with transaction.atomic():
+                reservation, created = Reservation.objects.get_or_create(book=book, student=student, status='waiting')
+        except IntegrityError:
+            # نقرتان متزامنتان: الطلب الآخر أضاف الطالب بين البحث والإضافة (القيد الفريد على الحجز المنتظر)
+            reservation = Reservation.objects.get(book=book, student=student, status='waiting')
+            created = False
+        if created:
+            messages.info(request, f"لا توجد نسخ متاحة حالياً، تمت إضافتك لقائمة الانتظار (ترتيبك {reservation.position()}).")
+        else:
+            messages.info(request, f"أنت بالفعل في قائمة الانتظار (ترتيبك {reservation.position()}).")
+        return redirect('library:book_detail', book_id=book.id)
+
     # إنشاء الطلب
     Transaction.objects.create(
         student=student,
@@ -196,11 +277,12 @@ def profile_view(request):
         messages.error(request, "ملف الطالب غير موجود.")
         return redirect('library:home')
 
-    transactions = Transaction.objects.filter(student=student).order_by('-request_date')
+    # نجلب الكتاب مع كل عملية في نفس الاستعلام لأن القالب يعرض عنوانه ومؤلفه لكل سطر
+    transactions = Transaction.objects.filter(student=student).select_related('book').order_by('-request_date')
     
     return render(request, 'library/profile.html', {
         'student': student,
-        'transactions': transactions
+        'borrowing_history': transactions
     })
 
 # ==========================================
@@ -216,38 +298,40 @@ def analytics_dashboard(request):
     """
     
     # 1. قائمة الطلبات المعلقة
-    pending_requests = Transaction.objects.filter(status='pending').order_by('request_date')
+    # (نجلب الكتاب والطالب ومستخدمه مع كل سطر لأن عرض العملية يستخدمها جميعاً)
+    pending_requests = Transaction.objects.filter(status='pending') \
+        .select_related('book', 'student__user').order_by('request_date')
 
     # 2. الكتب المعارة حالياً
-    active_loans = Transaction.objects.filter(status='active').order_by('due_date')
+    active_loans = Transaction.objects.filter(status='active').with_overdue() \
+        .select_related('book', 'student__user').order_by('due_date')
+
+    # عدد الإعارات المتأخرة ومجموع غراماتها (تجميع في SQL على الفهرس status, due_date)
+    overdue_summary = Transaction.objects.overdue().aggregate(count=Count('id'), fines=Sum('fine_amount'))
+
+    # القوائم التالية تقرأ من جداول التجميع (Rollups) بدلاً من مسح جدولي العمليات والبحث كاملين؛
+    # نضيف إليها أولاً الصفوف الجديدة منذ آخر تحديث فقط
+    try:
+        rollups.refresh_rollups()
+    except Exception as e:
+        print(f"Analytics Rollup Error: {e}")
 
     # 3. الأكثر استعارة (Top 5)
-    most_borrowed = Transaction.objects.values('book__title') \
-        .annotate(total_borrows=Count('id')) \
-        .order_by('-total_borrows')[:5]
-
-    # 4. متوسط مدة الاستعارة (تم تصحيح الخطأ هنا) ✅
-    # نستخدم status='returned' بدلاً من is_returned=True لأنها غير مدعومة في الفلتر المباشر
-    avg_duration_data = Transaction.objects.filter(status='returned') \
-        .annotate(duration=ExpressionWrapper(
-            F('return_date') - F('borrow_date'), 
-            output_field=DurationField()
-        )) \
-        .values('book__title') \
-        .annotate(avg_days=Avg('duration')) \
-        .order_by('-avg_days')[:5]
+    most_borrowed = rollups.most_borrowed(5)
+
+    # 4. متوسط مدة الاستعارة (أطول 5 كتب)
+    avg_duration = rollups.longest_average_loans(5)
 
     # 5. تحليل الفجوة (Gap Analysis)
-    gap_analysis = SearchLog.objects.filter(result_count=0) \
-        .values('query_text') \
-        .annotate(attempts=Count('id')) \
-        .order_by('-attempts')[:5]
+    gap_analysis = rollups.search_gaps(5)
 
     context = {
         'pending_requests': pending_requests,
         'active_loans': active_loans,
+        'overdue_count': overdue_summary['count'],
+        'overdue_fines': overdue_summary['fines'] or 0,
         'most_borrowed': most_borrowed,
-        'avg_duration_data': avg_duration_data,
+        'avg_duration': avg_duration,
         'gap_analysis': gap_analysis,
     }
     
@@ -262,12 +346,12 @@ def manage_transaction(request, transaction_id, action):
     trans = get_object_or_404(Transaction, id=transaction_id)
     
     if action == 'approve':
-        if trans.book.available_copies > 0:
-            trans.status = 'active'
+        trans.status = 'active'
+        try:
             # يقوم مودل Transaction بتحديث التواريخ وخصم النسخة تلقائياً عند الحفظ
             trans.save()
             messages.success(request, f"تمت الموافقة على طلب الطالب {trans.student.user.get_full_name()}.")
-        else:
+        except NoCopiesAvailable:
             messages.error(request, "لا توجد نسخ كافية للموافقة على هذا الطلب.")
             
     elif action == 'reject':
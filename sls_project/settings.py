@@ -86,4 +86,89 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # إعدادات الوسائط (لصور أغلفة الكتب مثلاً)
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# ==========================================
+# إعدادات محرك الذكاء الاصطناعي (AI Engine)
+# ==========================================
+# المشفر المستخدم: 'sentence-transformers' (النموذج الكامل)، أو 'sentence-transformers-int8' (نفس النموذج
+# بتكميم ديناميكي int8، أسرع على المعالج)، أو 'hashing' (مشفر خفيف للاختبارات).
+# قارن الزمن والانحراف عن النموذج المرجعي بالأمر benchmark_encoders، وبعد تغيير المشفر أو طول النص
+# أعد تشفير الكتب بالأمر build_embeddings --rebuild حتى تتوافق متجهات الكتب مع متجهات الاستعلامات
+AI_ENCODER_BACKEND = os.environ.get('SLS_AI_ENCODER_BACKEND', 'sentence-transformers')
+
+# أقصى عدد رموز (Tokens) لكل نص، تقص بعده الأوصاف الطويلة (None = حد النموذج نفسه، 128 لـ MiniLM)
+AI_ENCODER_MAX_SEQ_LENGTH = None
+
+# عدد خيوط torch لكل عملية (None = كل الأنوية)؛ مع عدة عمال يفضل: عدد الأنوية / عدد العمال
+AI_ENCODER_THREADS = None
+
+# تحميل النموذج مسبقاً عند بدء الخادم بدلاً من أول طلب (من wsgi.py / asgi.py فقط، لا من أوامر manage.py)
+AI_ENGINE_WARMUP = True
+
+# تحميل متزامن عند استيراد wsgi.py: عند التشغيل بـ gunicorn --preload يُحمّل النموذج
+# في العملية الأم قبل التفرع فتتشارك العمليات الفرعية نفس صفحات الذاكرة
+AI_ENGINE_PRELOAD = os.environ.get('SLS_AI_ENGINE_PRELOAD') == '1'
+
+# فهرس المتجهات: 'exact' (بحث دقيق) أو 'ivf' (بحث تقريبي سريع للفهارس الكبيرة)
+AI_VECTOR_INDEX_BACKEND = 'exact'
+
+# خيارات الفهرس التقريبي، مثال: {'nlist': 256, 'nprobe': 16}. يعاد تدريب المراكز فقط بعد تغيّر نسبة
+# retrain_drift (افتراضياً 0.2) من الكتب منذ آخر تدريب، وقبلها توزع الكتب المعدلة على المراكز الحالية
+AI_VECTOR_INDEX_OPTIONS = {}
+
+# الحد الأقصى لعدد نتائج البحث الدلالي
+AI_SEARCH_TOP_K = 50
+
+# عدد الكتب المتشابهة المحسوبة مسبقاً لكل كتاب (جدول BookNeighbor)
+AI_NEIGHBOR_COUNT = 10
+
+# الذاكرة المؤقتة لمتجهات ونتائج الاستعلامات المتكررة (LRU + TTL بالثواني)
+AI_QUERY_CACHE_SIZE = 2048
+AI_QUERY_CACHE_TTL = 3600
+# اسم ذاكرة Django المؤقتة المشتركة بين العمليات (مثلاً 'default' مع Redis/Memcached)، None = محلية فقط
+AI_QUERY_CACHE_ALIAS = None
+
+# تجميع استعلامات البحث المتزامنة في دفعة تشفير واحدة (مفيد مع الخوادم متعددة الخيوط أو ASGI)
+AI_QUERY_BATCHING = False
+AI_QUERY_BATCH_SIZE = 32
+AI_QUERY_BATCH_WAIT_MS = 5
+
+# المنفذ المحدود للبحث غير المتزامن: عدد عمليات الاستدلال المتزامنة وحجم طابور الانتظار
+# (الطلبات الزائدة ترفض برمز 503)
+AI_INFERENCE_WORKERS = 4
+AI_INFERENCE_QUEUE_SIZE = 32
+
+# سجل البحث المؤقت: حجم الدفعة، أقصى مدة قبل الكتابة (بالثواني)، وأقصى عدد أحداث منتظرة
+SEARCH_LOG_BATCH_SIZE = 200
+SEARCH_LOG_FLUSH_INTERVAL = 2.0
+SEARCH_LOG_CAPACITY = 10000
+
+# جداول الإحصاءات المجمعة: مهلة (بالثواني) قبل تجميع الصفوف الحديثة (الطلبات والإرجاعات وعمليات البحث) حتى تثبت معاملاتها
+ANALYTICS_ROLLUP_LAG = 60
+
+# عدد مرات إعادة محاولة تحديث بصمة اهتمامات الطالب إذا كانت قاعدة البيانات مشغولة (OperationalError)
+INTEREST_UPDATE_RETRIES = 5
+
+# غرامات التأخير: قيمة الغرامة عن كل يوم تأخير والحد الأقصى للغرامة على الإعارة الواحدة
+LIBRARY_FINE_PER_DAY = '1.00'
+LIBRARY_FINE_CAP = '30.00'
+
+# مصفوفة الاستعارة المشتركة (من استعار هذا استعار أيضاً): مكان الملف، عدد الطلاب في كل دفعة عند البناء،
+# وأقل عدد من الطلاب المشتركين حتى يعتبر الكتابان مرتبطين
+COBORROW_MODEL_PATH = os.path.join(BASE_DIR, 'data', 'coborrow.npz')
+COBORROW_BATCH_SIZE = 2000
+COBORROW_MIN_COUNT = 2
+
+# ضغط متجهات البحث في ذاكرة كل عامل: None (float32) أو 'float16' (نصف الذاكرة) أو 'int8' (الربع، وهو الأسرع أيضاً؛
+# تحويل float16 في NumPy بطيء). قارن الدقة والذاكرة بالأمر benchmark_index.
+# عند التفعيل يستخدم بحث شامل على المتجهات المضغوطة (بدلاً من AI_VECTOR_INDEX_BACKEND)، ثم يعاد ترتيب
+# أفضل k * AI_VECTOR_RERANK مرشح بالمتجهات الدقيقة المخزنة في قاعدة البيانات
+AI_VECTOR_QUANTIZATION = None
+AI_VECTOR_RERANK = 4
+
+# الفهرس المشترك بين العمال: مجلد الإصدارات التي يكتبها الأمر publish_index وتربطها كل العمليات بالذاكرة
+# (mmap) للقراءة فقط، مثل os.path.join(BASE_DIR, 'data', 'vector_index'). None = فهرس خاص بكل عامل.
+# وعدد الإصدارات القديمة المحتفظ بها بعد كل نشر
+AI_SHARED_INDEX_DIR = None
+AI_SHARED_INDEX_KEEP = 3
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sls_project.settings')
 
 application = get_wsgi_application()
+
+# تسخين محرك الذكاء الاصطناعي في عمليات الخادم فقط (انظر AI_ENGINE_WARMUP)
+from library.ai_engine import start_warm_up  # noqa: E402
+
+start_warm_up()